@@ -0,0 +1,246 @@
+"""Micro-benchmarks for the hot paths involved in polling a plant: framing, decoding and model building.
+
+The benchmarks run against response frames recorded in a wire trace (see `givenergy_modbus.trace`) while
+refreshing a plant. `refresh.trace` next to this script holds a full refresh of an inverter with three batteries,
+recorded from the simulator serving the register dumps alongside it:
+
+    python -m givenergy_modbus.simulator --inverter benchmarks/inverter.json \
+        --battery benchmarks/battery.json --battery benchmarks/battery.json --battery benchmarks/battery.json
+    python -m givenergy_modbus.cli --host 127.0.0.1 --trace benchmarks/refresh.trace dump-registers -b 3
+
+Traces recorded from a real inverter the same way can be passed in instead.
+
+Each benchmark is timed with `timeit` and reported as the best time per call over several runs, and compared
+against the baseline stored in `baseline.json` to catch performance regressions, failing if any got more than
+`--threshold` times slower:
+
+    python benchmarks/benchmark.py
+
+Timings are only comparable on the same machine and with the same trace: refresh the baseline with `--save` when
+either changes, e.g. `python benchmarks/benchmark.py --save benchmarks/baseline.json`.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import sys
+import timeit
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Iterable
+
+import click
+
+from givenergy_modbus.decoder import GivEnergyResponseDecoder
+from givenergy_modbus.framer import GivEnergyModbusFramer
+from givenergy_modbus.model.battery import Battery
+from givenergy_modbus.model.inverter import Inverter  # type: ignore
+from givenergy_modbus.model.register import HoldingRegister, InputRegister  # type: ignore
+from givenergy_modbus.model.register_cache import RegisterBank, RegisterCache
+from givenergy_modbus.pdu import ModbusPDU
+from givenergy_modbus.trace import RECEIVED, read_trace
+from givenergy_modbus.util import InterceptHandler
+
+_logger = logging.getLogger('givenergy_modbus')  # run as a script, so there is no __package__
+
+DEFAULT_TRACE = Path(__file__).with_name('refresh.trace')
+DEFAULT_BASELINE = Path(__file__).with_name('baseline.json')
+DEFAULT_THRESHOLD = 1.5  # how much slower than the baseline a benchmark may get before it counts as a regression
+
+# Pages read from the inverter and from each battery during a full refresh, as in `GivEnergyClient.refresh_plant`.
+_INVERTER_PAGES = (
+    (InputRegister, 0),
+    (InputRegister, 180),
+    (HoldingRegister, 0),
+    (HoldingRegister, 60),
+    (HoldingRegister, 120),
+)
+_BATTERY_PAGES = ((InputRegister, 60),)
+
+
+def recorded_frames(path: str) -> list[bytes]:
+    """Frames received from the inverter, as recorded in a wire trace file."""
+    return [record.data for record in read_trace(path) if record.direction == RECEIVED]
+
+
+def _decode_frames(frames: Iterable[bytes]) -> list[ModbusPDU]:
+    pdus: list[ModbusPDU] = []
+    framer = GivEnergyModbusFramer(GivEnergyResponseDecoder())
+    for frame in frames:
+        framer.processIncomingPacket(frame, pdus.append)
+    return [pdu for pdu in pdus if pdu is not None]
+
+
+def _decoder_payloads(frames: Iterable[bytes]) -> list[bytes]:
+    """The payloads handed to the decoder by the framer, i.e. without the MBAP header."""
+    payloads: list[bytes] = []
+    decoder = GivEnergyResponseDecoder()
+    original_decode = decoder.decode
+
+    def capture(data):
+        payloads.append(bytes(data))
+        return original_decode(data)
+
+    decoder.decode = capture  # type: ignore
+    framer = GivEnergyModbusFramer(decoder)
+    for frame in frames:
+        framer.processIncomingPacket(frame, lambda _: None)
+    return payloads
+
+
+def build_benchmarks(frames: list[bytes]) -> dict[str, Callable[[], object]]:
+    """Set up the benchmarks to run against the given response frames, as name -> function to time."""
+    pdus = _decode_frames(frames)
+    if not pdus:
+        raise ValueError('No decodable frames to benchmark with')
+    # the most recently recorded values of each page from each device, in the order they were first read
+    pages: dict[tuple, ModbusPDU] = {}
+    for pdu in pdus:
+        if hasattr(pdu, 'register_values'):
+            pages[pdu.function_code, pdu.slave_address, pdu.base_register] = pdu
+    register_pages = [
+        (HoldingRegister if pdu.function_code == 3 else InputRegister, pdu.to_dict()) for pdu in pages.values()
+    ]
+    payloads = _decoder_payloads(frames)
+    stream = b''.join(frames)
+    fragments = [stream[i : i + 64] for i in range(0, len(stream), 64)]
+    decoder = GivEnergyResponseDecoder()
+    inverter_pages = [(t, page) for t, page in register_pages if (t, next(iter(page))) in _INVERTER_PAGES]
+    battery_pages = [(t, page) for t, page in register_pages if (t, next(iter(page))) in _BATTERY_PAGES][:1]
+
+    def framer_multi_frame():
+        GivEnergyModbusFramer(decoder).processIncomingPacket(stream, lambda _: None)
+
+    def framer_fragmented():
+        framer = GivEnergyModbusFramer(decoder)
+        for fragment in fragments:
+            framer.processIncomingPacket(fragment, lambda _: None)
+
+    def decoder_decode():
+        for payload in payloads:
+            decoder.decode(payload)
+
+    def populated(cache_type, pages):
+        cache = cache_type()
+        for register_type, page in pages:
+            cache.set_registers(register_type, page)
+        return cache
+
+    inverter_rc = populated(RegisterCache, inverter_pages)
+    battery_rc = populated(RegisterCache, battery_pages)
+    inverter_bank = populated(RegisterBank, inverter_pages)
+    attributes = ['p_pv1', 'v_battery', 'battery_percent', 'p_grid_out', 'p_load_demand', 'charge_slot_1_start']
+    inverter_json = inverter_rc.to_json()
+
+    benchmarks: dict[str, Callable[[], object]] = {
+        'framer.multi_frame': framer_multi_frame,
+        'framer.fragmented': framer_fragmented,
+        'decoder.decode': decoder_decode,
+        'register_cache.set_registers': lambda: populated(RegisterCache, register_pages),
+        'register_bank.set_registers': lambda: populated(RegisterBank, register_pages),
+        'register_cache.getattr': lambda: [getattr(inverter_rc, a) for a in attributes],
+        'register_bank.getattr': lambda: [getattr(inverter_bank, a) for a in attributes],
+        'inverter.from_orm': lambda: Inverter.from_orm(inverter_rc),
+        'battery.from_orm': lambda: Battery.from_orm(battery_rc),
+        'register_cache.to_json': inverter_rc.to_json,
+        'register_cache.from_json': lambda: RegisterCache.from_json(inverter_json),
+    }
+    recorded_values: dict = defaultdict(list)
+    for register_type, page in register_pages:
+        for index, value in page.items():
+            register = register_type._value2member_map_.get(index)
+            if register is not None:
+                recorded_values[register.type].append(value)
+    for type_, values in recorded_values.items():
+        # a page's worth of conversions per call, so that timer overhead doesn't swamp the result
+        values = (values * (60 // len(values) + 1))[:60]
+        benchmarks[f'type.convert.{type_.name}'] = lambda type_=type_, values=values: [
+            type_.convert(v, 10) for v in values
+        ]
+    return benchmarks
+
+
+def run_benchmarks(
+    benchmarks: dict[str, Callable[[], object]], repeat: int = 5, min_time: float = 0.1
+) -> dict[str, float]:
+    """Time each benchmark, returning the best seconds per call over `repeat` runs of at least `min_time`s each."""
+    results = {}
+    for name, function in benchmarks.items():
+        timer = timeit.Timer(function)
+        number, elapsed = timer.autorange()
+        number = max(1, int(number * min_time / elapsed)) if elapsed < min_time else number
+        results[name] = min(timer.repeat(repeat=repeat, number=number)) / number
+    return results
+
+
+def compare(results: dict[str, float], baseline: dict[str, float], threshold: float) -> list[str]:
+    """Names of the benchmarks that got more than `threshold` times slower than their baseline."""
+    return [name for name, t in results.items() if name in baseline and t > baseline[name] * threshold]
+
+
+def _format_time(seconds: float) -> str:
+    if seconds >= 1e-3:
+        return f'{seconds * 1e3:8.2f} ms'
+    return f'{seconds * 1e6:8.2f} µs'
+
+
+@click.command()
+@click.argument('trace', type=click.Path(exists=True, dir_okay=False), default=str(DEFAULT_TRACE))
+@click.option('-k', '--select', type=str, default=None, help='Only run benchmarks whose name contains this.')
+@click.option('--repeat', type=int, default=5, show_default=True, help='Timing runs per benchmark.')
+@click.option('--save', type=click.Path(dir_okay=False, writable=True), help='Save the results as a baseline.')
+@click.option(
+    '--compare',
+    'compare_to',
+    type=click.Path(dir_okay=False),
+    default=str(DEFAULT_BASELINE),
+    show_default=True,
+    help='Baseline to compare the results against.',
+)
+@click.option('--no-compare', is_flag=True, help='Only report timings, without comparing them to any baseline.')
+@click.option(
+    '--threshold',
+    type=float,
+    default=DEFAULT_THRESHOLD,
+    show_default=True,
+    help='Slowdown relative to the baseline that counts as a regression.',
+)
+@click.option(
+    '--log-level',
+    default='ERROR',
+    type=click.Choice(['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG', 'NOTSET'], case_sensitive=False),
+)
+def main(trace, select, repeat, save, compare_to, no_compare, threshold, log_level):
+    """Run the benchmarks against the frames recorded in TRACE, and fail if any regressed compared to the baseline."""
+    logging.basicConfig(handlers=[InterceptHandler()], level=getattr(logging, log_level))
+    _logger.setLevel(getattr(logging, log_level))  # pymodbus may already have configured the root logger
+    benchmarks = build_benchmarks(recorded_frames(trace))
+    if select:
+        benchmarks = {k: v for k, v in benchmarks.items() if select in k}
+    results = run_benchmarks(benchmarks, repeat=repeat)
+
+    baseline = {}
+    if not no_compare:
+        if Path(compare_to).exists():
+            baseline = json.loads(Path(compare_to).read_text())
+        elif not save:
+            raise click.BadParameter(f'No baseline at {compare_to}, record one with --save', param_hint='--compare')
+    regressions = compare(results, baseline, threshold)
+    for name, seconds in results.items():
+        line = f'{name:32} {_format_time(seconds)}'
+        if name in baseline:
+            line += f'  {seconds / baseline[name]:6.2f}x baseline'
+        if name in regressions:
+            line += '  REGRESSION'
+        click.echo(line)
+
+    if save:
+        Path(save).write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+        click.echo(f'Saved results to {save}')
+    if regressions:
+        click.echo(f'{len(regressions)} benchmarks regressed by more than {threshold}x: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()  # pragma: no cover
@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time as t
+from typing import Iterable, Mapping, Sequence
+
+from givenergy_modbus import protocol
+from givenergy_modbus.client import (
+    MAX_BATTERIES,
+    PROBE_TIMEOUT,
+    AdaptivePacer,
+    CircuitBreaker,
+    GivEnergyClientCore,
+    RetryPolicy,
+)
+from givenergy_modbus.decoder import GivEnergyResponseDecoder
+from givenergy_modbus.framer import GivEnergyModbusFramer
+from givenergy_modbus.metrics import ERROR, ERROR_RESPONSE, OK, TIMEOUT, ClientMetrics, metrics as default_metrics
+from givenergy_modbus.model.plant import Plant
+from givenergy_modbus.model.register import HoldingRegister, InputRegister  # type: ignore
+from givenergy_modbus.model.register_cache import RegisterCache
+from givenergy_modbus.pdu import ModbusPDU
+from givenergy_modbus.topology import TopologyCache
+from givenergy_modbus.trace import RECEIVED, SENT, trace_frame
+from givenergy_modbus.transaction import DEFAULT_MAX_IN_FLIGHT
+
+_logger = logging.getLogger(__package__)
+
+
+class AsyncGivEnergyClient(GivEnergyClientCore):
+    """Asyncio client for end users to conveniently access GivEnergy inverters.
+
+    This mirrors `GivEnergyClient`, but talks to the data adapter over non-blocking `asyncio` streams so that a
+    single event loop can poll several inverters (and anything else) concurrently. Everything but the socket
+    handling is shared with `GivEnergyClient` (see `GivEnergyClientCore` and `givenergy_modbus.protocol`), so all
+    its methods work the same, just as coroutines.
+
+    Since every GivEnergy message carries the same transaction id there is no way to pair up interleaved
+    responses by it, so transactions on a single client are serialised. `pipeline` instead pairs responses with
+    their requests by function code, slave address and register addresses to keep several requests in flight.
+
+    Transaction latencies and outcomes are recorded in `metrics`, as with `GivEnergyModbusTcpClient`.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 8899,
+        timeout: float = 2.0,
+        pacer: AdaptivePacer = None,
+        retry_policy: RetryPolicy = None,
+        circuit_breaker: CircuitBreaker = None,
+        plant: Plant = None,
+        max_cache_age: float = 60.0,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        battery_refresh_interval: int = 1,
+        metrics: ClientMetrics = None,
+    ):
+        super().__init__(
+            pacer=pacer,
+            retry_policy=retry_policy,
+            circuit_breaker=circuit_breaker,
+            plant=plant,
+            max_cache_age=max_cache_age,
+            max_in_flight=max_in_flight,
+            battery_refresh_interval=battery_refresh_interval,
+        )
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.metrics = metrics if metrics is not None else default_metrics
+        self._connects = 0
+        self.framer = GivEnergyModbusFramer(GivEnergyResponseDecoder(), metrics=self.metrics)
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._lock = asyncio.Lock()
+
+    def __repr__(self):
+        return f"AsyncGivEnergyClient({self.host}:{self.port}): timeout={self.timeout})"
+
+    async def __aenter__(self) -> AsyncGivEnergyClient:
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+    @property
+    def connected(self) -> bool:
+        """Whether there is an open connection to the data adapter."""
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self) -> None:
+        """Open a connection to the data adapter if there isn't one already."""
+        if self.connected:
+            return
+        _logger.debug(f'Connecting to {self.host}:{self.port}')
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), timeout=self.timeout
+        )
+        if self._connects:
+            self.metrics.increment('reconnects')
+        self._connects += 1
+        self.metrics.increment('connects')
+
+    async def close(self) -> None:
+        """Close the connection to the data adapter."""
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError as e:
+                _logger.debug(f'Error while closing connection: {e}')
+        self.framer.resetFrame()
+
+    async def execute(self, request: ModbusPDU) -> ModbusPDU | None:
+        """Send the given PDU to the remote device and return any PDU returned in response."""
+        async with self._lock:
+            start = t.monotonic()
+            try:
+                response = await self._transact(request)
+            except asyncio.TimeoutError as e:
+                _logger.error(f'Transaction failed: {e!r}')
+                self.metrics.record(request, TIMEOUT)
+                await self.close()
+                return None
+            except OSError as e:
+                _logger.error(f'Transaction failed: {e!r}')
+                self.metrics.record(request, ERROR)
+                await self.close()
+                return None
+            outcome = ERROR_RESPONSE if getattr(response, 'error', False) else OK
+            self.metrics.record(request, outcome, t.monotonic() - start)
+            return response
+
+    async def _transact(self, request: ModbusPDU) -> ModbusPDU | None:
+        """Connects and sends the request, and reads back the response."""
+        await self.connect()
+        self.framer.resetFrame()
+        if _logger.isEnabledFor(logging.INFO):
+            _logger.info(f'Sending request {request}')
+        tx_data = self.framer.buildPacket(request)
+        trace_frame(SENT, tx_data)
+        self._writer.write(tx_data)
+        await self._writer.drain()
+
+        responses: list[ModbusPDU] = []
+
+        def on_response(response: ModbusPDU | None):
+            if response is not None:
+                responses.append(response)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        while not responses:
+            data = await asyncio.wait_for(self._reader.read(1024), timeout=max(deadline - loop.time(), 0))
+            if not data:
+                raise ConnectionResetError('Connection closed by remote end')
+            trace_frame(RECEIVED, data)
+            self.framer.processIncomingPacket(data, on_response)
+        return responses[0]
+
+    async def pipeline(
+        self, requests: Sequence[ModbusPDU], max_in_flight: int = None, timeout: float = None, probe: bool = False
+    ) -> list:
+        """Send requests back to back, keeping at most `max_in_flight` outstanding. See `GivEnergyModbusTcpClient`."""
+        if max_in_flight is None:
+            max_in_flight = self.max_in_flight
+        state = protocol.PipelineState(requests, max_in_flight, self.metrics)
+        if not requests:
+            return state.responses
+        async with self._lock:
+            try:
+                await self._pipeline(state, timeout if timeout is not None else self.timeout)
+            except asyncio.TimeoutError:
+                log = _logger.debug if probe else _logger.warning
+                log(f'Timed out waiting for responses, only got {state.received}/{len(requests)}')
+                state.fail(TIMEOUT)
+                # late responses would otherwise be matched up with the next transaction's requests
+                await self.close()
+            except OSError as e:
+                _logger.error(f'Pipelined requests failed: {e!r}')
+                state.fail(ERROR)
+                await self.close()
+        return state.responses
+
+    async def _pipeline(self, state: protocol.PipelineState, timeout: float) -> None:
+        await self.connect()
+        self.framer.resetFrame()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not state.done:
+            batch = state.next_batch()
+            if batch:
+                tx_data = b''.join(self.framer.buildPacket(state.requests[index]) for index in batch)
+                trace_frame(SENT, tx_data)
+                self._writer.write(tx_data)
+                state.sent(batch)
+                await self._writer.drain()
+            data = await asyncio.wait_for(self._reader.read(1024), timeout=max(deadline - loop.time(), 0))
+            if not data:
+                raise ConnectionResetError('Connection closed by remote end')
+            trace_frame(RECEIVED, data)
+            if state.feed(self.framer, data):
+                # progress is being made, so give the next responses a full timeout period
+                deadline = loop.time() + timeout
+
+    async def _run(self, steps: protocol.Steps):
+        return await protocol.run_async(steps, self.perform)
+
+    async def perform(self, operation):
+        """Carry out a single `givenergy_modbus.protocol` operation and return its result."""
+        if isinstance(operation, protocol.Execute):
+            return await self.execute(operation.request)
+        if isinstance(operation, protocol.Pipeline):
+            return await self.pipeline(**operation._asdict())
+        if isinstance(operation, protocol.Sleep):
+            return await asyncio.sleep(operation.seconds)
+        raise ValueError(f'Unknown operation {operation!r}')
+
+    async def read_registers(
+        self, kind: type[HoldingRegister | InputRegister], base_address: int, register_count: int, **kwargs
+    ) -> dict[int, int]:
+        """Read out registers from the correct location depending on type specified."""
+        return await self._run(protocol.read_registers(kind, base_address, register_count, self.metrics, **kwargs))
+
+    async def read_registers_pipelined(
+        self,
+        requests: Sequence[tuple[type[HoldingRegister | InputRegister], int, int, int]],
+        max_in_flight: int = None,
+        timeout: float = None,
+        probe: bool = False,
+    ) -> list[dict[int, int]]:
+        """Read several ranges of registers with pipelined requests. See `GivEnergyModbusTcpClient`."""
+        return await self._run(protocol.read_registers_pipelined(requests, max_in_flight, timeout, probe))
+
+    async def write_holding_register(self, register: HoldingRegister, value: int) -> None:
+        """Write a value to a single holding register."""
+        await self._run(protocol.write_holding_register(register, value))
+
+    async def write_holding_registers(self, values: Mapping[HoldingRegister, int]) -> None:
+        """Write values to several holding registers, in the given order.
+
+        See `GivEnergyModbusTcpClient.write_holding_registers`: requests are sent back to back over one connection,
+        read-backs are checked together, and writes that don't get a read-back are retried on their own. Writes that
+        would not change anything are elided if a `plant` is attached, as with `GivEnergyClient`.
+        """
+        await self._run(self._write_holding_registers(values))
+
+    async def fetch_register_pages(
+        self,
+        pages: Mapping[type[HoldingRegister | InputRegister], Sequence[int]],
+        register_cache: RegisterCache,
+        slave_address: int = 0x32,
+        sleep_between_queries: float = None,
+    ) -> None:
+        """Reload all inverter data from the device. See `GivEnergyClient.fetch_register_pages`."""
+        await self._run(self._fetch_register_pages(pages, register_cache, slave_address, sleep_between_queries))
+
+    async def refresh_plant(self, plant: Plant, full_refresh: bool, sleep_between_queries: float = None):
+        """Refresh the internal caches for a plant. Optionally refresh only data that changes frequently."""
+        await self._run(self._refresh_plant(plant, full_refresh, sleep_between_queries))
+
+    async def refresh_plant_attributes(
+        self, plant: Plant, attributes: Iterable[str], sleep_between_queries: float = None
+    ):
+        """Refresh only the register pages needed for the given model attributes. See `GivEnergyClient`."""
+        await self._run(self._refresh_plant_attributes(plant, attributes, sleep_between_queries))
+
+    async def discover_batteries(
+        self,
+        max_batteries: int = MAX_BATTERIES,
+        topology_cache: TopologyCache = None,
+        refresh: bool = False,
+        probe_timeout: float = PROBE_TIMEOUT,
+    ) -> int:
+        """Work out how many batteries are attached to the inverter. See `GivEnergyClient.discover_batteries`."""
+        return await self._run(self._discover_batteries(max_batteries, topology_cache, refresh, probe_timeout))
+
+    async def fetch_battery_pages(
+        self,
+        plant: Plant,
+        pages: Mapping[type[HoldingRegister | InputRegister], Sequence[int]],
+        sleep_between_queries: float = None,
+    ) -> None:
+        """Read the given register pages from all the plant's batteries, with pipelined requests."""
+        await self._run(self._fetch_plant_pages(plant, {}, pages, sleep_between_queries))
+
+    async def fetch_plant_pages(
+        self,
+        plant: Plant,
+        inverter_pages: Mapping[type[HoldingRegister | InputRegister], Sequence[int]],
+        battery_pages: Mapping[type[HoldingRegister | InputRegister], Sequence[int]],
+        sleep_between_queries: float = None,
+    ) -> None:
+        """Read the given register pages from the plant's inverter and all its batteries, with pipelined requests.
+
+        See `GivEnergyClient.fetch_plant_pages`.
+        """
+        await self._run(self._fetch_plant_pages(plant, inverter_pages, battery_pages, sleep_between_queries))
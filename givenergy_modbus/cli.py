@@ -8,6 +8,7 @@ from givenergy_modbus.client import GivEnergyClient
 from givenergy_modbus.model.battery import Battery
 from givenergy_modbus.model.inverter import Inverter  # type: ignore
 from givenergy_modbus.model.plant import Plant
+from givenergy_modbus.trace import start_trace
 from givenergy_modbus.util import InterceptHandler
 
 _logger = logging.getLogger(__package__)
@@ -30,21 +31,31 @@ def is_documented_by(original):
     default='INFO',
     type=click.Choice(['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG', 'NOTSET'], case_sensitive=False),
 )
+@click.option(
+    '--trace',
+    type=click.Path(dir_okay=False, writable=True),
+    envvar='GIVENERGY_MODBUS_TRACE',
+    help='Capture all raw frames exchanged with the inverter to this file, in compact binary form.',
+)
 @click.pass_context
-def main(ctx, host, log_level):
+def main(ctx, host, log_level, trace):
     """A python library to access GivEnergy inverters via Modbus TCP, with no dependency on the GivEnergy Cloud."""
     ctx.ensure_object(dict)
 
     # Install our improved logging handler.
     logging.basicConfig(handlers=[InterceptHandler()], level=getattr(logging, log_level))
+    if trace:
+        start_trace(trace)
     ctx.obj['CLIENT'] = GivEnergyClient(host=host)
 
 
 @main.command()
 @click.pass_context
-@click.option('-b', '--batteries', type=int, default=1)
+@click.option('-b', '--batteries', type=int, default=None, help='Number of batteries, discovered if not specified.')
 def dump_registers(ctx, batteries):
     """Dump out raw register data for use in debugging."""
+    if batteries is None:
+        batteries = ctx.obj['CLIENT'].discover_batteries()
     plant = Plant(number_batteries=batteries)
     ctx.obj['CLIENT'].refresh_plant(plant=plant, full_refresh=True)
     inverter_json = plant.inverter_rc.to_json()
@@ -1,57 +1,385 @@
 from __future__ import annotations
 
 import logging
+import random
 import time as t
 from datetime import datetime, time
-from typing import Mapping, Sequence
+from enum import Enum
+from typing import Iterable, Mapping, Sequence
 
 from pymodbus.client import ModbusTcpClient
 
-from givenergy_modbus.modbus import GivEnergyModbusTcpClient
+from givenergy_modbus.metrics import ClientMetrics
+from givenergy_modbus.modbus import DEFAULT_MAX_IN_FLIGHT, GivEnergyModbusTcpClient
+from givenergy_modbus.model.battery import Battery
+from givenergy_modbus.model.inverter import Inverter  # type: ignore
 from givenergy_modbus.model.plant import Plant
-from givenergy_modbus.model.register import HoldingRegister, InputRegister  # type: ignore
-from givenergy_modbus.model.register_cache import RegisterCache
+from givenergy_modbus.model.register import HoldingRegister, InputRegister, Register  # type: ignore
+from givenergy_modbus.model.register_cache import RegisterCache, registers_for_attribute
+from givenergy_modbus.protocol import (
+    Sleep,
+    Steps,
+    check_writes,
+    read_registers,
+    read_registers_pipelined,
+    run,
+    write_holding_registers,
+)
+from givenergy_modbus.topology import TopologyCache
 
 _logger = logging.getLogger(__package__)
 
 DEFAULT_SLEEP = 0.5
+MAX_BATTERIES = 6  # how many battery slave addresses to probe when discovering a plant's topology
+PROBE_TIMEOUT = 0.5  # how long to wait on a battery slave address that may have no battery behind it
 
 
-class GivEnergyClient:
-    """Client for end users to conveniently access GivEnergy inverters."""
+class DeviceTimings:
+    """Observed response behaviour of a single device, as tracked by `AdaptivePacer`."""
 
-    def __init__(self, host: str, port: int = 8899, modbus_client: ModbusTcpClient = None):
-        self.host = host
-        self.port = port
-        if modbus_client is None:
-            modbus_client = GivEnergyModbusTcpClient(host=self.host, port=self.port)
-        self.modbus_client = modbus_client
+    def __init__(self, gap: float):
+        self.gap = gap  # current delay to leave before the next request, in seconds
+        self.requests = 0
+        self.errors = 0
+        self.last_latency: float | None = None
+        self.mean_latency: float | None = None  # exponentially weighted moving average, in seconds
+        self.error_rate = 0.0  # exponentially weighted moving average, 0-1
 
     def __repr__(self):
-        return f"GivEnergyClient({self.host}:{self.port}))"
+        return (
+            f"DeviceTimings(gap={self.gap:.3f}, requests={self.requests}, errors={self.errors}, "
+            f"mean_latency={self.mean_latency}, error_rate={self.error_rate:.2f})"
+        )
 
-    def fetch_register_pages(
+
+class AdaptivePacer:
+    """Works out how long to wait between requests to a device from how it has been responding.
+
+    The gap is managed AIMD-style: every successful request shrinks it by a fixed `decrease_step`, while every
+    failure multiplies it by `increase_factor`, so a responsive device gets polled quickly and a struggling one is
+    backed off from fast. The gap is always kept within `[min_gap, max_gap]` and never drops below
+    `latency_ratio` times the device's average response latency. Timings are tracked separately per device (i.e.
+    slave address) and can be inspected through `timings`.
+    """
+
+    def __init__(
+        self,
+        initial_gap: float = DEFAULT_SLEEP,
+        min_gap: float = 0.1,
+        max_gap: float = 5.0,
+        decrease_step: float = 0.05,
+        increase_factor: float = 2.0,
+        latency_ratio: float = 0.5,
+        smoothing: float = 0.2,
+    ):
+        if not 0 <= min_gap <= initial_gap <= max_gap:
+            raise ValueError(f'Expected 0 <= min_gap ({min_gap}) <= initial_gap ({initial_gap}) <= max_gap ({max_gap})')
+        self.initial_gap = initial_gap
+        self.min_gap = min_gap
+        self.max_gap = max_gap
+        self.decrease_step = decrease_step
+        self.increase_factor = increase_factor
+        self.latency_ratio = latency_ratio
+        self.smoothing = smoothing
+        self.timings: dict[int, DeviceTimings] = {}
+
+    def _device(self, device: int) -> DeviceTimings:
+        if device not in self.timings:
+            self.timings[device] = DeviceTimings(self.initial_gap)
+        return self.timings[device]
+
+    def gap(self, device: int) -> float:
+        """How long to wait before sending the next request to `device`."""
+        return self._device(device).gap
+
+    def record(self, device: int, latency: float, success: bool) -> None:
+        """Feed back the outcome of a request to `device` and adjust its gap accordingly."""
+        timings = self._device(device)
+        timings.requests += 1
+        timings.last_latency = latency
+        if timings.mean_latency is None:
+            timings.mean_latency = latency
+        else:
+            timings.mean_latency += self.smoothing * (latency - timings.mean_latency)
+        timings.error_rate += self.smoothing * ((0.0 if success else 1.0) - timings.error_rate)
+
+        if success:
+            gap = timings.gap - self.decrease_step
+        else:
+            timings.errors += 1
+            gap = max(timings.gap, self.decrease_step) * self.increase_factor
+        floor = max(self.min_gap, self.latency_ratio * timings.mean_latency)
+        timings.gap = min(max(gap, floor), self.max_gap)
+
+
+class RetryPolicy:
+    """Decides whether and when to retry a failed request.
+
+    A request is attempted at most `max_attempts` times. After the Nth failed attempt the next one is delayed by
+    `initial_backoff * backoff_multiplier ** (N - 1)` seconds, capped at `max_backoff` and randomised by up to
+    `jitter` (as a fraction) either way so that retries to several devices don't fall into lockstep. No retry is
+    made if it could not start within `deadline` seconds of the first attempt.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        initial_backoff: float = DEFAULT_SLEEP,
+        backoff_multiplier: float = 2.0,
+        max_backoff: float = 5.0,
+        jitter: float = 0.2,
+        deadline: float | None = 10.0,
+    ):
+        if max_attempts < 1:
+            raise ValueError(f'max_attempts ({max_attempts}) must be at least 1')
+        if not 0 <= jitter <= 1:
+            raise ValueError(f'jitter ({jitter}) must be between 0 and 1')
+        self.max_attempts = max_attempts
+        self.initial_backoff = initial_backoff
+        self.backoff_multiplier = backoff_multiplier
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.deadline = deadline
+
+    def __repr__(self):
+        return (
+            f"RetryPolicy(max_attempts={self.max_attempts}, initial_backoff={self.initial_backoff}, "
+            f"backoff_multiplier={self.backoff_multiplier}, max_backoff={self.max_backoff}, jitter={self.jitter}, "
+            f"deadline={self.deadline})"
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """How long to wait after the given (1-based) failed attempt before making the next one."""
+        delay = min(self.initial_backoff * self.backoff_multiplier ** (attempt - 1), self.max_backoff)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def should_retry(self, attempt: int, elapsed: float, delay: float) -> bool:
+        """Whether to make another attempt after `attempt` failed ones, `elapsed` seconds in and `delay` to wait."""
+        if attempt >= self.max_attempts:
+            return False
+        return self.deadline is None or elapsed + delay < self.deadline
+
+
+class CircuitState(str, Enum):
+    """States of a device's circuit in `CircuitBreaker`."""
+
+    CLOSED = 'closed'  # device is healthy and polled as normal
+    OPEN = 'open'  # device keeps failing and is not polled until its cooldown expires
+    HALF_OPEN = 'half-open'  # cooldown has expired, the next request decides whether to close or reopen
+
+
+class DeviceCircuit:
+    """Circuit breaker state of a single device, as tracked by `CircuitBreaker`."""
+
+    def __init__(self):
+        self.state = CircuitState.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None  # time.monotonic() the circuit last opened
+        self.trips = 0  # how many times the circuit has opened
+
+    def __repr__(self):
+        return (
+            f"DeviceCircuit(state={self.state.value}, consecutive_failures={self.consecutive_failures}, "
+            f"opened_at={self.opened_at}, trips={self.trips})"
+        )
+
+
+class CircuitBreaker:
+    """Stops polling devices (i.e. slave addresses) that keep failing, so one dead device can't stall every poll.
+
+    Once `failure_threshold` requests to a device have failed in a row (after any retries), its circuit opens and
+    requests to it are skipped for `cooldown` seconds. After that the circuit is half-open: one request is let
+    through, which closes the circuit again on success or reopens it for another cooldown on failure. The state of
+    each device can be inspected through `circuits`.
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 300.0):
+        if failure_threshold < 1:
+            raise ValueError(f'failure_threshold ({failure_threshold}) must be at least 1')
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.circuits: dict[int, DeviceCircuit] = {}
+
+    def _device(self, device: int) -> DeviceCircuit:
+        if device not in self.circuits:
+            self.circuits[device] = DeviceCircuit()
+        return self.circuits[device]
+
+    def state(self, device: int) -> CircuitState:
+        """The current state of `device`'s circuit."""
+        circuit = self._device(device)
+        if circuit.state == CircuitState.OPEN and t.monotonic() - circuit.opened_at >= self.cooldown:
+            circuit.state = CircuitState.HALF_OPEN
+        return circuit.state
+
+    def allow(self, device: int) -> bool:
+        """Whether a request to `device` should be made at all."""
+        return self.state(device) != CircuitState.OPEN
+
+    def record(self, device: int, success: bool) -> None:
+        """Feed back the outcome of a request to `device`, opening or closing its circuit as needed."""
+        circuit = self._device(device)
+        if success:
+            if circuit.state != CircuitState.CLOSED:
+                _logger.info(f'Device {hex(device)} is responding again, closing its circuit')
+            circuit.state = CircuitState.CLOSED
+            circuit.consecutive_failures = 0
+            return
+        circuit.consecutive_failures += 1
+        if circuit.state == CircuitState.HALF_OPEN or circuit.consecutive_failures >= self.failure_threshold:
+            _logger.warning(
+                f'Device {hex(device)} failed {circuit.consecutive_failures} requests in a row, '
+                f'not polling it for {self.cooldown}s'
+            )
+            circuit.state = CircuitState.OPEN
+            circuit.opened_at = t.monotonic()
+            circuit.trips += 1
+
+    def open_devices(self) -> list[int]:
+        """The devices currently not being polled."""
+        return [device for device in self.circuits if self.state(device) == CircuitState.OPEN]
+
+
+def register_pages(registers: Iterable[Register]) -> dict[type[Register], list[int]]:
+    """Work out the minimal set of 60-register pages that need to be read to cover all the given registers."""
+    pages: dict[type[Register], set[int]] = {}
+    for register in registers:
+        pages.setdefault(type(register), set()).add(register.value - register.value % 60)
+    return {register_type: sorted(base_registers) for register_type, base_registers in pages.items()}
+
+
+def attribute_register_pages(
+    attributes: Iterable[str],
+) -> tuple[dict[type[Register], list[int]], dict[type[Register], list[int]]]:
+    """Work out which register pages to read from the inverter and each battery to populate the given attributes.
+
+    Attributes are names of `Inverter` or `Battery` model fields (including derived ones such as `system_time`).
+    Returns a tuple of `(inverter_pages, battery_pages)`.
+    """
+    inverter_registers: list[Register] = []
+    battery_registers: list[Register] = []
+    for attribute in attributes:
+        registers = registers_for_attribute(attribute)
+        if not registers:
+            raise ValueError(f'Unknown attribute {attribute}')
+        if attribute in Battery.__fields__:
+            battery_registers.extend(registers)
+        if attribute in Inverter.__fields__ or attribute not in Battery.__fields__:
+            inverter_registers.extend(registers)
+    return register_pages(inverter_registers), register_pages(battery_registers)
+
+
+def serial_number_from_registers(values: Mapping[int, int], base_register: int) -> str:
+    """Decode the 10-character serial number stored in the 5 registers from `base_register` onwards.
+
+    Returns an empty string if any of the registers are missing or they don't hold a serial number.
+    """
+    try:
+        raw = b''.join(values[i].to_bytes(2, byteorder='big') for i in range(base_register, base_register + 5))
+    except KeyError:
+        return ''
+    return raw.decode('ascii', errors='replace').strip('\x00 ')
+
+
+class GivEnergyClientCore:
+    """What `GivEnergyClient` and `AsyncGivEnergyClient` have in common, written without doing any I/O itself.
+
+    Methods that need to talk to the inverter are `givenergy_modbus.protocol` generators (`_fetch_plant_pages` and
+    friends) that subclasses drive over a blocking or an asyncio connection, and expose under the same name without
+    the leading underscore. The helpers that set up the inverter hand their register values on to the subclass's
+    `write_holding_registers` and return whatever it returns, so they have to be awaited on the async client.
+    """
+
+    metrics: ClientMetrics
+
+    def __init__(
+        self,
+        pacer: AdaptivePacer = None,
+        retry_policy: RetryPolicy = None,
+        circuit_breaker: CircuitBreaker = None,
+        plant: Plant = None,
+        max_cache_age: float = 60.0,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        battery_refresh_interval: int = 1,
+    ):
+        self.pacer = pacer if pacer is not None else AdaptivePacer()
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        self.plant = plant
+        self.max_cache_age = max_cache_age
+        self.max_in_flight = max_in_flight
+        self.battery_refresh_interval = battery_refresh_interval
+        self._refresh_count = 0
+
+    def write_holding_registers(self, values: Mapping[HoldingRegister, int]):
+        """Write values to holding registers, eliding any writes that would not change anything (see `plant`)."""
+        raise NotImplementedError()
+
+    def _fetch_register_pages(
         self,
         pages: Mapping[type[HoldingRegister | InputRegister], Sequence[int]],
         register_cache: RegisterCache,
-        slave_address: int = 0x32,
-        sleep_between_queries: float = DEFAULT_SLEEP,
-    ) -> None:
-        """Reload all inverter data from the device."""
+        slave_address: int,
+        sleep_between_queries: float | None,
+    ) -> Steps:
         for register, base_registers in pages.items():
             for base_register in base_registers:
-                for retry in range(0, 20):
-                    data = self.modbus_client.read_registers(register, base_register, 60, slave_address=slave_address)
-                    if data:
-                        register_cache.set_registers(register, data)
-                        break
-                    t.sleep(sleep_between_queries)
-                if not data:
-                    print("WARN: Failed to read register " + str(base_register))
-                t.sleep(sleep_between_queries)
-
-    def refresh_plant(self, plant: Plant, full_refresh: bool, sleep_between_queries=DEFAULT_SLEEP):
-        """Refresh the internal caches for a plant. Optionally refresh only data that changes frequently."""
+                rcs = [register_cache]
+                yield from self._fetch_page(register, base_register, slave_address, rcs, sleep_between_queries)
+
+    def _fetch_page(
+        self,
+        register: type[HoldingRegister | InputRegister],
+        base_register: int,
+        slave_address: int,
+        register_caches: Sequence[RegisterCache],
+        sleep_between_queries: float | None,
+    ) -> Steps:
+        """Read a single page into the given register caches, subject to the device's circuit breaker."""
+        state = self.circuit_breaker.state(slave_address)
+        if state == CircuitState.OPEN:
+            _logger.debug(f'Circuit for device {hex(slave_address)} is open, skipping page {base_register}')
+            return
+        # a half-open circuit only needs a single request to find out whether the device is back
+        retry = state == CircuitState.CLOSED
+        data = yield from self._read_page(register, base_register, slave_address, sleep_between_queries, retry)
+        self.circuit_breaker.record(slave_address, bool(data))
+        if data:
+            for register_cache in register_caches:
+                register_cache.set_registers(register, data)
+        else:
+            _logger.warning(f'Failed to read register {base_register} from device {hex(slave_address)}')
+        yield Sleep(self._gap(slave_address, sleep_between_queries))
+
+    def _read_page(
+        self,
+        register: type[HoldingRegister | InputRegister],
+        base_register: int,
+        slave_address: int,
+        sleep_between_queries: float | None,
+        retry: bool = True,
+    ) -> Steps:
+        """Read a single page, retrying as `self.retry_policy` allows. Returns an empty dict on failure."""
+        first_attempt = t.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            start = t.monotonic()
+            data = yield from read_registers(register, base_register, 60, self.metrics, slave_address=slave_address)
+            self.pacer.record(slave_address, t.monotonic() - start, bool(data))
+            if data:
+                return data
+            delay = max(self.retry_policy.backoff(attempt), self._gap(slave_address, sleep_between_queries))
+            if not retry or not self.retry_policy.should_retry(attempt, t.monotonic() - first_attempt, delay):
+                return {}
+            yield Sleep(delay)
+
+    def _gap(self, slave_address: int, sleep_between_queries: float | None) -> float:
+        if sleep_between_queries is not None:
+            return sleep_between_queries
+        return self.pacer.gap(slave_address)
+
+    def _refresh_plant(self, plant: Plant, full_refresh: bool, sleep_between_queries: float | None) -> Steps:
         inverter_registers = {
             InputRegister: [0, 180],
         }
@@ -59,99 +387,268 @@ class GivEnergyClient:
         if full_refresh:
             inverter_registers[HoldingRegister] = [0, 60, 120]
 
-        self.fetch_register_pages(
-            inverter_registers, plant.inverter_rc, slave_address=0x32, sleep_between_queries=sleep_between_queries
+        battery_registers = {InputRegister: [60]} if self._battery_refresh_due(plant, full_refresh) else {}
+        yield from self._fetch_plant_pages(plant, inverter_registers, battery_registers, sleep_between_queries)
+
+    def _refresh_plant_attributes(
+        self, plant: Plant, attributes: Iterable[str], sleep_between_queries: float | None
+    ) -> Steps:
+        inverter_pages, battery_pages = attribute_register_pages(attributes)
+        # every refresh counts towards `battery_refresh_interval`, whether or not it asks for battery data
+        if not self._battery_refresh_due(plant, False):
+            battery_pages = {}
+        yield from self._fetch_plant_pages(plant, inverter_pages, battery_pages, sleep_between_queries)
+
+    def _discover_batteries(
+        self, max_batteries: int, topology_cache: TopologyCache | None, refresh: bool, probe_timeout: float
+    ) -> Steps:
+        if topology_cache is None:
+            topology_cache = TopologyCache()
+        inverter_serial_number = serial_number_from_registers(
+            (yield from read_registers(HoldingRegister, 0, 60, self.metrics)),
+            HoldingRegister.INVERTER_SERIAL_NUMBER_1_2.value,
         )
-        for i, battery_rc in enumerate(plant.batteries_rcs):
-            self.fetch_register_pages(
-                {InputRegister: [60]},
-                battery_rc,
-                slave_address=0x32 + i,
-                sleep_between_queries=sleep_between_queries,
+        if inverter_serial_number and not refresh:
+            topology = topology_cache.get(inverter_serial_number)
+            if topology is not None:
+                _logger.debug(f'Using cached topology for inverter {inverter_serial_number}: {topology}')
+                return len(topology['battery_serial_numbers'])
+
+        requests = [(InputRegister, 60, 60, 0x32 + i) for i in range(max_batteries)]
+        results = yield from read_registers_pipelined(requests, self.max_in_flight, probe=True)
+        unanswered = [request for request, data in zip(requests, results) if not data]
+        if unanswered:
+            # make sure these aren't batteries that just happened to drop their pipelined requests, without waiting
+            # long on addresses that simply have no battery behind them
+            retried = yield from read_registers_pipelined(unanswered, self.max_in_flight, probe_timeout, probe=True)
+            retries = {slave_address: data for (_, _, _, slave_address), data in zip(unanswered, retried)}
+            results = [data or retries[request[3]] for request, data in zip(requests, results)]
+        battery_serial_numbers = []
+        definite = True  # whether every address probed gave an actual answer
+        for (_, _, _, slave_address), data in zip(requests, results):
+            if not data:
+                _logger.debug(f'No response from device {hex(slave_address)}, assuming no more batteries')
+                definite = False
+                break
+            serial_number = serial_number_from_registers(data, InputRegister.BATTERY_SERIAL_NUMBER_1_2.value)
+            if not serial_number:
+                break
+            battery_serial_numbers.append(serial_number)
+        _logger.info(f'Discovered {len(battery_serial_numbers)} batteries: {battery_serial_numbers}')
+
+        if inverter_serial_number and definite:
+            topology_cache.put(inverter_serial_number, {'battery_serial_numbers': battery_serial_numbers})
+        return len(battery_serial_numbers)
+
+    def _battery_refresh_due(self, plant: Plant, full_refresh: bool) -> bool:
+        """Count a refresh tick and decide whether the batteries need to be refreshed on it."""
+        self._refresh_count += 1
+        return (
+            full_refresh
+            or (self._refresh_count - 1) % self.battery_refresh_interval == 0
+            or any(rc.version == 0 for rc in plant.batteries_rcs)
+        )
+
+    def _fetch_plant_pages(
+        self,
+        plant: Plant,
+        inverter_pages: Mapping[type[HoldingRegister | InputRegister], Sequence[int]],
+        battery_pages: Mapping[type[HoldingRegister | InputRegister], Sequence[int]],
+        sleep_between_queries: float | None,
+    ) -> Steps:
+        targets = [(plant.inverter_rc, 0x32, inverter_pages)] if inverter_pages else []
+        if battery_pages:
+            targets.extend((rc, 0x32 + i, battery_pages) for i, rc in enumerate(plant.batteries_rcs))
+        states = {slave_address: self.circuit_breaker.state(slave_address) for _, slave_address, _ in targets}
+        # the inverter shares its slave address with the first battery, so the same page may be wanted by both
+        caches: dict[tuple[type[Register], int, int], list[RegisterCache]] = {}
+        for rc, slave_address, pages in targets:
+            for register, base_registers in pages.items():
+                for base_register in base_registers:
+                    caches.setdefault((register, base_register, slave_address), []).append(rc)
+        requests = [
+            (register, base_register, 60, slave_address)
+            for register, base_register, slave_address in caches
+            if states[slave_address] == CircuitState.CLOSED
+        ]
+        failed: list[tuple[type[Register], int, int]] = []
+        if requests:
+            start = t.monotonic()
+            results = yield from read_registers_pipelined(requests, self.max_in_flight)
+            latency = (t.monotonic() - start) / len(requests)
+            for (register, base_register, _, slave_address), data in zip(requests, results):
+                self.pacer.record(slave_address, latency, bool(data))
+                if data:
+                    self.circuit_breaker.record(slave_address, True)
+                    for rc in caches[register, base_register, slave_address]:
+                        rc.set_registers(register, data)
+                else:
+                    failed.append((register, base_register, slave_address))
+            if failed:
+                _logger.info(f'Retrying {len(failed)}/{len(requests)} pipelined pages one page at a time')
+        # devices with half-open circuits get probed on their own, so a dead one doesn't hold up the pipeline
+        failed.extend(key for key in caches if states[key[2]] == CircuitState.HALF_OPEN)
+        for register, base_register, slave_address in failed:
+            rcs = caches[register, base_register, slave_address]
+            yield from self._fetch_page(register, base_register, slave_address, rcs, sleep_between_queries)
+        if requests and not failed:
+            yield Sleep(max(self._gap(slave_address, sleep_between_queries) for slave_address in states))
+
+    def _write_holding_registers(self, values: Mapping[HoldingRegister, int]) -> Steps:
+        check_writes(values)
+        if self.plant is not None:
+            values = yield from self._elide_writes(values)
+        if values:
+            yield from write_holding_registers(values)
+            if self.plant is not None:
+                self.plant.inverter_rc.set_registers(HoldingRegister, {r.value: int(v) for r, v in values.items()})
+
+    def _elide_writes(self, values: Mapping[HoldingRegister, int]) -> Steps:
+        """Drop writes of values the inverter's registers are known to already hold.
+
+        Only values read back within `max_cache_age` are trusted: stale registers are re-read first, and if that
+        fails the writes to them go ahead regardless.
+        """
+        register_cache = self.plant.inverter_rc
+        stale = [r for r in values if not self._is_fresh(register_cache, r)]
+        if stale:
+            _logger.debug(f'Re-reading stale cached registers {", ".join(r.name for r in stale)} before writing')
+            yield from self._fetch_register_pages(register_pages(stale), register_cache, 0x32, None)
+        elided = {
+            r: v
+            for r, v in values.items()
+            if not self._is_fresh(register_cache, r) or r not in register_cache or register_cache[r] != int(v)
+        }
+        if len(elided) < len(values):
+            _logger.info(
+                'Skipping writes to Holding Registers already holding the desired values: '
+                + ', '.join(r.name for r in values if r not in elided)
             )
+        return elided
+
+    def _is_fresh(self, register_cache: RegisterCache, register: HoldingRegister) -> bool:
+        """Whether the cached value of a register was read within `max_cache_age`."""
+        age = register_cache.register_age(register)
+        return age is not None and age <= self.max_cache_age
 
     def enable_charge_target(self, target_soc: int):
         """Sets inverter to stop charging when SOC reaches the desired level. Also referred to as "winter mode"."""
         if not 4 <= target_soc <= 100:
             raise ValueError(f'Specified Charge Target SOC ({target_soc}) is not in [4-100]')
         if target_soc == 100:
-            self.disable_charge_target()
+            return self.disable_charge_target()
         else:
-            self.modbus_client.write_holding_register(HoldingRegister.ENABLE_CHARGE_TARGET, True)
-            self.modbus_client.write_holding_register(HoldingRegister.CHARGE_TARGET_SOC, target_soc)
+            return self.write_holding_registers(
+                {
+                    HoldingRegister.ENABLE_CHARGE_TARGET: True,
+                    HoldingRegister.CHARGE_TARGET_SOC: target_soc,
+                }
+            )
 
     def disable_charge_target(self):
         """Removes SOC limit and target 100% charging."""
-        self.modbus_client.write_holding_register(HoldingRegister.ENABLE_CHARGE_TARGET, False)
-        self.modbus_client.write_holding_register(HoldingRegister.CHARGE_TARGET_SOC, 100)
+        return self.write_holding_registers(
+            {
+                HoldingRegister.ENABLE_CHARGE_TARGET: False,
+                HoldingRegister.CHARGE_TARGET_SOC: 100,
+            }
+        )
 
     def enable_charge(self):
         """Set the battery to charge, depending on the mode and slots set."""
-        self.modbus_client.write_holding_register(HoldingRegister.ENABLE_CHARGE, True)
+        return self.write_holding_registers({HoldingRegister.ENABLE_CHARGE: True})
 
     def disable_charge(self):
         """Disable the battery from charging."""
-        self.modbus_client.write_holding_register(HoldingRegister.ENABLE_CHARGE, False)
+        return self.write_holding_registers({HoldingRegister.ENABLE_CHARGE: False})
 
     def enable_discharge(self):
         """Set the battery to discharge, depending on the mode and slots set."""
-        self.modbus_client.write_holding_register(HoldingRegister.ENABLE_DISCHARGE, True)
+        return self.write_holding_registers({HoldingRegister.ENABLE_DISCHARGE: True})
 
     def disable_discharge(self):
         """Set the battery to not discharge at all."""
-        self.modbus_client.write_holding_register(HoldingRegister.ENABLE_DISCHARGE, False)
+        return self.write_holding_registers({HoldingRegister.ENABLE_DISCHARGE: False})
 
     def set_battery_discharge_mode_max_power(self):
         """Set the battery to discharge at maximum power (export) when discharging."""
-        self.modbus_client.write_holding_register(HoldingRegister.BATTERY_POWER_MODE, 0)
+        return self.write_holding_registers({HoldingRegister.BATTERY_POWER_MODE: 0})
 
     def set_battery_discharge_mode_demand(self):
         """Set the battery to discharge to match demand (no export) when discharging."""
-        self.modbus_client.write_holding_register(HoldingRegister.BATTERY_POWER_MODE, 1)
+        return self.write_holding_registers({HoldingRegister.BATTERY_POWER_MODE: 1})
 
     def set_charge_slot_1(self, times: tuple[time, time]):
         """Set first charge slot times."""
-        self.modbus_client.write_holding_register(HoldingRegister.CHARGE_SLOT_1_START, int(times[0].strftime('%H%M')))
-        self.modbus_client.write_holding_register(HoldingRegister.CHARGE_SLOT_1_END, int(times[1].strftime('%H%M')))
+        return self.write_holding_registers(
+            {
+                HoldingRegister.CHARGE_SLOT_1_START: int(times[0].strftime('%H%M')),
+                HoldingRegister.CHARGE_SLOT_1_END: int(times[1].strftime('%H%M')),
+            }
+        )
 
     def reset_charge_slot_1(self):
         """Reset first charge slot times to zero/disabled."""
-        self.modbus_client.write_holding_register(HoldingRegister.CHARGE_SLOT_1_START, 0)
-        self.modbus_client.write_holding_register(HoldingRegister.CHARGE_SLOT_1_END, 0)
+        return self.write_holding_registers(
+            {
+                HoldingRegister.CHARGE_SLOT_1_START: 0,
+                HoldingRegister.CHARGE_SLOT_1_END: 0,
+            }
+        )
 
     def set_charge_slot_2(self, times: tuple[time, time]):
         """Set second charge slot times."""
-        self.modbus_client.write_holding_register(HoldingRegister.CHARGE_SLOT_2_START, int(times[0].strftime('%H%M')))
-        self.modbus_client.write_holding_register(HoldingRegister.CHARGE_SLOT_2_END, int(times[1].strftime('%H%M')))
+        return self.write_holding_registers(
+            {
+                HoldingRegister.CHARGE_SLOT_2_START: int(times[0].strftime('%H%M')),
+                HoldingRegister.CHARGE_SLOT_2_END: int(times[1].strftime('%H%M')),
+            }
+        )
 
     def reset_charge_slot_2(self):
         """Reset second charge slot times to zero/disabled."""
-        self.modbus_client.write_holding_register(HoldingRegister.CHARGE_SLOT_2_START, 0)
-        self.modbus_client.write_holding_register(HoldingRegister.CHARGE_SLOT_2_END, 0)
+        return self.write_holding_registers(
+            {
+                HoldingRegister.CHARGE_SLOT_2_START: 0,
+                HoldingRegister.CHARGE_SLOT_2_END: 0,
+            }
+        )
 
     def set_discharge_slot_1(self, times: tuple[time, time]):
         """Set first discharge slot times."""
-        self.modbus_client.write_holding_register(
-            HoldingRegister.DISCHARGE_SLOT_1_START, int(times[0].strftime('%H%M'))
+        return self.write_holding_registers(
+            {
+                HoldingRegister.DISCHARGE_SLOT_1_START: int(times[0].strftime('%H%M')),
+                HoldingRegister.DISCHARGE_SLOT_1_END: int(times[1].strftime('%H%M')),
+            }
         )
-        self.modbus_client.write_holding_register(HoldingRegister.DISCHARGE_SLOT_1_END, int(times[1].strftime('%H%M')))
 
     def reset_discharge_slot_1(self):
         """Reset first discharge slot times to zero/disabled."""
-        self.modbus_client.write_holding_register(HoldingRegister.DISCHARGE_SLOT_1_START, 0)
-        self.modbus_client.write_holding_register(HoldingRegister.DISCHARGE_SLOT_1_END, 0)
+        return self.write_holding_registers(
+            {
+                HoldingRegister.DISCHARGE_SLOT_1_START: 0,
+                HoldingRegister.DISCHARGE_SLOT_1_END: 0,
+            }
+        )
 
     def set_discharge_slot_2(self, times: tuple[time, time]):
         """Set second discharge slot times."""
-        self.modbus_client.write_holding_register(
-            HoldingRegister.DISCHARGE_SLOT_2_START, int(times[0].strftime('%H%M'))
+        return self.write_holding_registers(
+            {
+                HoldingRegister.DISCHARGE_SLOT_2_START: int(times[0].strftime('%H%M')),
+                HoldingRegister.DISCHARGE_SLOT_2_END: int(times[1].strftime('%H%M')),
+            }
         )
-        self.modbus_client.write_holding_register(HoldingRegister.DISCHARGE_SLOT_2_END, int(times[1].strftime('%H%M')))
 
     def reset_discharge_slot_2(self):
         """Reset first discharge slot times to zero/disabled."""
-        self.modbus_client.write_holding_register(HoldingRegister.DISCHARGE_SLOT_2_START, 0)
-        self.modbus_client.write_holding_register(HoldingRegister.DISCHARGE_SLOT_2_END, 0)
+        return self.write_holding_registers(
+            {
+                HoldingRegister.DISCHARGE_SLOT_2_START: 0,
+                HoldingRegister.DISCHARGE_SLOT_2_END: 0,
+            }
+        )
 
     def set_mode_dynamic(self):
         """Set system to Dynamic / Eco mode.
@@ -162,9 +659,13 @@ class GivEnergyClient:
         importing and exporting as little energy as possible. This mode is useful if you want to maximise
         self-consumption of renewable generation and minimise the amount of energy drawn from the grid.
         """
-        self.set_battery_discharge_mode_demand()  # r27=1
-        self.set_shallow_charge(4)  # r110=4
-        self.disable_discharge()  # r59=0
+        return self.write_holding_registers(
+            {
+                HoldingRegister.BATTERY_POWER_MODE: 1,  # r27=1, discharge to match demand
+                HoldingRegister.BATTERY_SOC_RESERVE: 4,  # r110=4
+                HoldingRegister.ENABLE_DISCHARGE: False,  # r59=0
+            }
+        )
 
     def set_mode_storage(
         self, slot_1: tuple[time, time] = (time(hour=16), time(hour=7)), slot_2: tuple[time, time] = None, export=False
@@ -181,54 +682,198 @@ class GivEnergyClient:
         have a variable export tariff (e.g. Agile export) and you want to target the peak times of day (e.g. 4pm-7pm)
         when it is both most expensive to import and most valuable to export energy.
         """
-        if export:
-            self.set_battery_discharge_mode_max_power()  # r27=0
-        else:
-            self.set_battery_discharge_mode_demand()  # r27=1
-        self.set_shallow_charge(100)  # r110=100
-        self.enable_discharge()  # r59=1
-        self.set_discharge_slot_1(slot_1)  # r56=1600, r57=700
-        if slot_2:
-            self.set_discharge_slot_1(slot_2)  # r56=1600, r57=700
-        else:
-            self.reset_discharge_slot_2()
+        if slot_2 is None:
+            slot_2 = (time(hour=0), time(hour=0))
+        return self.write_holding_registers(
+            {
+                HoldingRegister.BATTERY_POWER_MODE: 0 if export else 1,  # r27=0 max power, r27=1 match demand
+                HoldingRegister.BATTERY_SOC_RESERVE: 100,  # r110=100
+                HoldingRegister.ENABLE_DISCHARGE: True,  # r59=1
+                HoldingRegister.DISCHARGE_SLOT_1_START: int(slot_1[0].strftime('%H%M')),  # r56=1600
+                HoldingRegister.DISCHARGE_SLOT_1_END: int(slot_1[1].strftime('%H%M')),  # r57=700
+                HoldingRegister.DISCHARGE_SLOT_2_START: int(slot_2[0].strftime('%H%M')),  # r44
+                HoldingRegister.DISCHARGE_SLOT_2_END: int(slot_2[1].strftime('%H%M')),  # r45
+            }
+        )
 
     def set_datetime(self, dt: datetime):
         """Set the date & time of the inverter."""
-        self.modbus_client.write_holding_register(HoldingRegister.SYSTEM_TIME_YEAR, dt.year)
-        self.modbus_client.write_holding_register(HoldingRegister.SYSTEM_TIME_MONTH, dt.month)
-        self.modbus_client.write_holding_register(HoldingRegister.SYSTEM_TIME_DAY, dt.day)
-        self.modbus_client.write_holding_register(HoldingRegister.SYSTEM_TIME_HOUR, dt.hour)
-        self.modbus_client.write_holding_register(HoldingRegister.SYSTEM_TIME_MINUTE, dt.minute)
-        self.modbus_client.write_holding_register(HoldingRegister.SYSTEM_TIME_SECOND, dt.second)
+        return self.write_holding_registers(
+            {
+                HoldingRegister.SYSTEM_TIME_YEAR: dt.year,
+                HoldingRegister.SYSTEM_TIME_MONTH: dt.month,
+                HoldingRegister.SYSTEM_TIME_DAY: dt.day,
+                HoldingRegister.SYSTEM_TIME_HOUR: dt.hour,
+                HoldingRegister.SYSTEM_TIME_MINUTE: dt.minute,
+                HoldingRegister.SYSTEM_TIME_SECOND: dt.second,
+            }
+        )
 
     def set_discharge_enable(self, mode: bool):
         """Set the battery to discharge."""
-        self.modbus_client.write_holding_register(HoldingRegister.ENABLE_DISCHARGE, int(mode))
+        return self.write_holding_registers({HoldingRegister.ENABLE_DISCHARGE: int(mode)})
 
     def set_shallow_charge(self, val: int):
         """Set the minimum level of charge to keep."""
         # TODO what are valid values? 4-100?
-        self.modbus_client.write_holding_register(HoldingRegister.BATTERY_SOC_RESERVE, val)
+        return self.write_holding_registers({HoldingRegister.BATTERY_SOC_RESERVE: val})
 
     def set_battery_charge_limit(self, val: int):
         """Set the battery charge power limit as percentage. 50% (2.6 kW) is the maximum for most inverters."""
         if not 0 <= val <= 50:
             raise ValueError(f'Specified Charge Limit ({val}%) is not in [0-50]%')
-        self.modbus_client.write_holding_register(HoldingRegister.BATTERY_CHARGE_LIMIT, val)
+        return self.write_holding_registers({HoldingRegister.BATTERY_CHARGE_LIMIT: val})
 
     def set_battery_discharge_limit(self, val: int):
         """Set the battery discharge power limit as percentage. 50% (2.6 kW) is the maximum for most inverters."""
         if not 0 <= val <= 50:
             raise ValueError(f'Specified Discharge Limit ({val}%) is not in [0-50]%')
-        self.modbus_client.write_holding_register(HoldingRegister.BATTERY_DISCHARGE_LIMIT, val)
+        return self.write_holding_registers({HoldingRegister.BATTERY_DISCHARGE_LIMIT: val})
 
     def set_battery_power_reserve(self, val: int):
         """Set the battery power reserve to maintain."""
         # TODO what are valid values?
-        self.modbus_client.write_holding_register(HoldingRegister.BATTERY_DISCHARGE_MIN_POWER_RESERVE, val)
+        return self.write_holding_registers({HoldingRegister.BATTERY_DISCHARGE_MIN_POWER_RESERVE: val})
 
     def set_battery_target_soc(self, val: int):
         """Set the target SOC when the battery charges."""
         # TODO what are valid values?
-        self.modbus_client.write_holding_register(HoldingRegister.CHARGE_TARGET_SOC, val)
+        return self.write_holding_registers({HoldingRegister.CHARGE_TARGET_SOC: val})
+
+
+class GivEnergyClient(GivEnergyClientCore):
+    """Client for end users to conveniently access GivEnergy inverters."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 8899,
+        modbus_client: ModbusTcpClient = None,
+        persistent: bool = False,
+        pacer: AdaptivePacer = None,
+        retry_policy: RetryPolicy = None,
+        circuit_breaker: CircuitBreaker = None,
+        plant: Plant = None,
+        max_cache_age: float = 60.0,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        battery_refresh_interval: int = 1,
+        metrics: ClientMetrics = None,
+    ):
+        """Constructor.
+
+        Use `persistent` to keep a single long-lived connection to the data adapter, and `pacer` to customise how
+        requests are spaced out (see `AdaptivePacer`). Failed page reads are retried according to `retry_policy`,
+        and devices that keep failing stop being polled for a while as decided by `circuit_breaker`.
+
+        If a `plant` is given, holding register writes are checked against its inverter register cache first and
+        skipped if the register already holds the desired value. Cached values older than `max_cache_age` seconds
+        are re-read from the inverter before making that call.
+
+        Battery pages are read with up to `max_in_flight` pipelined requests outstanding at a time. Since battery
+        data changes slowly, `battery_refresh_interval` can be used to only refresh it on every Nth call to
+        `refresh_plant` or `refresh_plant_attributes`, unless it is a full refresh.
+
+        Transaction metrics are recorded in `metrics`, or the process-wide `givenergy_modbus.metrics.metrics` by
+        default, unless a `modbus_client` is given in which case they go wherever it records them.
+        """
+        super().__init__(
+            pacer=pacer,
+            retry_policy=retry_policy,
+            circuit_breaker=circuit_breaker,
+            plant=plant,
+            max_cache_age=max_cache_age,
+            max_in_flight=max_in_flight,
+            battery_refresh_interval=battery_refresh_interval,
+        )
+        self.host = host
+        self.port = port
+        if modbus_client is None:
+            modbus_client = GivEnergyModbusTcpClient(
+                host=self.host, port=self.port, persistent=persistent, metrics=metrics
+            )
+        self.modbus_client = modbus_client
+
+    def __repr__(self):
+        return f"GivEnergyClient({self.host}:{self.port}))"
+
+    @property
+    def metrics(self) -> ClientMetrics:
+        return self.modbus_client.metrics
+
+    def _run(self, steps: Steps):
+        return run(steps, self.modbus_client.perform)
+
+    def fetch_register_pages(
+        self,
+        pages: Mapping[type[HoldingRegister | InputRegister], Sequence[int]],
+        register_cache: RegisterCache,
+        slave_address: int = 0x32,
+        sleep_between_queries: float = None,
+    ) -> None:
+        """Reload all inverter data from the device.
+
+        Requests are paced by `self.pacer` unless a fixed `sleep_between_queries` is specified. Failed pages are
+        retried according to `self.retry_policy`, and skipped altogether while the device's circuit is open (see
+        `self.circuit_breaker`).
+        """
+        self._run(self._fetch_register_pages(pages, register_cache, slave_address, sleep_between_queries))
+
+    def refresh_plant(self, plant: Plant, full_refresh: bool, sleep_between_queries: float = None):
+        """Refresh the internal caches for a plant. Optionally refresh only data that changes frequently."""
+        self._run(self._refresh_plant(plant, full_refresh, sleep_between_queries))
+
+    def refresh_plant_attributes(self, plant: Plant, attributes: Iterable[str], sleep_between_queries: float = None):
+        """Refresh only the register pages needed for the given `Inverter` and `Battery` model attributes.
+
+        The rest of the plant's register caches is left as it was, so a full refresh should have been done at least
+        once before building models from it.
+        """
+        self._run(self._refresh_plant_attributes(plant, attributes, sleep_between_queries))
+
+    def discover_batteries(
+        self,
+        max_batteries: int = MAX_BATTERIES,
+        topology_cache: TopologyCache = None,
+        refresh: bool = False,
+        probe_timeout: float = PROBE_TIMEOUT,
+    ) -> int:
+        """Work out how many batteries are attached to the inverter, e.g. to use as `Plant(number_batteries=...)`.
+
+        The battery data page is read from each slave address from 0x32 onwards, and batteries are counted up to
+        the first address that doesn't report a battery serial number. Addresses that don't respond at all are
+        probed once more, waiting only `probe_timeout` seconds since there may be no battery behind them.
+
+        The result is cached to disk keyed by the inverter's serial number (see `TopologyCache`), so later calls
+        skip the probing unless `refresh` is set. It is only cached if every address probed gave an answer though,
+        since a battery that failed to respond would otherwise be left out for good.
+        """
+        return self._run(self._discover_batteries(max_batteries, topology_cache, refresh, probe_timeout))
+
+    def fetch_battery_pages(
+        self,
+        plant: Plant,
+        pages: Mapping[type[HoldingRegister | InputRegister], Sequence[int]],
+        sleep_between_queries: float = None,
+    ) -> None:
+        """Read the given register pages from all the plant's batteries, with pipelined requests."""
+        self._run(self._fetch_plant_pages(plant, {}, pages, sleep_between_queries))
+
+    def fetch_plant_pages(
+        self,
+        plant: Plant,
+        inverter_pages: Mapping[type[HoldingRegister | InputRegister], Sequence[int]],
+        battery_pages: Mapping[type[HoldingRegister | InputRegister], Sequence[int]],
+        sleep_between_queries: float = None,
+    ) -> None:
+        """Read the given register pages from the plant's inverter and all its batteries, with pipelined requests.
+
+        All requests are sent over the one connection without waiting for each other's responses, up to
+        `self.max_in_flight` at a time, so a whole refresh takes little more than a single round trip. Pages that
+        could not be read that way are retried one at a time, as in `fetch_register_pages`. Devices whose circuit is
+        open are skipped, and those whose circuit is half-open are probed one page at a time instead.
+        """
+        self._run(self._fetch_plant_pages(plant, inverter_pages, battery_pages, sleep_between_queries))
+
+    def write_holding_registers(self, values: Mapping[HoldingRegister, int]) -> None:
+        """Write values to holding registers, eliding any writes that would not change anything (see `plant`)."""
+        self._run(self._write_holding_registers(values))
@@ -38,11 +38,12 @@ class GivEnergyDecoder(IModbusDecoder, metaclass=abc.ABCMeta):
             fn_code &= 0x7F
         if fn_code in self._lookup:
             fn = self._lookup[fn_code]
-            _logger.debug(f"Identified incoming PDU as {fn_code}/{friendly_class_name(fn)}")
+            if _logger.isEnabledFor(logging.DEBUG):
+                _logger.debug(f"Identified incoming PDU as {fn_code}/{friendly_class_name(fn)}")
             return fn
         return None
 
-    def decode(self, data: bytes) -> ModbusPDU | ErrorResponse | None:
+    def decode(self, data: bytes | memoryview) -> ModbusPDU | ErrorResponse | None:
         """Create an appropriately populated PDU message object from a valid Modbus message.
 
         Extracts the `function code` from the raw message and looks up the matching ModbusPDU handler class
@@ -54,7 +55,8 @@ class GivEnergyDecoder(IModbusDecoder, metaclass=abc.ABCMeta):
         if main_fn == 0x1:
             # heartbeat / error?
             err_response = ErrorResponse()
-            _logger.debug(f"About to decode data [{hexlify(data)}]")
+            if _logger.isEnabledFor(logging.DEBUG):
+                _logger.debug(f"About to decode data [{hexlify(data)}]")
             err_response.decode(data)
             return err_response
         elif main_fn == 0x2:
@@ -65,7 +67,8 @@ class GivEnergyDecoder(IModbusDecoder, metaclass=abc.ABCMeta):
             fn_code = data[19]
             response = self.lookupPduClass(fn_code)
             if response:
-                _logger.debug(f"About to decode data [{hexlify(data)}]")
+                if _logger.isEnabledFor(logging.DEBUG):
+                    _logger.debug(f"About to decode data [{hexlify(data)}]")
                 r = response(function_code=fn_code)
                 r.decode(data)
                 return r
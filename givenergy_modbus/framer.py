@@ -10,6 +10,7 @@ from pymodbus.interfaces import IModbusDecoder
 from pymodbus.pdu import ModbusPDU
 from pymodbus.utilities import hexlify_packets
 
+from givenergy_modbus.metrics import ClientMetrics, metrics as default_metrics
 from givenergy_modbus.util import hexlify
 
 _logger = logging.getLogger(__package__)
@@ -112,31 +113,43 @@ class GivEnergyModbusFramer(ModbusFramer):
     """
 
     FRAME_HEAD = ">HHHBB"  # tid(w), pid(w), length(w), uid(b), fid(b)
+    COMPACT_THRESHOLD = 4096  # only shift the buffer down once this many leading bytes have been consumed
+    MAX_LENGTH = 0x120  # `len` of a response to reading 125 registers, the most a single Modbus read can ask for
 
-    def __init__(self, decoder: IModbusDecoder, client: ModbusBaseClient = None):
-        self._buffer = b""
+    _frame_head = struct.Struct(FRAME_HEAD)
+
+    def __init__(self, decoder: IModbusDecoder, client: ModbusBaseClient = None, metrics: ClientMetrics = None):
+        # Incoming data is appended to a growable buffer and consumed by advancing a read offset, so that popping
+        # frames off the front does not copy the remainder of the buffer each time.
+        self._buffer = bytearray()
+        self._offset = 0
         self._length = 0
         self._hsize = 0x08
         self._check = 0x0
         self._fcode = 0x2
         self.decoder = decoder
         self.client = client
+        self.metrics = metrics if metrics is not None else default_metrics
 
     def decode_data(self, data: bytes = None) -> dict | None:
         """Tries to extract the MBAP frame header and performs a few sanity checks."""
-        if not data:
-            data = self._buffer[: self._hsize]
-
         if self.isFrameReady():
-            _logger.debug(f"extracting MBAP header from [{hexlify(data)}] as {self.FRAME_HEAD}")
-            tid, pid, len_, uid, fid = struct.unpack(self.FRAME_HEAD, data)
+            debug = _logger.isEnabledFor(logging.DEBUG)
+            if data:
+                if debug:
+                    _logger.debug(f"extracting MBAP header from [{hexlify(data)}] as {self.FRAME_HEAD}")
+                tid, pid, len_, uid, fid = self._frame_head.unpack(data)
+            else:
+                tid, pid, len_, uid, fid = self._frame_head.unpack_from(self._buffer, self._offset)
             header = dict(transaction=tid, protocol=pid, length=len_, unit=uid, fcode=fid)
-            _logger.debug(f"extracted values: { dict((k, f'0x{v:02x}') for k,v in header.items()) }")
+            if debug:
+                _logger.debug(f"extracted values: { dict((k, f'0x{v:02x}') for k,v in header.items()) }")
             if tid != 0x5959 or pid != 0x1 or uid != 0x1:  # or fid != 0x2:
-                _logger.debug(
-                    f"Invalid MBAP header; corruption likely so cowardly refusing to proceed with this frame. "
-                    f"(0x{tid:04x} 0x{pid:04x} 0x{uid:02x} != 0x5959 0x0001 0x01)"
-                )
+                if debug:
+                    _logger.debug(
+                        f"Invalid MBAP header; corruption likely so cowardly refusing to proceed with this frame. "
+                        f"(0x{tid:04x} 0x{pid:04x} 0x{uid:02x} != 0x5959 0x0001 0x01)"
+                    )
                 return None
             return header
         return None
@@ -158,12 +171,19 @@ class GivEnergyModbusFramer(ModbusFramer):
                 _logger.warning(f"unexpected short message length {self._length}, advancing frame")
                 self.advanceFrame()
                 return False
+            # a corrupt header would otherwise hold up every later frame while waiting for data that never comes
+            if self._length > self.MAX_LENGTH:
+                _logger.warning(f"unexpected long message length {self._length}, looking for the next frame")
+                self._length = 0
+                return False
             # we have at least a complete message, continue
-            if len(self._buffer) >= self._hsize + self._length - 2:
+            if self._isFrameComplete():
                 return True
-            _logger.debug(
-                f'Incomplete message: len(buffer)={len(self._buffer)} < hsize={self._hsize} + length={self._length} - 2'
-            )
+            if _logger.isEnabledFor(logging.DEBUG):
+                _logger.debug(
+                    f'Incomplete message: len(buffer)={self._available()} < '
+                    f'hsize={self._hsize} + length={self._length} - 2'
+                )
         # we don't have enough of a message yet, try again later
         _logger.debug('Frame is not complete yet, needs more buffer data')
         return False
@@ -171,9 +191,13 @@ class GivEnergyModbusFramer(ModbusFramer):
     def advanceFrame(self):
         """Pop the front-most frame from the buffer."""
         length = self._hsize + self._length - 2
-        _logger.debug(f'length {length} = {self._hsize} + {self._length} - 2, len(buffer) = {len(self._buffer)}')
-        self._buffer = self._buffer[length:]
-        _logger.debug(f"buffer is now {len(self._buffer)} bytes: {self._buffer}")
+        debug = _logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            _logger.debug(f'length {length} = {self._hsize} + {self._length} - 2, len(buffer) = {self._available()}')
+        self._offset = min(self._offset + length, len(self._buffer))
+        self._compact()
+        if debug:
+            _logger.debug(f"buffer is now {self._available()} bytes")
         self._length = 0
 
     def addToFrame(self, message: bytes) -> None:
@@ -182,11 +206,33 @@ class GivEnergyModbusFramer(ModbusFramer):
 
     def isFrameReady(self):
         """Check if we have enough data in the buffer to read at least a frame header."""
-        return len(self._buffer) >= self._hsize
-
-    def getFrame(self):
-        """Extract the next PDU frame from the buffer, discarding the leading MBAP header."""
-        return self._buffer[self._hsize - 1 : self._hsize + self._length]
+        return self._available() >= self._hsize
+
+    def _isFrameComplete(self) -> bool:
+        """Check if the buffer holds the entire frame announced by the current header."""
+        return self._available() >= self._hsize + self._length - 2
+
+    def _available(self) -> int:
+        """Number of buffered bytes that have not been consumed yet."""
+        return len(self._buffer) - self._offset
+
+    def _compact(self) -> None:
+        """Discard consumed bytes from the front of the buffer once it is worth doing so."""
+        if self._offset == len(self._buffer):
+            self._buffer.clear()
+            self._offset = 0
+        elif self._offset >= self.COMPACT_THRESHOLD:
+            del self._buffer[: self._offset]
+            self._offset = 0
+
+    def getFrame(self) -> memoryview:
+        """Extract the next PDU frame from the buffer, discarding the leading MBAP header.
+
+        The frame is returned as a `memoryview` into the buffer to avoid copying it; it must be released before
+        the buffer is modified again.
+        """
+        start = self._offset + self._hsize - 1
+        return memoryview(self._buffer)[start : start + self._length - 1]
 
     def populateResult(self, result: ModbusPDU):
         """Populates the Modbus PDU object's metadata attributes from the decoded MBAP headers."""
@@ -212,18 +258,27 @@ class GivEnergyModbusFramer(ModbusFramer):
             data: Data from underlying transport.
             callback: Processor to receive newly-decoded PDUs.
         """
-        _logger.debug(f'Incoming {len(data)} bytes: {hexlify_packets(data)}')
+        debug = _logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            _logger.debug(f'Incoming {len(data)} bytes: {hexlify_packets(data)}')
         self.addToFrame(data)
         while True:
             if not self.isFrameReady():
-                _logger.debug('No more frames waiting, exiting')
+                if debug:
+                    _logger.debug('No more frames waiting, exiting')
                 break
-            if not self.checkFrame():
+            if self.checkFrame():
+                if debug:
+                    _logger.debug('Hand off to _process')
+                self._process(callback)
+            elif self._length and not self._isFrameComplete():
+                if debug:
+                    _logger.debug('Valid frame header but message is incomplete, waiting for more data')
+                break
+            else:
                 _logger.debug("Frame check failed, dropping and resetting!!")
+                self.metrics.increment('framer_resets')
                 self.resetFrame()
-            else:
-                _logger.debug('Hand off to _process')
-                self._process(callback)
 
     def _process(self, callback, error=False):
         """Process incoming packets irrespective error condition."""
@@ -234,13 +289,26 @@ class GivEnergyModbusFramer(ModbusFramer):
         #     if result.function_code < 0x80:
         #         raise InvalidMessageReceivedException(result)
         # else:
-        data = self.getFrame()
-        _logger.debug(f'getFrame() result: {hexlify(data)}')
-        result = self.decoder.decode(data)
+        with self.getFrame() as data:
+            if _logger.isEnabledFor(logging.DEBUG):
+                _logger.debug(f'getFrame() result: {hexlify(data)}')
+            try:
+                result = self.decoder.decode(data)
+            except Exception as e:
+                # a frame that can't be decoded must not take the rest of the buffer (and the transaction) with it;
+                # the exception isn't kept, as its traceback holds on to views of the buffer
+                _logger.warning(f'Unable to decode frame {hexlify(data)}: {e!r}')
+                decoded = False
+            else:
+                decoded = True
+        if not decoded:
+            self.metrics.increment('decode_errors')
+            self.advanceFrame()
+            return
         if result is None:
             _logger.warning('Unable to decode request')
             # raise ModbusIOException("Unable to decode request")
-        else:
+        elif _logger.isEnabledFor(logging.INFO):
             _logger.info(f'Decoded response {result}')
 
         self.populateResult(result)
@@ -251,20 +319,22 @@ class GivEnergyModbusFramer(ModbusFramer):
         """Reset the entire message buffer."""
         # try to mitigate corruption: if we can find the start of another MBAP header truncate the buffer
         # only up to that point
-        header_offset = self._buffer.find(b'\x59\x59\x00\x01', 1)
+        header_offset = self._buffer.find(b'\x59\x59\x00\x01', self._offset + 1)
         if header_offset > 0:
             _logger.info(
-                f'Found another MBAP header at offset {header_offset} in buffer {hexlify(self._buffer)}, '
-                'attempting recovery.'
+                f'Found another MBAP header at offset {header_offset - self._offset} in buffer '
+                f'{hexlify(self.getRawFrame())}, attempting recovery.'
             )
-            self._buffer = self._buffer[header_offset:]
+            self._offset = header_offset
+            self._compact()
         else:
-            self._buffer = b""
+            self._buffer.clear()
+            self._offset = 0
         self._length = 0
 
     def getRawFrame(self):
         """Returns the complete buffer."""
-        return self._buffer
+        return bytes(self._buffer[self._offset :])
 
     def buildPacket(self, message: ModbusPDU) -> bytes:
         """Creates a finalised GivEnergy Modbus packet from a constant header plus the encoded PDU."""
@@ -0,0 +1,203 @@
+"""Latency and outcome metrics for the transactions made by the clients.
+
+Every client records into a `ClientMetrics` instance, by default the process-wide `metrics` one:
+
+* a latency histogram per request, keyed by function code, base register (or the register written to) and slave
+  address;
+* how each request ended, e.g. `ok`, `timeout`, `error_response` or `error`, under the same keys;
+* counters for events not tied to a single request: connects, reconnects, validation failures, framer resets and
+  frames that could not be decoded.
+
+Inspect it in-process through `ClientMetrics.snapshot()`, or expose it for Prometheus to scrape with
+`start_metrics_server(port)`.
+"""
+from __future__ import annotations
+
+import bisect
+import logging
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, NamedTuple
+
+from givenergy_modbus.pdu import ModbusPDU
+
+_logger = logging.getLogger(__package__)
+
+# Upper bounds of the latency histogram buckets, in seconds. Responses from the data adapter typically take
+# somewhere between a few tens and a few hundreds of milliseconds.
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+OK = 'ok'  # got a (non-error) response
+TIMEOUT = 'timeout'  # got no response in time
+ERROR_RESPONSE = 'error_response'  # the device responded with an error
+ERROR = 'error'  # the transaction failed, e.g. the connection dropped
+
+
+class RequestKey(NamedTuple):
+    """What requests are grouped by in the metrics."""
+
+    function_code: int
+    base_register: int
+    slave_address: int
+
+    @classmethod
+    def for_pdu(cls, pdu: ModbusPDU) -> RequestKey:
+        """The key for a request (or its response)."""
+        register = getattr(pdu, 'base_register', None)
+        if register is None:
+            register = getattr(pdu, 'register', None)
+        return cls(pdu.function_code, register if register is not None else -1, pdu.slave_address)
+
+
+class Histogram:
+    """Cumulative histogram of observed values, Prometheus-style."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one counts values above the largest bucket
+        self.count = 0
+        self.sum = 0.0
+
+    def __repr__(self):
+        return f"Histogram(count={self.count}, sum={self.sum:.3f})"
+
+    def observe(self, value: float) -> None:
+        """Add a value to the histogram."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> list[tuple[float, int]]:
+        """`(upper bound, number of values <= upper bound)` for each bucket, ending with infinity."""
+        total = 0
+        result = []
+        for bound, count in zip((*self.buckets, float('inf')), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q: float) -> float | None:
+        """Estimate a quantile (0-1) of the observed values, as the upper bound of the bucket it falls in."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative_counts():
+            if total >= rank:
+                return bound
+        return float('inf')
+
+
+class ClientMetrics:
+    """Thread-safe store of client transaction metrics. See the module documentation."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.latencies: dict[RequestKey, Histogram] = {}
+        self.outcomes: dict[RequestKey, Counter[str]] = {}
+        self.events: Counter[str] = Counter()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"ClientMetrics(requests={sum(h.count for h in self.latencies.values())}, events={dict(self.events)})"
+
+    def record(self, request: ModbusPDU, outcome: str, latency: float | None = None) -> None:
+        """Record the outcome of a request, and how long its response took if there was one."""
+        key = RequestKey.for_pdu(request)
+        with self._lock:
+            self.outcomes.setdefault(key, Counter())[outcome] += 1
+            if latency is not None:
+                if key not in self.latencies:
+                    self.latencies[key] = Histogram(self.buckets)
+                self.latencies[key].observe(latency)
+
+    def increment(self, event: str, count: int = 1) -> None:
+        """Count an event not tied to a single request, e.g. `reconnects`."""
+        with self._lock:
+            self.events[event] += count
+
+    def reset(self) -> None:
+        """Forget everything recorded so far."""
+        with self._lock:
+            self.latencies.clear()
+            self.outcomes.clear()
+            self.events.clear()
+
+    def snapshot(self) -> dict[str, Any]:
+        """A JSON-friendly copy of the current metrics."""
+        with self._lock:
+            requests = []
+            for key in sorted(set(self.latencies) | set(self.outcomes)):
+                histogram = self.latencies.get(key)
+                requests.append(
+                    {
+                        **key._asdict(),
+                        'outcomes': dict(self.outcomes.get(key, {})),
+                        'count': histogram.count if histogram else 0,
+                        'mean': histogram.sum / histogram.count if histogram else None,
+                        'p50': histogram.quantile(0.5) if histogram else None,
+                        'p95': histogram.quantile(0.95) if histogram else None,
+                    }
+                )
+            return {'requests': requests, 'events': dict(self.events)}
+
+    def to_prometheus(self, prefix: str = 'givenergy_modbus') -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+
+        def labels(key: RequestKey, **extra) -> str:
+            pairs = {**{k: str(v) for k, v in key._asdict().items()}, **extra}
+            return '{' + ','.join(f'{k}="{v}"' for k, v in pairs.items()) + '}'
+
+        lines = []
+        with self._lock:
+            name = f'{prefix}_request_duration_seconds'
+            lines += [f'# HELP {name} Time taken for the data adapter to respond.', f'# TYPE {name} histogram']
+            for key, histogram in sorted(self.latencies.items()):
+                for bound, total in histogram.cumulative_counts():
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{labels(key, le=le)} {total}')
+                lines.append(f'{name}_sum{labels(key)} {histogram.sum}')
+                lines.append(f'{name}_count{labels(key)} {histogram.count}')
+
+            name = f'{prefix}_requests_total'
+            lines += [f'# HELP {name} Requests made, by outcome.', f'# TYPE {name} counter']
+            for key, outcomes in sorted(self.outcomes.items()):
+                for outcome, count in sorted(outcomes.items()):
+                    lines.append(f'{name}{labels(key, outcome=outcome)} {count}')
+
+            for event, count in sorted(self.events.items()):
+                name = f'{prefix}_{event}_total'
+                lines += [f'# TYPE {name} counter', f'{name} {count}']
+        return '\n'.join(lines) + '\n'
+
+
+metrics = ClientMetrics()  # where clients record to unless given their own
+
+
+def start_metrics_server(
+    port: int, host: str = '127.0.0.1', client_metrics: ClientMetrics = None
+) -> ThreadingHTTPServer:
+    """Serve metrics in the Prometheus text format over HTTP from a background thread.
+
+    Only local clients can connect by default; pass e.g. `host='0.0.0.0'` to let a Prometheus server elsewhere
+    scrape them. Call `shutdown()` on the returned server to stop it.
+    """
+    if client_metrics is None:
+        client_metrics = metrics
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802
+            body = client_metrics.to_prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # noqa: A002
+            _logger.debug(f'Metrics request from {self.address_string()}: {format % args}')
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='givenergy-modbus-metrics', daemon=True).start()
+    _logger.info(f'Serving metrics on http://{host}:{server.server_address[1]}/metrics')
+    return server
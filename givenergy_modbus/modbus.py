@@ -1,23 +1,21 @@
 from __future__ import annotations
 
 import logging
+import select
+import socket
+import time
+from typing import Mapping, Sequence
 
 from pymodbus.client import ModbusTcpClient
 from pymodbus.exceptions import ModbusIOException
 
+from givenergy_modbus import protocol
 from givenergy_modbus.decoder import GivEnergyResponseDecoder
 from givenergy_modbus.framer import GivEnergyModbusFramer
+from givenergy_modbus.metrics import ERROR, ERROR_RESPONSE, OK, TIMEOUT, ClientMetrics, metrics as default_metrics
 from givenergy_modbus.model.register import HoldingRegister, InputRegister  # type: ignore
-from givenergy_modbus.pdu import (
-    ModbusPDU,
-    ReadHoldingRegistersRequest,
-    ReadHoldingRegistersResponse,
-    ReadInputRegistersRequest,
-    ReadInputRegistersResponse,
-    WriteHoldingRegisterRequest,
-    WriteHoldingRegisterResponse,
-)
-from givenergy_modbus.transaction import GivEnergyTransactionManager
+from givenergy_modbus.pdu import ModbusPDU
+from givenergy_modbus.transaction import DEFAULT_MAX_IN_FLIGHT, GivEnergyTransactionManager
 
 _logger = logging.getLogger(__package__)
 
@@ -31,33 +29,138 @@ class GivEnergyModbusTcpClient(ModbusTcpClient):
     and TransactionManager throughout constructors up the call chain.
 
     We also provide a few convenience methods to read and write registers.
+
+    By default a connection is only torn down when something goes wrong, but a failed or timed out transaction
+    will still drop it. With `persistent=True` the client instead tries hard to keep a single long-lived
+    connection to the data adapter: the socket has TCP keepalive enabled so idle periods between polls don't let it
+    go stale, it gets a cheap health check before every transaction (detecting a remote close and discarding any
+    unsolicited data the adapter pushed in the meantime), missing responses no longer reset the socket, and
+    reconnects are retried with exponential backoff. Connection activity is tallied in `connection_stats`.
+
+    Requests sent through `pipeline` (and the `*_pipelined` helpers) don't wait for each other's responses: up to
+    `max_in_flight` of them are kept outstanding at once.
+
+    The latency and outcome of every transaction, as well as connection and validation events, are recorded in
+    `metrics` (by default the process-wide `givenergy_modbus.metrics.metrics`).
     """
 
-    def __init__(self, **kwargs):
+    def __init__(
+        self,
+        persistent: bool = False,
+        keepalive_idle: int = 30,
+        reconnect_attempts: int = 5,
+        reconnect_backoff: float = 0.5,
+        reconnect_backoff_max: float = 30.0,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        metrics: ClientMetrics = None,
+        **kwargs,
+    ):
         kwargs.setdefault("port", 8899)  # GivEnergy default instead of the standard 502
+        if persistent:
+            kwargs.setdefault("reset_socket", False)
         super().__init__(**kwargs)
-        self.framer = GivEnergyModbusFramer(GivEnergyResponseDecoder(), client=self)
-        self.transaction = GivEnergyTransactionManager(client=self, **kwargs)
+        self.metrics = metrics if metrics is not None else default_metrics
+        self.framer = GivEnergyModbusFramer(GivEnergyResponseDecoder(), client=self, metrics=self.metrics)
+        self.transaction = GivEnergyTransactionManager(client=self, max_in_flight=max_in_flight, **kwargs)
         self.timeout = 2
+        self.persistent = persistent
+        self.keepalive_idle = keepalive_idle
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_backoff = reconnect_backoff
+        self.reconnect_backoff_max = reconnect_backoff_max
+        self.connection_stats = {
+            'connects': 0,  # successfully established connections, including the first one
+            'reconnects': 0,  # connections established after a previous one was lost
+            'failed_connects': 0,  # connection attempts that failed
+            'stale_connections': 0,  # connections found closed by the remote end during health checks
+            'discarded_bytes': 0,  # unsolicited bytes drained from the socket during health checks
+        }
 
     def __repr__(self):
         return f"GivEnergyModbusTcpClient({self.host}:{self.port}): timeout={self.timeout})"
 
+    def connect(self) -> bool:
+        """Connect to the data adapter, if not already connected.
+
+        In persistent mode an existing connection is health-checked first, and failed connection attempts are
+        retried with exponential backoff.
+        """
+        if self.socket and self.persistent:
+            self._check_connection()
+        if self.socket:
+            return True
+
+        attempts = self.reconnect_attempts if self.persistent else 1
+        backoff = self.reconnect_backoff
+        for attempt in range(attempts):
+            if super().connect():
+                if self.connection_stats['connects']:
+                    self.connection_stats['reconnects'] += 1
+                    self.metrics.increment('reconnects')
+                self.connection_stats['connects'] += 1
+                self.metrics.increment('connects')
+                if self.persistent:
+                    self._enable_keepalive()
+                return True
+            self.connection_stats['failed_connects'] += 1
+            if attempt + 1 < attempts:
+                _logger.info(f'Connection attempt {attempt + 1}/{attempts} failed, retrying in {backoff:.1f}s')
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.reconnect_backoff_max)
+        return False
+
+    def _enable_keepalive(self) -> None:
+        """Enable TCP keepalive probes on the socket so an idle connection is kept open and dead peers detected."""
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for option, value in (('TCP_KEEPIDLE', self.keepalive_idle), ('TCP_KEEPINTVL', 10), ('TCP_KEEPCNT', 3)):
+            if hasattr(socket, option):  # not available on all platforms
+                self.socket.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+    def _check_connection(self) -> None:
+        """Check the socket is still usable, closing it if the remote end has gone away.
+
+        Anything already waiting to be read can only be unsolicited (e.g. heartbeats) or a late response to an
+        earlier request, so it is drained to stop it being mistaken for the response to the next request.
+        """
+        try:
+            while select.select([self.socket], [], [], 0)[0]:
+                data = self.socket.recv(4096)
+                if not data:
+                    _logger.info('Connection closed by remote end, reconnecting')
+                    self.connection_stats['stale_connections'] += 1
+                    self.close()
+                    return
+                _logger.debug(f'Discarding {len(data)} unsolicited bytes')
+                self.connection_stats['discarded_bytes'] += len(data)
+        except (OSError, ValueError) as e:
+            _logger.info(f'Connection is unusable ({e}), reconnecting')
+            self.connection_stats['stale_connections'] += 1
+            self.close()
+
     def execute(self, request: ModbusPDU = None) -> ModbusPDU | None:
         """Send the given PDU to the remote device and return any PDU returned in response."""
-        _logger.debug(f'Sending request {request}')
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug(f'Sending request {request}')
+        start = time.monotonic()
         try:
             response = super().execute(request)
             if isinstance(response, ModbusIOException):
                 _logger.exception(response)
+                self.metrics.record(request, TIMEOUT)
+            elif getattr(response, 'error', False):
+                self.metrics.record(request, ERROR_RESPONSE, time.monotonic() - start)
+            else:
+                self.metrics.record(request, OK, time.monotonic() - start)
             return response
         except ModbusIOException as e:
             _logger.exception(e)
+            self.metrics.record(request, TIMEOUT)
             self.close()
             return None
         except Exception as e:
             # This seems to help with inverters becoming unresponsive from the portal."""
             _logger.exception(e)
+            self.metrics.record(request, ERROR)
             self.close()
             return None
 
@@ -65,35 +168,7 @@ class GivEnergyModbusTcpClient(ModbusTcpClient):
         self, kind: type[HoldingRegister | InputRegister], base_address: int, register_count: int, **kwargs
     ) -> dict[int, int]:
         """Read out registers from the correct location depending on type specified."""
-        # match types of register to their request/response types
-        t_req, t_res = {
-            HoldingRegister: (ReadHoldingRegistersRequest, ReadHoldingRegistersResponse),
-            InputRegister: (ReadInputRegistersRequest, ReadInputRegistersResponse),
-        }[kind]
-
-        request = t_req(base_register=base_address, register_count=register_count, **kwargs)
-        _logger.debug(
-            f'Attempting to read {t_req}s #{request.base_register}-'
-            f'{request.base_register + request.register_count} from device {hex(request.slave_address)}...'
-        )
-        response = self.execute(request)
-        if response and isinstance(response, t_res):
-            if response.base_register != base_address:
-                _logger.debug(
-                    f'Returned base register ({response.base_register}) '
-                    f'does not match that from request ({base_address}).'
-                )
-                return {}
-            if response.register_count != register_count:
-                _logger.debug(
-                    f'Returned register count ({response.register_count}) '
-                    f'does not match that from request ({register_count}).'
-                )
-                return {}
-            return response.to_dict()
-        _logger.debug(f'Did not receive expected response type: {t_res.__name__} != {response.__class__.__name__}')
-        # FIXME this contract needs improving
-        return {}
+        return self._run(protocol.read_registers(kind, base_address, register_count, self.metrics, **kwargs))
 
     def read_holding_registers(self, address, count=1, **kwargs) -> dict[int, int]:
         """Convenience method to help read out holding registers."""
@@ -105,15 +180,49 @@ class GivEnergyModbusTcpClient(ModbusTcpClient):
 
     def write_holding_register(self, register: HoldingRegister, value: int) -> None:
         """Write a value to a single holding register."""
-        if not register.write_safe:  # type: ignore  # shut up mypy
-            raise ValueError(f'Register {register.name} is not safe to write to')
-        if value != value & 0xFFFF:
-            raise ValueError(f'Value {value} must fit in 2 bytes')
-        _logger.info(f'Attempting to write {value}/{hex(value)} to Holding Register {register.value}/{register.name}')
-        request = WriteHoldingRegisterRequest(register=register.value, value=value)
-        result = self.execute(request)
-        if isinstance(result, WriteHoldingRegisterResponse):
-            if result.value != value:
-                raise AssertionError(f'Register read-back value 0x{result.value:04x} != written value 0x{value:04x}')
-        else:
-            raise AssertionError(f'Unexpected response from remote end: {result}')
+        self._run(protocol.write_holding_register(register, value))
+
+    def write_holding_registers(self, values: Mapping[HoldingRegister, int]) -> None:
+        """Write values to several holding registers, in the given order.
+
+        The write requests are pipelined: they are sent back to back over a single connection, up to `max_in_flight`
+        at a time, and the read-backs are collected and checked together afterwards. Any write that doesn't get a
+        read-back (e.g. because the data adapter dropped a request) is retried on its own through
+        `write_holding_register`.
+        """
+        self._run(protocol.write_holding_registers(values))
+
+    def read_registers_pipelined(
+        self,
+        requests: Sequence[tuple[type[HoldingRegister | InputRegister], int, int, int]],
+        max_in_flight: int = None,
+        timeout: float = None,
+        probe: bool = False,
+    ) -> list[dict[int, int]]:
+        """Read several ranges of registers, possibly from different devices, with pipelined requests.
+
+        Each request is a `(kind, base_address, register_count, slave_address)` tuple. Returns the register values
+        read for each request, in the same order; ranges that could not be read map to an empty dict, as with
+        `read_registers`. See `givenergy_modbus.protocol.Pipeline` for the other arguments.
+        """
+        return self._run(protocol.read_registers_pipelined(requests, max_in_flight, timeout, probe))
+
+    def pipeline(
+        self, requests: Sequence[ModbusPDU], max_in_flight: int = None, timeout: float = None, probe: bool = False
+    ) -> list:
+        """Send requests back to back over one connection. See `GivEnergyTransactionManager.pipeline`."""
+        return self.transaction.pipeline(requests, max_in_flight=max_in_flight, timeout=timeout, probe=probe)
+
+    def _run(self, steps: protocol.Steps):
+        """Carry out the operations of a `givenergy_modbus.protocol` generator over this connection."""
+        return protocol.run(steps, self.perform)
+
+    def perform(self, operation):
+        """Carry out a single `givenergy_modbus.protocol` operation and return its result."""
+        if isinstance(operation, protocol.Execute):
+            return self.execute(operation.request)
+        if isinstance(operation, protocol.Pipeline):
+            return self.pipeline(**operation._asdict())
+        if isinstance(operation, protocol.Sleep):
+            return time.sleep(operation.seconds)
+        raise ValueError(f'Unknown operation {operation!r}')
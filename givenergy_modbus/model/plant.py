@@ -1,17 +1,22 @@
-from typing import List
+from typing import Any, List, Optional, Tuple, Union
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
 from givenergy_modbus.model.battery import Battery
 from givenergy_modbus.model.inverter import Inverter  # type: ignore  # shut up mypy
-from givenergy_modbus.model.register_cache import RegisterCache
+from givenergy_modbus.model.register_cache import RegisterBank, RegisterCache
+from givenergy_modbus.model.snapshot import BatterySnapshot, InverterSnapshot
 
 
 class Plant(BaseModel):
     """Representation of a complete GivEnergy plant."""
 
-    inverter_rc: RegisterCache
-    batteries_rcs: List[RegisterCache]
+    inverter_rc: Union[RegisterBank, RegisterCache]
+    batteries_rcs: List[Union[RegisterBank, RegisterCache]]
+
+    # models built from the register caches, alongside the cache and the version of it they were built from
+    _inverter: Optional[Tuple[Any, int, Inverter]] = PrivateAttr(default=None)
+    _batteries: List[Tuple[Any, int, Battery]] = PrivateAttr(default_factory=list)
 
     class Config:  # noqa: D106
         arbitrary_types_allowed = True
@@ -19,19 +24,54 @@ class Plant(BaseModel):
         # allow_mutation = False
 
     def __init__(self, **data):
-        """Constructor. Use `number_batteries` to specify the total number of batteries installed."""
-        data['inverter_rc'] = data.get('inverter_rc', RegisterCache())
+        """Constructor.
+
+        Use `number_batteries` to specify the total number of batteries installed, and `register_cache_type` to
+        hold register data in something other than a `RegisterCache` (e.g. `RegisterBank`).
+        """
+        register_cache_type = data.pop('register_cache_type', RegisterCache)
+        data['inverter_rc'] = data.get('inverter_rc', register_cache_type())
         data['batteries_rcs'] = data.get(
-            'batteries_rcs', [RegisterCache() for _ in range(data.get('number_batteries', 0))]
+            'batteries_rcs', [register_cache_type() for _ in range(data.get('number_batteries', 0))]
         )
         super().__init__(**data)
 
     @property
     def inverter(self) -> Inverter:
-        """Return Inverter model for the Plant."""
-        return Inverter.from_orm(self.inverter_rc)
+        """Return Inverter model for the Plant.
+
+        The model is only rebuilt when the underlying register cache has been updated since the last access.
+        """
+        rc = self.inverter_rc
+        if self._inverter is None or self._inverter[0] is not rc or self._inverter[1] != rc.version:
+            self._inverter = (rc, rc.version, Inverter.from_orm(rc))
+        return self._inverter[2]
 
     @property
     def batteries(self) -> List[Battery]:
-        """Return Battery models for the Plant."""
-        return [Battery.from_orm(rc) for rc in self.batteries_rcs]
+        """Return Battery models for the Plant.
+
+        Each model is only rebuilt when its underlying register cache has been updated since the last access.
+        """
+        cached = self._batteries
+        batteries = []
+        for i, rc in enumerate(self.batteries_rcs):
+            if i >= len(cached) or cached[i][0] is not rc or cached[i][1] != rc.version:
+                entry = (rc, rc.version, Battery.from_orm(rc))
+                if i < len(cached):
+                    cached[i] = entry
+                else:
+                    cached.append(entry)
+            batteries.append(cached[i][2])
+        del cached[len(self.batteries_rcs) :]
+        return batteries
+
+    @property
+    def inverter_snapshot(self) -> InverterSnapshot:
+        """Return an unvalidated InverterSnapshot for the Plant, which is much cheaper to build than the model."""
+        return InverterSnapshot.from_registers(self.inverter_rc)
+
+    @property
+    def battery_snapshots(self) -> List[BatterySnapshot]:
+        """Return unvalidated BatterySnapshots for the Plant, which are much cheaper to build than the models."""
+        return [BatterySnapshot.from_registers(rc) for rc in self.batteries_rcs]
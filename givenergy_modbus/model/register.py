@@ -2,7 +2,8 @@
 import logging
 from datetime import time
 from enum import Enum, auto, unique
-from typing import Any
+from functools import lru_cache
+from typing import Any, Callable
 
 _logger = logging.getLogger(__package__)
 
@@ -24,55 +25,67 @@ class Type(Enum):
     PERCENT = auto()  # same as UINT16, but might be useful for rendering
     POWER_FACTOR = auto()  # zero point at 10^4, scale factor 10^4
 
-    def convert(self, value: int, scaling: int) -> Any:
-        """Convert `val` to its true value as determined by the type and scaling definitions."""
+    def converter(self, scaling: int) -> Callable[[int], Any]:
+        """Build a function converting raw values to their true value as determined by the type and scaling.
+
+        This does all the dispatching on type and scaling up front, so the returned function only does the arithmetic.
+        """
         if self == self.UINT32_HIGH:
             # shift MSB half of the 32-bit int left
             if scaling != 1:
-                return (value << 16) / scaling
-            return value << 16
+                return lambda value: (value << 16) / scaling
+            return lambda value: value << 16
 
         if self == self.INT16:
             # Subtract 2^n if bit n-1 is set:
-            if value & (1 << (16 - 1)):
-                value -= 1 << 16
             if scaling != 1:
-                return value / scaling
-            return value
+                return lambda value: (value - 0x10000 if value & 0x8000 else value) / scaling
+            return lambda value: value - 0x10000 if value & 0x8000 else value
 
         if self == self.BOOL:  # TODO is this the correct assumption?
-            return bool(value)
+            return bool
 
         if self == self.TIME:
-            # Convert a BCD-encoded int into datetime.time."""
-            return time(hour=int(f'{value:04}'[:2]), minute=int(f'{value:04}'[2:]) % 60)
+            # Convert a BCD-encoded int into datetime.time. Like the original string slicing of f'{value:04}', the hour
+            # is taken from the two leading digits of out-of-range 5-digit values.
+            def bcd_time(value: int) -> time:
+                hour, minute = divmod(value, 1000 if value >= 10000 else 100)
+                return time(hour=hour, minute=minute % 60)
+
+            return bcd_time
 
         if self == self.ASCII:
-            return value.to_bytes(2, byteorder='big').decode(encoding='ascii')
+            return lambda value: value.to_bytes(2, byteorder='big').decode(encoding='ascii')
 
         if self == self.UINT8:
-            return value & 0xFF
+            return lambda value: value & 0xFF
 
         if self == self.DUINT8:
-            return (value >> 8), (value & 0xFF)
+            return lambda value: ((value >> 8), (value & 0xFF))
 
         if self == self.POWER_FACTOR:
-            return (value - 10_000) / 10_000
+            return lambda value: (value - 10_000) / 10_000
 
         if self == self.BITFIELD:
-            return value  # scaling makes no sense
+            return lambda value: value  # scaling makes no sense
 
         if self == self.HEX:
-            return f'{value:04x}'  # scaling makes no sense
+            return lambda value: f'{value:04x}'  # scaling makes no sense
 
         if scaling != 1:
-            return value / scaling
-        return value
+            return lambda value: value / scaling
+        return lambda value: value
+
+    def convert(self, value: int, scaling: int) -> Any:
+        """Convert `val` to its true value as determined by the type and scaling definitions."""
+        return _converter(self, scaling)(value)
 
     def repr(self, value: Any, scaling: float, unit: str = '') -> str:
         """Return user-friendly representation of scaled `val` as appropriate for the data type."""
-        v = self.convert(value, scaling)
+        return self.format(self.convert(value, scaling), unit)
 
+    def format(self, v: Any, unit: str = '') -> str:
+        """Return user-friendly representation of already converted value `v`."""
         if unit:
             unit = f' {unit}'
 
@@ -95,6 +108,11 @@ class Type(Enum):
         return f'{v}{unit}'
 
 
+@lru_cache(maxsize=None)
+def _converter(type_: Type, scaling: int) -> Callable[[int], Any]:
+    return type_.converter(scaling)
+
+
 class Scaling(Enum):
     """What scaling factor needs to be applied to a register's value.
 
@@ -141,6 +159,9 @@ class Register(str, Enum):
         obj.unit = data.get('unit', Unit.NONE)
         obj.description = data.get('description', None)
         obj.write_safe = data.get('write_safe', False)
+        # `convert(val)` converts val to its true representation as determined by the register type. It is compiled
+        # once per register, so conversions skip dispatching on type and looking up scaling every time.
+        obj.convert = _converter(obj.type, obj.scaling.value)
         return obj
 
     def __str__(self) -> str:
@@ -149,13 +170,9 @@ class Register(str, Enum):
     def __repr__(self) -> str:
         return self.__str__()
 
-    def convert(self, val):
-        """Convert val to its true representation as determined by the register type."""
-        return self.type.convert(val, self.scaling.value)
-
     def repr(self, val):
         """Convert val to its true representation as determined by the register type."""
-        return self.type.repr(val, self.scaling.value, self.unit.value)
+        return self.type.format(self.convert(val), self.unit.value)
 
 
 class HoldingRegister(Register):
@@ -1,17 +1,56 @@
 from __future__ import annotations
 
 import json
+import time
+from array import array
+from typing import Iterator, Mapping, Sequence
 
 from givenergy_modbus.model.register import HoldingRegister, InputRegister, Register  # type: ignore  # shut up mypy
+from givenergy_modbus.model.register_getter import DERIVED_ATTRIBUTES
 
 
-class RegisterCache(dict):
+def registers_for_attribute(item: str) -> list[Register]:
+    """Return the Registers whose values are needed to compute the named attribute, or an empty list if unknown.
+
+    This resolves attributes the same way `RegisterCache.__getattr__` and `RegisterGetter` do: directly by register
+    name, through `_H`/`_L` register pairs, or by expanding derived attributes into their constituents.
+    """
+    if item in DERIVED_ATTRIBUTES:
+        return [r for constituent in DERIVED_ATTRIBUTES[item] for r in registers_for_attribute(constituent)]
+    item_upper = item.upper()
+    for register_type in (HoldingRegister, InputRegister):
+        if item_upper in register_type.__members__:
+            return [register_type.__members__[item_upper]]
+        if item_upper + '_H' in register_type.__members__ and item_upper + '_L' in register_type.__members__:
+            return [register_type.__members__[item_upper + '_H'], register_type.__members__[item_upper + '_L']]
+    return []
+
+
+class _RegisterDebugMixin:
+    """Debugging helpers shared by `RegisterCache` and `RegisterBank`, which both iterate over `items()`."""
+
+    def debug(self):
+        """Dump the internal state of registers and their value representations."""
+        class_name = ''
+
+        for r, v in self.items():
+            if class_name != r.__class__.__name__:
+                class_name = r.__class__.__name__
+                print('### ' + class_name + ' ' + '#' * 100)
+            print(f'{r} {r.name:>35}: {r.repr(v):20}  |  ' f'{r.type.name:15}  {r.scaling.name:5}  0x{v:04x}  {v:10}')
+
+
+class RegisterCache(_RegisterDebugMixin, dict):
     """Holds a cache of Registers populated after querying a device."""
 
     def __init__(self, registers=None) -> None:
         if registers is None:
             registers = {}
         super().__init__(registers)
+        # bumped every time set_registers() updates the cache, so derived data can tell when it is out of date
+        self.version = 0
+        # when each register was last updated through set_registers(), as per time.monotonic()
+        self._updated_at: dict[Register, float] = {}
         self._register_lookup_table: dict[str, Register] = {}
         for k, v in InputRegister.__members__.items():
             self._register_lookup_table[k] = v
@@ -35,8 +74,19 @@ class RegisterCache(dict):
 
     def set_registers(self, type_: type[Register], registers: dict[int, int]):
         """Update internal holding register cache with given values."""
+        now = time.monotonic()
         for k, v in registers.items():
-            self[type_(k)] = v
+            register = type_(k)
+            self[register] = v
+            self._updated_at[register] = now
+        self.version += 1
+
+    def register_age(self, register: Register) -> float | None:
+        """Seconds since the given register was last updated by `set_registers()`, or None if it never was."""
+        updated_at = self._updated_at.get(register)
+        if updated_at is None:
+            return None
+        return time.monotonic() - updated_at
 
     def to_json(self) -> str:
         """Return JSON representation of the register cache, suitable for using with `from_json()`."""
@@ -57,12 +107,131 @@ class RegisterCache(dict):
 
         return cls(registers=json.loads(data, object_hook=register_object_hook))
 
-    def debug(self):
-        """Dump the internal state of registers and their value representations."""
-        class_name = ''
 
-        for r, v in self.items():
-            if class_name != r.__class__.__name__:
-                class_name = r.__class__.__name__
-                print('### ' + class_name + ' ' + '#' * 100)
-            print(f'{r} {r.name:>35}: {r.repr(v):20}  |  ' f'{r.type.name:15}  {r.scaling.name:5}  0x{v:04x}  {v:10}')
+# Flat lookup of register names to Registers, and of register type prefixes (as used in the JSON form) to types.
+_REGISTER_LOOKUP_TABLE: dict[str, Register] = {**InputRegister.__members__, **HoldingRegister.__members__}
+_REGISTER_TYPE_LOOKUP: dict[str, type[Register]] = {'HR': HoldingRegister, 'IR': InputRegister}
+# Register names mapped to where each register lives in a RegisterBank, avoiding repeated Enum attribute lookups.
+_REGISTER_LOCATIONS: dict[str, tuple[Register, type[Register], int]] = {
+    k: (r, type(r), r.value) for k, r in _REGISTER_LOOKUP_TABLE.items()
+}
+_REGISTER_INDICES: dict[Register, tuple[type[Register], int]] = {r: (t, i) for r, t, i in _REGISTER_LOCATIONS.values()}
+# Number of registers each bank can hold, rounded up to whole 60-register pages.
+_BANK_SIZES: dict[type[Register], int] = {
+    t: (max(t._value2member_map_) // 60 + 1) * 60 for t in (HoldingRegister, InputRegister)
+}
+
+
+class RegisterBank(_RegisterDebugMixin):
+    """Holds the Registers populated after querying a device, in flat arrays indexed by register number.
+
+    This is an alternative to `RegisterCache` with the same attribute and JSON interface. Values live in one
+    fixed-size `array('H')` per register type, alongside a bitmap tracking which registers have been populated, so
+    storing a freshly read page is a single slice assignment and reading a register is an index lookup.
+    """
+
+    def __init__(self, registers: Mapping[Register, int] = None) -> None:
+        self._values: dict[type[Register], array] = {t: array('H', bytes(2 * n)) for t, n in _BANK_SIZES.items()}
+        self._valid: dict[type[Register], int] = {t: 0 for t in _BANK_SIZES}
+        # bumped every time set_registers() updates the bank, so derived data can tell when it is out of date
+        self.version = 0
+        # when each register was last updated through set_registers(), as per time.monotonic(), or 0 if it never was
+        self._updated_at: dict[type[Register], array] = {t: array('d', bytes(8 * n)) for t, n in _BANK_SIZES.items()}
+        if registers:
+            for k, v in registers.items():
+                self[k] = v
+
+    def __getattr__(self, item: str):
+        """Magic attributes that try to look up and convert register values."""
+        item_upper = item.upper()
+        location = _REGISTER_LOCATIONS.get(item_upper)
+        if location is not None:
+            register, register_type, index = location
+            if self._valid[register_type] >> index & 1:
+                return register.convert(self._values[register_type][index])
+            raise KeyError(register)
+        if item[0] == '_':
+            raise AttributeError(item)
+        location_h = _REGISTER_LOCATIONS.get(item_upper + '_H')
+        location_l = _REGISTER_LOCATIONS.get(item_upper + '_L')
+        if location_h is not None and location_l is not None:
+            return location_l[0].convert((self._get(*location_h) << 16) + self._get(*location_l))
+        raise KeyError(item)
+
+    def _get(self, register: Register, register_type: type[Register], index: int) -> int:
+        if self._valid[register_type] >> index & 1:
+            return self._values[register_type][index]
+        raise KeyError(register)
+
+    def __getitem__(self, register: Register) -> int:
+        register_type, index = _REGISTER_INDICES[register]
+        if self._valid[register_type] >> index & 1:
+            return self._values[register_type][index]
+        raise KeyError(register)
+
+    def __setitem__(self, register: Register, value: int) -> None:
+        self._values[type(register)][register.value] = value
+        self._valid[type(register)] |= 1 << register.value
+
+    def __contains__(self, register: object) -> bool:
+        return isinstance(register, Register) and bool(self._valid[type(register)] >> register.value & 1)
+
+    def __len__(self) -> int:
+        return sum(bin(valid).count('1') for valid in self._valid.values())
+
+    def __iter__(self) -> Iterator[Register]:
+        return (r for r, _ in self.items())
+
+    def items(self) -> Iterator[tuple[Register, int]]:
+        """Iterate over all populated registers and their raw values."""
+        for register_type, values in self._values.items():
+            valid = self._valid[register_type]
+            lookup = register_type._value2member_map_
+            for index, value in enumerate(values):
+                if valid >> index & 1 and index in lookup:
+                    yield lookup[index], value
+
+    def set_register_page(self, type_: type[Register], base_register: int, values: Sequence[int]) -> None:
+        """Store a contiguous run of register values starting at `base_register`."""
+        end = base_register + len(values)
+        if not 0 <= base_register <= end <= _BANK_SIZES[type_]:
+            raise IndexError(f'{type_.__name__}s {base_register}-{end} do not fit in the register bank')
+        self._values[type_][base_register:end] = array('H', values)
+        self._valid[type_] |= ((1 << len(values)) - 1) << base_register
+
+    def set_registers(self, type_: type[Register], registers: dict[int, int]):
+        """Update internal holding register cache with given values."""
+        if not registers:
+            return
+        base_register = next(iter(registers))
+        now = time.monotonic()
+        if list(registers) == list(range(base_register, base_register + len(registers))):
+            # the common case of a page read back from the device
+            self.set_register_page(type_, base_register, list(registers.values()))
+            self._updated_at[type_][base_register : base_register + len(registers)] = array('d', [now]) * len(registers)
+        else:
+            updated_at = self._updated_at[type_]
+            for k, v in registers.items():
+                self[type_(k)] = v
+                updated_at[k] = now
+        self.version += 1
+
+    def register_age(self, register: Register) -> float | None:
+        """Seconds since the given register was last updated by `set_registers()`, or None if it never was."""
+        updated_at = self._updated_at[type(register)][register.value]
+        if not updated_at:
+            return None
+        return time.monotonic() - updated_at
+
+    def to_json(self) -> str:
+        """Return JSON representation of the register bank, suitable for using with `from_json()`."""
+        return json.dumps({f'{r.__class__.__name__[0]}R:{r.value}': v for r, v in self.items()})
+
+    @classmethod
+    def from_json(cls, data: str) -> RegisterBank:
+        """Instantiate a RegisterBank from its JSON form, as produced by itself or `RegisterCache.to_json()`."""
+        bank = cls()
+        for k, v in json.loads(data).items():
+            reg, idx = k.split(':', maxsplit=1)
+            bank[_REGISTER_TYPE_LOOKUP[reg](int(idx))] = v
+        return bank
@@ -1,67 +1,60 @@
 from datetime import datetime
-from typing import Any
+from typing import Any, Callable, Dict, Tuple
 
 from pydantic.utils import GetterDict
 
+_SERIAL_NUMBER_PARTS = ('_1_2', '_3_4', '_5_6', '_7_8', '_9_10')
+_SYSTEM_TIME_PARTS = ('_year', '_month', '_day', '_hour', '_minute', '_second')
+
+
+def _serial_number(*parts: str) -> str:
+    return ''.join(parts)
+
+
+def _system_time(year: int, month: int, day: int, hour: int, minute: int, second: int) -> datetime:
+    return datetime(year + 2000, month, day, hour, minute, second)
+
+
+def _firmware_version(dsp_firmware_version: int, arm_firmware_version: int) -> str:
+    return f'D0.{dsp_firmware_version}-A0.{arm_firmware_version}'
+
+
+# Virtual attributes computed by `RegisterGetter`: the attributes each one is computed from, and how.
+_COMPUTED_ATTRIBUTES: Dict[str, Tuple[Tuple[str, ...], Callable[..., Any]]] = {
+    'inverter_serial_number': (tuple(f'inverter_serial_number{p}' for p in _SERIAL_NUMBER_PARTS), _serial_number),
+    'battery_serial_number': (tuple(f'battery_serial_number{p}' for p in _SERIAL_NUMBER_PARTS), _serial_number),
+    'first_battery_serial_number': (
+        tuple(f'first_battery_serial_number{p}' for p in _SERIAL_NUMBER_PARTS),
+        _serial_number,
+    ),
+    'num_mppt': (('num_mppt_and_num_phases',), lambda num_mppt_and_num_phases: num_mppt_and_num_phases[0]),
+    'num_phases': (('num_mppt_and_num_phases',), lambda num_mppt_and_num_phases: num_mppt_and_num_phases[1]),
+    'system_time': (tuple(f'system_time{p}' for p in _SYSTEM_TIME_PARTS), _system_time),
+    'charge_slot_1': (('charge_slot_1_start', 'charge_slot_1_end'), lambda start, end: (start, end)),
+    'charge_slot_2': (('charge_slot_2_start', 'charge_slot_2_end'), lambda start, end: (start, end)),
+    'discharge_slot_1': (('discharge_slot_1_start', 'discharge_slot_1_end'), lambda start, end: (start, end)),
+    'discharge_slot_2': (('discharge_slot_2_start', 'discharge_slot_2_end'), lambda start, end: (start, end)),
+    'inverter_firmware_version': (('dsp_firmware_version', 'arm_firmware_version'), _firmware_version),
+}
+
+# Virtual attributes that are not backed by a register of their own, and the attributes they get computed from.
+DERIVED_ATTRIBUTES: Dict[str, Tuple[str, ...]] = {
+    **{name: constituents for name, (constituents, _) in _COMPUTED_ATTRIBUTES.items()},
+    # computed by root validators on the Inverter model
+    'firmware_version': ('dsp_firmware_version', 'arm_firmware_version'),
+    'inverter_model': ('inverter_serial_number',),
+}
+
 
 class RegisterGetter(GetterDict):
     """GetterDict implementation to consolidate register data structures."""
 
     def get(self, key: Any, default: Any = None) -> Any:
         """Getter that computes some virtual attributes."""
-        if key == "inverter_serial_number":
-            return ''.join(
-                [
-                    self.get('inverter_serial_number_1_2'),
-                    self.get('inverter_serial_number_3_4'),
-                    self.get('inverter_serial_number_5_6'),
-                    self.get('inverter_serial_number_7_8'),
-                    self.get('inverter_serial_number_9_10'),
-                ]
-            )
-        if key in ["num_mppt", 'num_phases']:
-            obj = self.get('num_mppt_and_num_phases')
-            if obj == default:
-                return default
-            elif key == "num_mppt":
-                return obj[0]
-            return obj[1]
-        if key == "battery_serial_number":
-            return ''.join(
-                [
-                    self.get('battery_serial_number_1_2'),
-                    self.get('battery_serial_number_3_4'),
-                    self.get('battery_serial_number_5_6'),
-                    self.get('battery_serial_number_7_8'),
-                    self.get('battery_serial_number_9_10'),
-                ]
-            )
-        if key == "first_battery_serial_number":
-            return ''.join(
-                [
-                    self.get('first_battery_serial_number_1_2'),
-                    self.get('first_battery_serial_number_3_4'),
-                    self.get('first_battery_serial_number_5_6'),
-                    self.get('first_battery_serial_number_7_8'),
-                    self.get('first_battery_serial_number_9_10'),
-                ]
-            )
-        # Some special cases first
-        if key == "system_time":
-            return datetime(
-                self.get('system_time_year') + 2000,
-                self.get('system_time_month'),
-                self.get('system_time_day'),
-                self.get('system_time_hour'),
-                self.get('system_time_minute'),
-                self.get('system_time_second'),
-            )
-
-        if key in ('charge_slot_1', 'charge_slot_2', 'discharge_slot_1', 'discharge_slot_2'):
-            return self.get(f'{key}_start'), self.get(f'{key}_end')
-
-        if key == "inverter_firmware_version":
-            return f'D0.{self.get("dsp_firmware_version")}-A0.{self.get("arm_firmware_version")}'
+        computed = _COMPUTED_ATTRIBUTES.get(key)
+        if computed is not None:
+            constituents, compute = computed
+            return compute(*(self.get(constituent) for constituent in constituents))
 
         # if key == 'modbus_version':
         #     return f'{self.get("modbus_version"):0.2f}'
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Callable, ClassVar, Mapping
+
+from givenergy_modbus.model.battery import Battery
+from givenergy_modbus.model.inverter import Inverter, Model  # type: ignore  # shut up mypy
+from givenergy_modbus.model.register import Register  # type: ignore  # shut up mypy
+from givenergy_modbus.model.register_cache import registers_for_attribute
+
+Extractor = Callable[[Mapping[Register, int]], Any]
+
+
+def _register_extractor(name: str) -> Extractor:
+    """Build a function that reads and converts the named attribute directly from a register cache or bank."""
+    registers = registers_for_attribute(name)
+    if len(registers) == 1 and registers[0].name == name.upper():
+        register = registers[0]
+        convert = register.convert
+        return lambda rc: convert(rc[register])
+    if len(registers) == 2 and registers[1].name == name.upper() + '_L':
+        register_h, register_l = registers
+        convert = register_l.convert
+        return lambda rc: convert((rc[register_h] << 16) + rc[register_l])
+    raise ValueError(f'Cannot determine registers for attribute {name}')
+
+
+def _coerced(extractor: Extractor, type_: type) -> Extractor:
+    return lambda rc: type_(extractor(rc))
+
+
+def _joined(*names: str) -> Extractor:
+    parts = [_register_extractor(n) for n in names]
+    return lambda rc: ''.join([p(rc) for p in parts])
+
+
+def _serial_number(name: str) -> Extractor:
+    return _joined(*(f'{name}_{p}' for p in ('1_2', '3_4', '5_6', '7_8', '9_10')))
+
+
+def _pair(first: str, second: str) -> Extractor:
+    first_extractor, second_extractor = _register_extractor(first), _register_extractor(second)
+    return lambda rc: (first_extractor(rc), second_extractor(rc))
+
+
+def _element(name: str, index: int) -> Extractor:
+    extractor = _register_extractor(name)
+    return lambda rc: extractor(rc)[index]
+
+
+def _system_time() -> Extractor:
+    parts = [_register_extractor(f'system_time_{p}') for p in ('year', 'month', 'day', 'hour', 'minute', 'second')]
+    year, month, day, hour, minute, second = parts
+    return lambda rc: datetime(year(rc) + 2000, month(rc), day(rc), hour(rc), minute(rc), second(rc))
+
+
+def _firmware_version() -> Extractor:
+    dsp, arm = _register_extractor('dsp_firmware_version'), _register_extractor('arm_firmware_version')
+    return lambda rc: f'D0.{dsp(rc)}-A0.{arm(rc)}'
+
+
+def _inverter_model() -> Extractor:
+    serial_number = _serial_number('inverter_serial_number')
+    return lambda rc: Model.from_serial_number(serial_number(rc))
+
+
+# Builders for the virtual attributes computed by RegisterGetter and the models' root validators.
+_DERIVED_EXTRACTORS: dict[str, Callable[[], Extractor]] = {
+    'inverter_serial_number': lambda: _serial_number('inverter_serial_number'),
+    'battery_serial_number': lambda: _serial_number('battery_serial_number'),
+    'first_battery_serial_number': lambda: _serial_number('first_battery_serial_number'),
+    'num_mppt': lambda: _element('num_mppt_and_num_phases', 0),
+    'num_phases': lambda: _element('num_mppt_and_num_phases', 1),
+    'system_time': _system_time,
+    'charge_slot_1': lambda: _pair('charge_slot_1_start', 'charge_slot_1_end'),
+    'charge_slot_2': lambda: _pair('charge_slot_2_start', 'charge_slot_2_end'),
+    'discharge_slot_1': lambda: _pair('discharge_slot_1_start', 'discharge_slot_1_end'),
+    'discharge_slot_2': lambda: _pair('discharge_slot_2_start', 'discharge_slot_2_end'),
+    'firmware_version': _firmware_version,
+    'inverter_model': _inverter_model,
+}
+
+
+class Snapshot:
+    """Base for lightweight, unvalidated views of a device's attributes, built directly from its registers.
+
+    Subclasses declare the attributes they carry in `__slots__` and the pydantic model they mirror in `_model`; the
+    functions extracting each attribute from the registers are compiled once when the subclass is defined. Attributes
+    whose registers have not been populated are set to None.
+    """
+
+    __slots__ = ()
+    _model: ClassVar[type]
+    _extractors: ClassVar[tuple[tuple[str, Extractor], ...]]
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        extractors = []
+        for name in cls.__slots__:
+            extractor = _DERIVED_EXTRACTORS[name]() if name in _DERIVED_EXTRACTORS else _register_extractor(name)
+            field = cls._model.__fields__.get(name)
+            if field is not None and field.outer_type_ in (int, float):
+                # the only coercion pydantic would do on these, since register scaling does not follow field types
+                extractor = _coerced(extractor, field.outer_type_)
+            extractors.append((name, extractor))
+        cls._extractors = tuple(extractors)
+
+    @classmethod
+    def from_registers(cls, registers: Mapping[Register, int]):
+        """Build a snapshot from a RegisterCache or RegisterBank."""
+        snapshot = cls.__new__(cls)
+        for name, extractor in cls._extractors:
+            try:
+                value = extractor(registers)
+            except KeyError:
+                value = None
+            object.__setattr__(snapshot, name, value)
+        return snapshot
+
+    def dict(self) -> dict[str, Any]:
+        """Return the snapshot's attributes as a dict."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def to_model(self):
+        """Convert to the equivalent (validated) pydantic model, e.g. for JSON output."""
+        return self._model(**self.dict())
+
+    def __setattr__(self, key: str, value: Any) -> None:
+        raise TypeError(f'{self.__class__.__name__} is immutable')
+
+    def __eq__(self, other: object) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({", ".join(f"{k}={v!r}" for k, v in self.dict().items())})'
+
+
+class InverterSnapshot(Snapshot):
+    """Lightweight equivalent of `Inverter`."""
+
+    __slots__ = (*Inverter.__fields__, 'inverter_model', 'firmware_version')
+    _model = Inverter
+
+
+class BatterySnapshot(Snapshot):
+    """Lightweight equivalent of `Battery`."""
+
+    __slots__ = tuple(Battery.__fields__)
+    _model = Battery
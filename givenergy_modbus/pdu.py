@@ -3,6 +3,7 @@
 from __future__ import annotations
 
 import logging
+import struct
 from abc import ABC
 from typing import Any, Sequence
 
@@ -94,9 +95,9 @@ class ModbusPDU(ABC):
         self._update_check_code()
         return self.builder.to_string()
 
-    def decode(self, data: bytes) -> None:
+    def decode(self, data: bytes | memoryview) -> None:
         """Decode PDU message and populate instance attributes."""
-        decoder = BinaryPayloadDecoder(data, byteorder=Endian.Big)
+        decoder = BinaryPayloadDecoder(bytes(data), byteorder=Endian.Big)
         self.data_adapter_serial_number = decoder.decode_string(10).decode("ascii")
         self.padding = decoder.decode_64bit_uint()
         self.slave_address = decoder.decode_8bit_uint()
@@ -113,7 +114,8 @@ class ModbusPDU(ABC):
 
         self._decode_function_data(decoder)
         self._ensure_valid_state()
-        _logger.debug(f"Successfully decoded {len(data)} bytes")
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug(f"Successfully decoded {len(data)} bytes")
 
     def _encode_function_data(self) -> None:
         """Complete function-specific encoding of the remainder of the PDU message."""
@@ -135,7 +137,8 @@ class ModbusPDU(ABC):
         """Allows the framer to decapsulate the PDU properly from the MBAP frame header."""
         # 20 = 10 (data adapter serial) + 8 (padding) + 1 (slave addr) + 1 (function code)
         size = 20 + self._calculate_function_data_size()
-        _logger.debug(f"Calculated {size} bytes total response PDU size for {self}")
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug(f"Calculated {size} bytes total response PDU size for {self}")
         if size >= 247:
             _logger.error('Expected response size {size}b exceeds Modbus protocol spec')
         return size
@@ -209,7 +212,8 @@ class ReadRegistersRequest(ModbusRequest, ABC):
 
     def _calculate_function_data_size(self):
         size = 16 + (self.register_count * 2)
-        _logger.debug(f"Calculated {size} bytes partial response size for {self}")
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug(f"Calculated {size} bytes partial response size for {self}")
         return size
 
     def _ensure_valid_state(self):
@@ -232,6 +236,21 @@ class ReadRegistersRequest(ModbusRequest, ABC):
             _logger.warning('GivEnergy devices do not return more than 60 registers per call, this will likely fail')
 
 
+# Layout of a complete Read Registers response frame, up to and including the register count:
+# data adapter serial, padding, slave address, function code, inverter serial, base register, register count
+_READ_REGISTERS_RESPONSE_HEAD = struct.Struct('>10sQBB10sHH')
+_read_registers_response_structs: dict[int, struct.Struct] = {}
+
+
+def _read_registers_response_struct(register_count: int) -> struct.Struct:
+    """Precompiled layout of a complete Read Registers response frame carrying `register_count` values + check."""
+    layout = _read_registers_response_structs.get(register_count)
+    if layout is None:
+        layout = struct.Struct(f'{_READ_REGISTERS_RESPONSE_HEAD.format}{register_count}HH')
+        _read_registers_response_structs[register_count] = layout
+    return layout
+
+
 class ReadRegistersResponse(ModbusResponse, ABC):
     """Handles all messages that respond with a range of registers."""
 
@@ -255,6 +274,41 @@ class ReadRegistersResponse(ModbusResponse, ABC):
         self.builder.add_16bit_uint(self.register_count)
         [self.builder.add_16bit_uint(v) for v in self.register_values]
 
+    def decode(self, data: bytes | memoryview) -> None:
+        """Decode PDU message and populate instance attributes.
+
+        Well-formed frames are unpacked in one go with a precompiled struct layout; anything else (error responses,
+        truncated frames, mismatched function codes) goes through the generic payload decoder instead.
+        """
+        if not self._decode_frame(data):
+            super().decode(data)
+
+    def _decode_frame(self, data: bytes | memoryview) -> bool:
+        """Try to decode the entire frame with a cached struct layout. Returns whether that succeeded."""
+        if len(data) < _READ_REGISTERS_RESPONSE_HEAD.size:
+            return False
+        register_count = _READ_REGISTERS_RESPONSE_HEAD.unpack_from(data)[6]
+        if data[19] != self.function_code or len(data) < _READ_REGISTERS_RESPONSE_HEAD.size + 2 * register_count + 2:
+            return False
+        values = _read_registers_response_struct(register_count).unpack_from(data)
+        try:
+            data_adapter_serial_number = values[0].decode('ascii')
+            inverter_serial_number = values[4].decode('ascii')
+        except UnicodeDecodeError:
+            return False
+        self.data_adapter_serial_number = data_adapter_serial_number
+        self.padding = values[1]
+        self.slave_address = values[2]
+        self.inverter_serial_number = inverter_serial_number
+        self.base_register = values[5]
+        self.register_count = register_count
+        self.register_values = list(values[7:-1])
+        self.check = values[-1]
+        self._ensure_valid_state()
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug(f"Successfully decoded {len(data)} bytes")
+        return True
+
     def _decode_function_data(self, decoder):
         """Decode response PDU message and populate instance attributes."""
         self.inverter_serial_number = decoder.decode_string(10).decode("ascii")
@@ -387,7 +441,8 @@ class WriteHoldingRegisterRequest(WriteHoldingRegisterMeta, ModbusRequest, ABC):
 
     def _calculate_function_data_size(self):
         size = 16
-        _logger.debug(f"Calculated {size} bytes partial response size for {self}")
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug(f"Calculated {size} bytes partial response size for {self}")
         return size
 
     def _ensure_valid_state(self):
@@ -459,12 +514,13 @@ class ErrorResponse(pymodbus_pdu.ModbusResponse, ABC):
         self.builder.add_8bit_uint(self.error_code)
         return self.builder.to_string()
 
-    def decode(self, data: bytes):
+    def decode(self, data: bytes | memoryview):
         """Decode response PDU message and populate instance attributes."""
-        decoder = BinaryPayloadDecoder(data, byteorder=Endian.Big)
+        decoder = BinaryPayloadDecoder(bytes(data), byteorder=Endian.Big)
         self.data_adapter_serial_number = decoder.decode_string(10).decode("ascii")
         self.error_code = decoder.decode_8bit_uint()
-        _logger.debug(f"Successfully decoded {len(data)} bytes")
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug(f"Successfully decoded {len(data)} bytes")
 
     @staticmethod
     def get_response_pdu_size() -> int:
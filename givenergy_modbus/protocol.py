@@ -0,0 +1,280 @@
+"""Sans-I/O protocol logic shared by the blocking and asyncio clients.
+
+Anything that needs to talk to the data adapter is written as a generator that yields the operations it needs
+performed (`Execute`, `Pipeline` and `Sleep`) and gets their results sent back in. `run` drives such a generator
+over a blocking connection and `run_async` over an asyncio one, so request building, response validation and
+matching only exist once, and the clients themselves are left with just the socket handling.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Generator, Mapping, NamedTuple, Sequence
+
+from givenergy_modbus.metrics import ERROR_RESPONSE, OK, ClientMetrics
+from givenergy_modbus.model.register import HoldingRegister, InputRegister  # type: ignore
+from givenergy_modbus.pdu import (
+    ModbusPDU,
+    ReadHoldingRegistersRequest,
+    ReadHoldingRegistersResponse,
+    ReadInputRegistersRequest,
+    ReadInputRegistersResponse,
+    ReadRegistersRequest,
+    ReadRegistersResponse,
+    WriteHoldingRegisterRequest,
+    WriteHoldingRegisterResponse,
+)
+
+_logger = logging.getLogger(__package__)
+
+# match types of register to their request/response types
+READ_PDUS = {
+    HoldingRegister: (ReadHoldingRegistersRequest, ReadHoldingRegistersResponse),
+    InputRegister: (ReadInputRegistersRequest, ReadInputRegistersResponse),
+}
+
+
+class Execute(NamedTuple):
+    """Send a single request and wait for its response, which is sent back (or None if there was none)."""
+
+    request: ModbusPDU
+
+
+class Pipeline(NamedTuple):
+    """Send requests back to back, and send back the list of their responses (see `PipelineState`).
+
+    `max_in_flight` and `timeout` default to the client's own settings. A `probe` expects some of its requests to go
+    unanswered (e.g. ones to devices that may not be there), so those are only logged at debug level.
+    """
+
+    requests: Sequence[ModbusPDU]
+    max_in_flight: int | None = None
+    timeout: float | None = None
+    probe: bool = False
+
+
+class Sleep(NamedTuple):
+    """Wait for a number of seconds before carrying on."""
+
+    seconds: float
+
+
+Steps = Generator[Any, Any, Any]  # yields `Execute`, `Pipeline` or `Sleep` operations
+
+
+def run(steps: Steps, perform: Callable[[Any], Any]) -> Any:
+    """Drive `steps` to completion, carrying out each operation it yields with `perform`, and return its result."""
+    result = None
+    while True:
+        try:
+            operation = steps.send(result)
+        except StopIteration as e:
+            return e.value
+        result = perform(operation)
+
+
+async def run_async(steps: Steps, perform: Callable[[Any], Awaitable[Any]]) -> Any:
+    """Drive `steps` to completion like `run`, awaiting `perform` for each operation."""
+    result = None
+    while True:
+        try:
+            operation = steps.send(result)
+        except StopIteration as e:
+            return e.value
+        result = await perform(operation)
+
+
+def pipeline_key(pdu: ModbusPDU) -> tuple | None:
+    """What identifies the response to a request, or the request a response belongs to."""
+    if isinstance(pdu, (WriteHoldingRegisterRequest, WriteHoldingRegisterResponse)):
+        # writes always go to the inverter, so don't rely on the slave address being echoed back
+        return pdu.function_code, pdu.register
+    if isinstance(pdu, (ReadRegistersRequest, ReadRegistersResponse)):
+        # the slave address tells apart otherwise identical reads from different batteries
+        return pdu.function_code, pdu.slave_address, pdu.base_register, pdu.register_count
+    return None
+
+
+class PipelineState:
+    """Bookkeeping for a batch of pipelined requests, independent of how they are sent.
+
+    `next_batch` hands out the requests that can be sent without going over `max_in_flight` outstanding, `sent`
+    notes when they went out, and `feed` passes received data through a framer and pairs up the responses with
+    their requests by `pipeline_key`. Responses are collected in `responses`, in request order, and the latency
+    and outcome of each request are recorded in `metrics`.
+    """
+
+    def __init__(self, requests: Sequence[ModbusPDU], max_in_flight: int, metrics: ClientMetrics):
+        self.requests = requests
+        self.max_in_flight = max_in_flight
+        self.metrics = metrics
+        self.responses: list[ModbusPDU | None] = [None] * len(requests)
+        self.in_flight = 0
+        self.sent_at: dict[int, float] = {}  # when each request still awaiting a response was sent
+        self._unsent = deque(enumerate(requests))
+        self._waiting: dict[tuple, deque[int]] = {}
+
+    @property
+    def done(self) -> bool:
+        """Whether every request has been sent and answered."""
+        return not self._unsent and not self.in_flight
+
+    @property
+    def received(self) -> int:
+        """How many requests got a (non-error) response."""
+        return sum(r is not None for r in self.responses)
+
+    def next_batch(self) -> list[int]:
+        """Take the indices of the requests to send next, if any."""
+        batch = []
+        while self._unsent and self.in_flight < self.max_in_flight:
+            index, request = self._unsent.popleft()
+            self._waiting.setdefault(pipeline_key(request), deque()).append(index)
+            batch.append(index)
+            self.in_flight += 1
+        return batch
+
+    def sent(self, indices: Sequence[int]) -> None:
+        """Note that the requests with the given indices have just been sent."""
+        self.sent_at.update(dict.fromkeys(indices, time.monotonic()))
+
+    def feed(self, framer, data: bytes) -> bool:
+        """Process received data, returning whether it answered any outstanding requests."""
+        outstanding = self.in_flight
+        framer.processIncomingPacket(data, self.on_response)
+        return self.in_flight < outstanding
+
+    def on_response(self, response: ModbusPDU | None) -> None:
+        """Pair up a decoded response with the request it answers."""
+        indices = self._waiting.get(pipeline_key(response))
+        if not indices:
+            _logger.warning(f'Unexpected response to pipelined requests: {response}')
+            return
+        index = indices.popleft()
+        self.in_flight -= 1
+        latency = time.monotonic() - self.sent_at.pop(index)
+        if getattr(response, 'error', False):
+            _logger.warning(f'Error response to pipelined request {self.requests[index]}')
+            self.metrics.record(self.requests[index], ERROR_RESPONSE, latency)
+        else:
+            self.responses[index] = response
+            self.metrics.record(self.requests[index], OK, latency)
+
+    def fail(self, outcome: str) -> None:
+        """Record the given outcome for every request still awaiting a response."""
+        for index in self.sent_at:
+            self.metrics.record(self.requests[index], outcome)
+
+
+def read_registers(
+    kind: type[HoldingRegister | InputRegister],
+    base_address: int,
+    register_count: int,
+    metrics: ClientMetrics,
+    **kwargs,
+) -> Steps:
+    """Read out registers from the correct location depending on type specified."""
+    t_req, t_res = READ_PDUS[kind]
+    request = t_req(base_register=base_address, register_count=register_count, **kwargs)
+    if _logger.isEnabledFor(logging.DEBUG):
+        _logger.debug(
+            f'Attempting to read {t_req}s #{request.base_register}-'
+            f'{request.base_register + request.register_count} from device {hex(request.slave_address)}...'
+        )
+    response = yield Execute(request)
+    if response and isinstance(response, t_res):
+        if response.base_register != base_address:
+            _logger.debug(
+                f'Returned base register ({response.base_register}) '
+                f'does not match that from request ({base_address}).'
+            )
+            metrics.increment('validation_failures')
+            return {}
+        if response.register_count != register_count:
+            _logger.debug(
+                f'Returned register count ({response.register_count}) '
+                f'does not match that from request ({register_count}).'
+            )
+            metrics.increment('validation_failures')
+            return {}
+        return response.to_dict()
+    _logger.debug(f'Did not receive expected response type: {t_res.__name__} != {response.__class__.__name__}')
+    # FIXME this contract needs improving
+    return {}
+
+
+def read_registers_pipelined(
+    requests: Sequence[tuple[type[HoldingRegister | InputRegister], int, int, int]],
+    max_in_flight: int = None,
+    timeout: float = None,
+    probe: bool = False,
+) -> Steps:
+    """Read several ranges of registers, possibly from different devices, with pipelined requests.
+
+    Each request is a `(kind, base_address, register_count, slave_address)` tuple. Returns the register values
+    read for each request, in the same order; ranges that could not be read map to an empty dict, as with
+    `read_registers`. See `Pipeline` for the other arguments.
+    """
+    pdus = [
+        READ_PDUS[kind][0](base_register=base, register_count=count, slave_address=slave)
+        for kind, base, count, slave in requests
+    ]
+    responses = yield Pipeline(pdus, max_in_flight, timeout, probe)
+    return [response.to_dict() if response is not None else {} for response in responses]
+
+
+def check_writes(values: Mapping[HoldingRegister, int]) -> None:
+    """Make sure the given values can be written to their holding registers."""
+    for register, value in values.items():
+        if not register.write_safe:  # type: ignore  # shut up mypy
+            raise ValueError(f'Register {register.name} is not safe to write to')
+        if value != value & 0xFFFF:
+            raise ValueError(f'Value {value} must fit in 2 bytes')
+
+
+def write_holding_register(register: HoldingRegister, value: int) -> Steps:
+    """Write a value to a single holding register."""
+    check_writes({register: value})
+    _logger.info(f'Attempting to write {value}/{hex(value)} to Holding Register {register.value}/{register.name}')
+    result = yield Execute(WriteHoldingRegisterRequest(register=register.value, value=value))
+    if isinstance(result, WriteHoldingRegisterResponse):
+        if result.value != value:
+            raise AssertionError(f'Register read-back value 0x{result.value:04x} != written value 0x{value:04x}')
+    else:
+        raise AssertionError(f'Unexpected response from remote end: {result}')
+
+
+def write_holding_registers(values: Mapping[HoldingRegister, int]) -> Steps:
+    """Write values to several holding registers, in the given order.
+
+    The write requests are pipelined: they are sent back to back over a single connection, up to `max_in_flight`
+    at a time, and the read-backs are collected and checked together afterwards. Any write that doesn't get a
+    read-back (e.g. because the data adapter dropped a request) is retried on its own through
+    `write_holding_register`.
+    """
+    check_writes(values)
+    if len(values) <= 1:
+        for register, value in values.items():
+            yield from write_holding_register(register, value)
+        return
+
+    _logger.info(
+        'Attempting to write '
+        + ', '.join(f'{v}/{hex(v)} to Holding Register {r.value}/{r.name}' for r, v in values.items())
+    )
+    requests = [WriteHoldingRegisterRequest(register=r.value, value=v) for r, v in values.items()]
+    # no more writes are kept outstanding than the client's `max_in_flight`, as the data adapter may drop the rest
+    responses = yield Pipeline(requests)
+    read_backs = {response.register: response.value for response in responses if response is not None}
+    mismatches = [
+        f'0x{read_backs[r.value]:04x} != 0x{v:04x} for {r.name}'
+        for r, v in values.items()
+        if r.value in read_backs and read_backs[r.value] != v
+    ]
+    if mismatches:
+        raise AssertionError(f'Register read-back values differ from written values: {", ".join(mismatches)}')
+    for register, value in values.items():
+        if register.value not in read_backs:
+            _logger.info(f'No read-back for Holding Register {register.value}/{register.name}, retrying alone')
+            yield from write_holding_register(register, value)
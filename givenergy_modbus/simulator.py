@@ -0,0 +1,319 @@
+"""Simulated GivEnergy inverter, for exercising clients on localhost without touching real hardware.
+
+The simulator speaks the same framing as the data adapter, decoding requests with `GivEnergyRequestDecoder` and
+answering with the regular response PDUs. Register values are served from dumps as produced by
+`RegisterCache.to_json()` (e.g. the output of the `dump-registers` command), and it can be made to misbehave like a
+real data adapter: responses can be delayed, dropped or split into fragments, and requests for more than 60
+registers go unanswered.
+
+Run it with e.g. `python -m givenergy_modbus.simulator --inverter inverter.json --battery battery.json`.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import random
+from typing import Iterable
+
+import click
+
+from givenergy_modbus.decoder import GivEnergyRequestDecoder
+from givenergy_modbus.framer import GivEnergyModbusFramer
+from givenergy_modbus.pdu import (
+    ModbusPDU,
+    ReadHoldingRegistersRequest,
+    ReadHoldingRegistersResponse,
+    ReadInputRegistersRequest,
+    ReadInputRegistersResponse,
+    ReadRegistersRequest,
+    WriteHoldingRegisterRequest,
+    WriteHoldingRegisterResponse,
+)
+from givenergy_modbus.util import InterceptHandler
+
+_logger = logging.getLogger(__package__)
+
+MAX_REGISTER_COUNT = 60  # the most registers the data adapter will return in one response
+
+
+class _ResponseChecksumFilter(logging.Filter):
+    """Drops the warning every Response PDU logs as it is encoded, since the simulator can only ever send them as-is."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not record.getMessage().startswith('Unable to recalculate checksum')
+
+
+_response_checksum_filter = _ResponseChecksumFilter()
+
+
+class SimulatedDevice:
+    """Register values served for a single slave address, indexed by function code and register number."""
+
+    def __init__(self, holding_registers: dict[int, int] = None, input_registers: dict[int, int] = None):
+        self.registers: dict[int, dict[int, int]] = {
+            ReadHoldingRegistersRequest.function_code: dict(holding_registers or {}),
+            ReadInputRegistersRequest.function_code: dict(input_registers or {}),
+        }
+
+    @classmethod
+    def from_json(cls, data: str) -> SimulatedDevice:
+        """Load register values from the JSON form of a `RegisterCache` or `RegisterBank`."""
+        device = cls()
+        device.update_from_json(data)
+        return device
+
+    def update_from_json(self, data: str) -> None:
+        """Overlay register values from the JSON form of a `RegisterCache` or `RegisterBank`."""
+        lookup = {'HR': ReadHoldingRegistersRequest.function_code, 'IR': ReadInputRegistersRequest.function_code}
+        for k, v in json.loads(data).items():
+            reg, idx = k.split(':', maxsplit=1)
+            self.registers[lookup[reg]][int(idx)] = v
+
+    def read(self, function_code: int, base_register: int, register_count: int) -> list[int]:
+        """Values of a range of registers, with any the device doesn't know about reading as 0."""
+        registers = self.registers[function_code]
+        return [registers.get(i, 0) for i in range(base_register, base_register + register_count)]
+
+    def write(self, register: int, value: int) -> None:
+        """Update a holding register."""
+        self.registers[ReadHoldingRegistersRequest.function_code][register] = value
+
+    @property
+    def serial_number(self) -> str:
+        """The serial number stored in holding registers 13-17, which is echoed in every response."""
+        values = self.read(ReadHoldingRegistersRequest.function_code, 13, 5)
+        serial_number = b''.join(v.to_bytes(2, byteorder='big') for v in values).decode('ascii', errors='replace')
+        return serial_number.strip('\x00 ') or 'SA1234G567'
+
+
+class InverterSimulator:
+    """Asyncio TCP server that answers GivEnergy Modbus requests from a set of simulated devices.
+
+    `devices` maps slave addresses to the devices answering on them; requests to any other address go unanswered,
+    just like requests for batteries that aren't there. Writes always go to the inverter, i.e. the device on
+    slave address 0x32 regardless of the address they were sent to.
+
+    To mimic a real data adapter, each response is held back for `latency` seconds (plus a random amount of up to
+    `jitter` seconds), independently of other outstanding requests. `drop_rate` is the probability of a request
+    never being answered, and if `fragment_size` is set responses are written out in chunks of at most that many
+    bytes, `fragment_delay` seconds apart, so clients have to reassemble them. Pass a `seed` for repeatable runs.
+    Requests and their outcomes are tallied in `stats`.
+    """
+
+    def __init__(
+        self,
+        devices: dict[int, SimulatedDevice],
+        host: str = '127.0.0.1',
+        port: int = 8899,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        drop_rate: float = 0.0,
+        fragment_size: int = None,
+        fragment_delay: float = 0.01,
+        seed: int = None,
+    ):
+        if not 0 <= drop_rate <= 1:
+            raise ValueError(f'drop_rate ({drop_rate}) must be between 0 and 1')
+        if fragment_size is not None and fragment_size < 1:
+            raise ValueError(f'fragment_size ({fragment_size}) must be at least 1')
+        self.devices = devices
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.fragment_size = fragment_size
+        self.fragment_delay = fragment_delay
+        self.random = random.Random(seed)
+        self.stats = {
+            'connections': 0,
+            'requests': 0,
+            'responses': 0,
+            'dropped': 0,  # requests deliberately left unanswered
+            'unanswerable': 0,  # requests for unknown devices or too many registers
+        }
+        self._server: asyncio.AbstractServer | None = None
+
+    @classmethod
+    def from_dumps(cls, inverter_json: str, battery_jsons: Iterable[str] = (), **kwargs) -> InverterSimulator:
+        """Set up a simulator for a plant from register dumps of its inverter and batteries.
+
+        The inverter answers on slave address 0x32 (and 0x11), and the batteries on 0x32 onwards. The first battery
+        shares its address with the inverter, so its registers are overlaid on the inverter's.
+        """
+        inverter = SimulatedDevice.from_json(inverter_json)
+        devices = {0x11: inverter, 0x32: inverter}
+        for i, battery_json in enumerate(battery_jsons):
+            if i == 0:
+                inverter.update_from_json(battery_json)
+            else:
+                devices[0x32 + i] = SimulatedDevice.from_json(battery_json)
+        return cls(devices, **kwargs)
+
+    def __repr__(self):
+        return f"InverterSimulator({self.host}:{self.port}, devices={[hex(a) for a in self.devices]})"
+
+    async def start(self) -> None:
+        """Start listening for connections. If `port` is 0, it is updated with the port actually picked."""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        _logger.info(f'Simulating {len(self.devices)} devices on {self.host}:{self.port}')
+
+    async def serve_forever(self) -> None:
+        """Start listening if not already doing so, and serve connections until cancelled."""
+        if self._server is None:
+            await self.start()
+        await self._server.serve_forever()
+
+    async def close(self) -> None:
+        """Stop listening for connections."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> InverterSimulator:
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+    def respond(self, request: ModbusPDU) -> ModbusPDU | None:
+        """Work out the response to a request, if it can be answered at all."""
+        if isinstance(request, WriteHoldingRegisterRequest):
+            inverter = self.devices[0x32]
+            inverter.write(request.register, request.value)
+            return WriteHoldingRegisterResponse(
+                register=request.register,
+                value=request.value,
+                slave_address=request.slave_address,
+                inverter_serial_number=inverter.serial_number,
+            )
+        device = self.devices.get(request.slave_address)
+        if device is None or not isinstance(request, ReadRegistersRequest):
+            return None
+        if request.register_count > MAX_REGISTER_COUNT:
+            _logger.warning(f'Not answering request for more than {MAX_REGISTER_COUNT} registers: {request}')
+            return None
+        response_type = (
+            ReadHoldingRegistersResponse
+            if isinstance(request, ReadHoldingRegistersRequest)
+            else ReadInputRegistersResponse
+        )
+        return response_type(
+            base_register=request.base_register,
+            register_count=request.register_count,
+            register_values=device.read(request.function_code, request.base_register, request.register_count),
+            slave_address=request.slave_address,
+            inverter_serial_number=self.devices[0x32].serial_number if 0x32 in self.devices else device.serial_number,
+        )
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.stats['connections'] += 1
+        peer = writer.get_extra_info('peername')
+        _logger.info(f'Connection from {peer}')
+        framer = GivEnergyModbusFramer(GivEnergyRequestDecoder())
+        write_lock = asyncio.Lock()
+        pending: set[asyncio.Task] = set()
+        try:
+            while True:
+                data = await reader.read(1024)
+                if not data:
+                    break
+                requests: list[ModbusPDU] = []
+                framer.processIncomingPacket(data, requests.append)
+                for request in requests:
+                    task = asyncio.ensure_future(self._answer(request, writer, framer, write_lock))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+        except ConnectionError as e:
+            _logger.info(f'Connection from {peer} failed: {e!r}')
+        finally:
+            for task in pending:
+                task.cancel()
+            writer.close()
+            _logger.info(f'Connection from {peer} closed')
+
+    async def _answer(
+        self,
+        request: ModbusPDU,
+        writer: asyncio.StreamWriter,
+        framer: GivEnergyModbusFramer,
+        write_lock: asyncio.Lock,
+    ) -> None:
+        self.stats['requests'] += 1
+        response = self.respond(request)
+        if response is None:
+            self.stats['unanswerable'] += 1
+            return
+        if self.random.random() < self.drop_rate:
+            self.stats['dropped'] += 1
+            _logger.debug(f'Dropping response to {request}')
+            return
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        _logger.addFilter(_response_checksum_filter)
+        try:
+            frame = framer.buildPacket(response)
+        finally:
+            _logger.removeFilter(_response_checksum_filter)
+        # hold the lock across fragments so that another response can't get interleaved with them
+        async with write_lock:
+            if self.fragment_size is None:
+                writer.write(frame)
+            else:
+                for i in range(0, len(frame), self.fragment_size):
+                    writer.write(frame[i : i + self.fragment_size])
+                    await writer.drain()
+                    await asyncio.sleep(self.fragment_delay)
+            await writer.drain()
+        self.stats['responses'] += 1
+
+
+@click.command()
+@click.option('--host', type=str, default='127.0.0.1', show_default=True, help='Address to listen on.')
+@click.option('-p', '--port', type=int, default=8899, show_default=True, help='Port to listen on.')
+@click.option(
+    '-i',
+    '--inverter',
+    type=click.File(),
+    required=True,
+    help='Inverter register dump, as produced by RegisterCache.to_json().',
+)
+@click.option('-b', '--battery', type=click.File(), multiple=True, help='Battery register dump, can be repeated.')
+@click.option('--latency', type=float, default=0.0, show_default=True, help='Seconds to delay every response by.')
+@click.option('--jitter', type=float, default=0.0, show_default=True, help='Up to how many more seconds to add.')
+@click.option('--drop-rate', type=float, default=0.0, show_default=True, help='Share of requests to leave unanswered.')
+@click.option('--fragment-size', type=int, default=None, help='Split responses into chunks of this many bytes.')
+@click.option('--seed', type=int, default=None, help='Seed for the random number generator, for repeatable runs.')
+@click.option(
+    '--log-level',
+    default='INFO',
+    type=click.Choice(['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG', 'NOTSET'], case_sensitive=False),
+)
+def main(host, port, inverter, battery, latency, jitter, drop_rate, fragment_size, seed, log_level):
+    """Serve a simulated GivEnergy inverter for testing and benchmarking clients."""
+    logging.basicConfig(handlers=[InterceptHandler()], level=getattr(logging, log_level))
+    _logger.setLevel(getattr(logging, log_level))  # pymodbus may already have configured the root logger
+    simulator = InverterSimulator.from_dumps(
+        inverter.read(),
+        [b.read() for b in battery],
+        host=host,
+        port=port,
+        latency=latency,
+        jitter=jitter,
+        drop_rate=drop_rate,
+        fragment_size=fragment_size,
+        seed=seed,
+    )
+    try:
+        asyncio.run(simulator.serve_forever())
+    except KeyboardInterrupt:
+        _logger.info(f'Stopped, served {simulator.stats}')
+
+
+if __name__ == "__main__":
+    main()  # pragma: no cover
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from pathlib import Path
+
+_logger = logging.getLogger(__package__)
+
+
+def default_topology_cache_path() -> Path:
+    """Where plant topologies get cached by default, following the XDG base directory conventions."""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return Path(cache_home) / 'givenergy-modbus' / 'topology.json'
+
+
+class TopologyCache:
+    """Remembers the layout of plants (i.e. which batteries are attached) across restarts, keyed by inverter serial.
+
+    Entries are dicts of the form `{'battery_serial_numbers': ['BG1234G567', ...]}`, stored together in one JSON
+    file. A missing or unreadable file is treated as empty.
+    """
+
+    def __init__(self, path: str | os.PathLike = None):
+        self.path = Path(path) if path is not None else default_topology_cache_path()
+
+    def _load(self) -> dict[str, dict]:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            _logger.warning(f'Ignoring unreadable topology cache {self.path}: {e}')
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def get(self, inverter_serial_number: str) -> dict | None:
+        """Return the cached topology for the given inverter, if there is one."""
+        return self._load().get(inverter_serial_number)
+
+    def _save(self, data: dict[str, dict]) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            _logger.warning(f'Unable to write topology cache {self.path}: {e}')
+
+    def put(self, inverter_serial_number: str, topology: dict) -> None:
+        """Store the topology for the given inverter."""
+        data = self._load()
+        data[inverter_serial_number] = topology
+        self._save(data)
+
+    def invalidate(self, inverter_serial_number: str) -> None:
+        """Forget the topology of the given inverter, e.g. after batteries were added or removed."""
+        data = self._load()
+        if data.pop(inverter_serial_number, None) is not None:
+            self._save(data)
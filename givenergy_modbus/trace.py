@@ -0,0 +1,125 @@
+"""Compact binary capture of the raw frames exchanged with the inverter.
+
+Capturing wire traffic through DEBUG logging means hex-formatting every frame, which is slow and bulky. Instead,
+a trace file stores each frame verbatim behind a small fixed-size record header:
+
+    magic    5 bytes   b'GEMT\\x01' (once, at the start of the file)
+    time     float64   seconds since the epoch
+    dir      uint8     0 = sent, 1 = received
+    length   uint32    payload length
+    payload  `length` bytes
+
+Start a trace with `start_trace(path)` (or by setting the `GIVENERGY_MODBUS_TRACE` environment variable to a path),
+and read it back with `read_trace(path)`.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import struct
+import threading
+import time
+from typing import BinaryIO, Iterator, NamedTuple
+
+_logger = logging.getLogger(__package__)
+
+MAGIC = b'GEMT\x01'
+SENT = 0
+RECEIVED = 1
+_RECORD_HEAD = struct.Struct('>dBI')
+
+
+class TraceRecord(NamedTuple):
+    """A single frame read back from a trace file."""
+
+    timestamp: float
+    direction: int
+    data: bytes
+
+
+class WireTrace:
+    """Appends raw frames to a binary trace file."""
+
+    def __init__(self, target: str | os.PathLike | BinaryIO):
+        if isinstance(target, (str, os.PathLike)):
+            self._file: BinaryIO = open(target, 'wb')
+            self._owns_file = True
+        else:
+            self._file = target
+            self._owns_file = False
+        self._lock = threading.Lock()
+        self._file.write(MAGIC)
+
+    def record(self, direction: int, data: bytes | bytearray | memoryview) -> None:
+        """Append a frame to the trace."""
+        with self._lock:
+            self._file.write(_RECORD_HEAD.pack(time.time(), direction, len(data)))
+            self._file.write(data)
+
+    def close(self) -> None:
+        """Flush the trace, and close the file if it was opened here."""
+        with self._lock:
+            if self._owns_file:
+                self._file.close()
+            else:
+                self._file.flush()
+
+    def __enter__(self) -> WireTrace:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+_active_trace: WireTrace | None = None
+
+
+def start_trace(target: str | os.PathLike | BinaryIO) -> WireTrace:
+    """Start capturing all frames sent and received by the clients to `target`, replacing any running trace."""
+    global _active_trace
+    stop_trace()
+    _active_trace = WireTrace(target)
+    _logger.info(f'Tracing raw frames to {target}')
+    return _active_trace
+
+
+def stop_trace() -> None:
+    """Stop capturing frames."""
+    global _active_trace
+    if _active_trace is not None:
+        _active_trace, trace = None, _active_trace
+        trace.close()
+
+
+def trace_frame(direction: int, data: bytes | bytearray | memoryview) -> None:
+    """Record a frame in the running trace, if there is one. This is a no-op otherwise."""
+    if _active_trace is not None and data:
+        _active_trace.record(direction, data)
+
+
+def read_trace(source: str | os.PathLike | BinaryIO) -> Iterator[TraceRecord]:
+    """Iterate over the frames stored in a trace file."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield from read_trace(f)
+        return
+
+    if source.read(len(MAGIC)) != MAGIC:
+        raise ValueError('Not a GivEnergy Modbus trace file')
+    while True:
+        head = source.read(_RECORD_HEAD.size)
+        if len(head) < _RECORD_HEAD.size:
+            return
+        timestamp, direction, length = _RECORD_HEAD.unpack(head)
+        data = source.read(length)
+        if len(data) < length:
+            _logger.warning('Trace file is truncated')
+            return
+        yield TraceRecord(timestamp, direction, data)
+
+
+atexit.register(stop_trace)
+
+if os.environ.get('GIVENERGY_MODBUS_TRACE'):
+    start_trace(os.environ['GIVENERGY_MODBUS_TRACE'])
@@ -1,16 +1,24 @@
 from __future__ import annotations
 
 import logging
+import socket
+import time
+from typing import Sequence
 
 from pymodbus.exceptions import InvalidMessageReceivedException, ModbusIOException
 from pymodbus.transaction import FifoTransactionManager
 from pymodbus.utilities import ModbusTransactionState
 
+from givenergy_modbus.metrics import ERROR, TIMEOUT
 from givenergy_modbus.pdu import ModbusPDU
+from givenergy_modbus.protocol import PipelineState, pipeline_key  # noqa: F401  # pipeline_key re-exported
+from givenergy_modbus.trace import RECEIVED, SENT, trace_frame
 from givenergy_modbus.util import hexlify
 
 _logger = logging.getLogger(__package__)
 
+DEFAULT_MAX_IN_FLIGHT = 2  # how many requests the data adapter is trusted to have queued up at once
+
 
 class GivEnergyTransactionManager(FifoTransactionManager):
     """Implements a ModbusTransactionManager.
@@ -25,10 +33,15 @@ class GivEnergyTransactionManager(FifoTransactionManager):
     We could've extended `GivEnergyModbusFramer` from `ModbusSocketFramer` instead, but that brings a different set
     of problems around implementation divergence in the GivEnergy implementation that would probably have been
     more work instead. Full novel in the `GivEnergyModbusFramer` class description.
+
+    Since every GivEnergy response carries the same transaction id, `execute` has to wait for each response before
+    sending the next request. `pipeline` gets around that by pairing up responses with their requests on the fields
+    they echo back instead (see `pipeline_key`), so that up to `max_in_flight` requests can be outstanding at once.
     """
 
-    def __init__(self, **kwargs):
+    def __init__(self, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, **kwargs):
         super().__init__(**kwargs)
+        self.max_in_flight = max_in_flight
         self._set_adu_size()  # = 8  # frame length calculation shenanigans, see `GivEnergyModbusFramer`
         # self.retry_on_empty = True
         # self.retry_on_invalid = True
@@ -61,13 +74,15 @@ class GivEnergyTransactionManager(FifoTransactionManager):
                 f'Expected ({expected_response_length}) response length differs from '
                 f'actual ({header["len_"]}) - potential bug?'
             )
+            self.client.metrics.increment('validation_failures')
             return False
         return True
 
     def execute(self, request: ModbusPDU) -> ModbusPDU:
         """Main processing loop."""
         res = super().execute(request)
-        _logger.debug(f'Old implementation returned: execute(request)={res}')
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug(f'Old implementation returned: execute(request)={res}')
         return res
 
     def _transact(
@@ -82,8 +97,11 @@ class GivEnergyTransactionManager(FifoTransactionManager):
         try:
             self.client.connect()
             tx_data = self.client.framer.buildPacket(request)
-            _logger.debug(f"SEND raw frame: {hexlify(tx_data)}")
-            _logger.info(f'Sending request {request}')
+            if _logger.isEnabledFor(logging.DEBUG):
+                _logger.debug(f"SEND raw frame: {hexlify(tx_data)}")
+            if _logger.isEnabledFor(logging.INFO):
+                _logger.info(f'Sending request {request}')
+            trace_frame(SENT, tx_data)
             tx_size = self._send(tx_data)
 
             # need to handle retry logic?
@@ -93,7 +111,9 @@ class GivEnergyTransactionManager(FifoTransactionManager):
                 self.client.state = ModbusTransactionState.WAITING_FOR_REPLY
 
             rx_data = self._recv(expected_response_length, full)
-            _logger.debug(f"RECV raw frame: {hexlify(rx_data)}")
+            trace_frame(RECEIVED, rx_data)
+            if _logger.isEnabledFor(logging.DEBUG):
+                _logger.debug(f"RECV raw frame: {hexlify(rx_data)}")
             return rx_data, None
 
         except (OSError, ModbusIOException, InvalidMessageReceivedException) as msg:
@@ -108,3 +128,64 @@ class GivEnergyTransactionManager(FifoTransactionManager):
     # def _recv(self, expected_response_length: int, _) -> bytes:
     #     exception_length = self._calculate_exception_length()
     #     min_size = 28  # 8 (hdr) + 20 (fn offset)
+
+    def pipeline(
+        self, requests: Sequence[ModbusPDU], max_in_flight: int = None, timeout: float = None, probe: bool = False
+    ) -> list:
+        """Send requests back to back over one connection, keeping at most `max_in_flight` of them outstanding.
+
+        Responses are matched up with their requests by function code, slave address and register addresses, so
+        they may arrive in any order. Returns the response to each request in the same order, or None for requests
+        that did not get a (non-error) response in time. `max_in_flight` defaults to `self.max_in_flight`, and
+        `timeout` (how long to wait for the next response) to `client.timeout`. Requests of a `probe` are expected
+        to go unanswered now and then, so timeouts are only logged at debug level.
+
+        The latency of each response is measured from when its request was sent, and recorded in `client.metrics`
+        along with the outcome of every request sent.
+        """
+        if max_in_flight is None:
+            max_in_flight = self.max_in_flight
+        client = self.client
+        if timeout is None:
+            timeout = client.timeout
+        state = PipelineState(requests, max_in_flight, client.metrics)
+        if not requests or not client.connect():
+            return state.responses
+
+        client.framer.resetFrame()
+        try:
+            deadline = time.monotonic() + timeout
+            while not state.done:
+                batch = state.next_batch()
+                if batch:
+                    tx_data = b''.join(client.framer.buildPacket(requests[index]) for index in batch)
+                    trace_frame(SENT, tx_data)
+                    client.socket.sendall(tx_data)
+                    state.sent(batch)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout()
+                client.socket.settimeout(remaining)
+                data = client.socket.recv(1024)
+                if not data:
+                    raise ConnectionResetError('Connection closed by remote end')
+                trace_frame(RECEIVED, data)
+                if state.feed(client.framer, data):
+                    # progress is being made, so give the next responses a full timeout period
+                    deadline = time.monotonic() + timeout
+        except socket.timeout:
+            log = _logger.debug if probe else _logger.warning
+            log(f'Timed out waiting for responses, only got {state.received}/{len(requests)}')
+            state.fail(TIMEOUT)
+            if self.reset_socket:
+                # don't let late responses get matched up with the next transaction's requests; a persistent
+                # connection instead gets them drained by its health check before the next transaction
+                client.close()
+        except OSError as e:
+            _logger.error(f'Pipelined requests failed: {e!r}')
+            client.close()
+            state.fail(ERROR)
+        finally:
+            if client.socket:
+                client.socket.settimeout(client.params.timeout)
+        return state.responses
@@ -38,7 +38,7 @@ def hexlify(val) -> str:
     """Provides an easy way to print long byte strings as hex strings."""
     if isinstance(val, int):
         val = val.to_bytes((val.bit_length() + 8) // 8, 'big')
-    if isinstance(val, bytes):
+    if isinstance(val, (bytes, bytearray, memoryview)):
         if sys.version_info < (3, 8):
             # TODO remove once 3.7 is unsupported
             return binascii.hexlify(val).decode('ascii')
@@ -10,6 +10,7 @@ from os.path import dirname
 from datetime import datetime
 
 from givenergy_modbus.client import GivEnergyClient
+from givenergy_modbus.metrics import start_metrics_server
 from givenergy_modbus.model.battery import Battery
 from givenergy_modbus.model.inverter import Inverter
 from givenergy_modbus.model.plant import Plant
@@ -31,9 +32,17 @@ CONFIG = {
     'WAIT_TIME_SHORT' : 30,
     'MAP_URL' : "http://maps.google.com/maps?z=12&t=m&q=loc:%f+%f",
     'TESLA_EMAIL' : "user@tesla.com",
-    'GIVENERGY_IP' : "192.168.0.0"
+    'GIVENERGY_IP' : "192.168.0.0",
+    'METRICS_PORT' : 0,
+    'METRICS_ADDR' : "127.0.0.1",
+    'CAR_STREAMING' : False,
+    'CAR_STREAM_MAX_AGE' : 60,
+    'CAR_REST_INTERVAL' : 60*5
 }
 
+# Inverter attributes read by the control loop, only the register pages holding these are refreshed each tick
+INVERTER_ATTRIBUTES = ['battery_percent', 'p_battery', 'v_battery', 'p_load_demand', 'p_pv1', 'p_pv2', 'p_grid_out']
+
 def signal_handler(sig, frame):
     print('You pressed Ctrl+C!')
     sys.exit(0)
@@ -50,6 +59,23 @@ def is_at_home(lat, long):
 
 signal.signal(signal.SIGINT, signal_handler)
 
+"""
+Send commands to the car once it is awake, without holding up the control loop while it wakes. Commands still
+waiting to be sent are replaced by newer ones, and those the car's charge state shows are already in effect are skipped
+"""
+def send_car_commands(car, *commands):
+    def sent(result):
+        try:
+            names = result.result()
+            if names:
+                print("   Sent commands %s to the car" % ', '.join(names))
+        except Exception as e:
+            print("   ERROR: Failed to send commands to the car: %s" % e)
+
+    for name, kwargs in commands:
+        car.queue_command(name, **kwargs)
+    car.send_commands().add_done_callback(sent)
+
 """
 Parse args and read the config
 """
@@ -101,9 +127,16 @@ def main():
         my_car = vehicles[0]
         my_car.sync_wake_up()
         car_data = my_car.get_vehicle_data()
+        if CONFIG['CAR_STREAMING']:
+            # Keep the car's SoC, location and power current from streaming telemetry
+            my_car.start_stream()
 
         client = GivEnergyClient(host=CONFIG['GIVENERGY_IP'])
-        p = Plant(number_batteries=1)
+        if CONFIG['METRICS_PORT']:
+            # Expose inverter transaction latencies and failures for Prometheus to scrape
+            start_metrics_server(int(CONFIG['METRICS_PORT']), CONFIG['METRICS_ADDR'])
+        p = Plant(number_batteries=client.discover_batteries())
+        client.plant = p
         #client.set_battery_power_reserve(5)
         client.refresh_plant(p, full_refresh=True)
     
@@ -118,7 +151,9 @@ def main():
             print("%s:" % time_now.strftime("%m/%d/%Y, %H:%M:%S"))
 
             # Access the Givenergy system
-            client.refresh_plant(p, full_refresh=False)
+            client.refresh_plant_attributes(p, INVERTER_ATTRIBUTES)
+            for device in client.circuit_breaker.open_devices():
+                print("   WARN: Not polling device %s, it keeps failing: %s" % (hex(device), client.circuit_breaker.circuits[device]))
             battery_per = p.inverter.battery_percent
             battery_power = p.inverter.p_battery
             battery_volts = p.inverter.v_battery
@@ -163,10 +198,16 @@ def main():
             else:
                 refresh_car = False
                 
-            # Get the car's status
-            my_car.get_vehicle_summary()
-            if (refresh_car):
-                car_data = my_car.get_vehicle_data()
+            # Get the car's status, from streaming telemetry when it is current. The stream doesn't carry the
+            # charging state though, so that is still polled now and then while the car is of interest.
+            if CONFIG['CAR_STREAMING'] and my_car.stream_age() < CONFIG['CAR_STREAM_MAX_AGE']:
+                print("   Car data streamed %ds ago" % my_car.stream_age())
+                if refresh_car and time.time() - my_car.timestamp > CONFIG['CAR_REST_INTERVAL']:
+                    car_data = my_car.get_vehicle_data()
+            else:
+                my_car.get_vehicle_summary()
+                if (refresh_car):
+                    car_data = my_car.get_vehicle_data()
             car_battery = my_car['charge_state']['battery_level']
             car_charging_state = my_car['charge_state']['charging_state']
 
@@ -189,8 +230,7 @@ def main():
             elif car_charging and (car_charging_state == 'Complete' or car_charging_state == 'Stopped'):
                 car_charging = False
                 print("   Car has stopped charging, likely hit the charging limit or stopped by the app")
-                my_car.sync_wake_up()
-                my_car.command('CHARGING_AMPS', charging_amps=CONFIG['DEFAULT_CHARGE_AMPS'])
+                send_car_commands(my_car, ('CHARGING_AMPS', {'charging_amps': CONFIG['DEFAULT_CHARGE_AMPS']}))
             elif not car_charging and (car_charging_state == 'Charging'):
                 if (in_window):
                     car_charging = True
@@ -199,24 +239,24 @@ def main():
                     print("   The car is already charging outside the window and we didn't enable it, ignoring it")
             elif not car_charging and in_window and (spare_power > 0) and battery_over_threshold and (car_battery < CONFIG['CAR_BATTERY_MAX']):
                 # Start now        
-                my_car.sync_wake_up()
                 is_home = is_at_home(car_data['drive_state']['latitude'], car_data['drive_state']['longitude'])
                 if (is_home):
                     print("   ^ Starting the car charging.")
-                    my_car.command('CHARGING_AMPS', charging_amps=charging_amps)
-                    my_car.command('CHANGE_CHARGE_LIMIT', percent=CONFIG['CAR_BATTERY_MAX'])
-                    my_car.command('START_CHARGE')
+                    send_car_commands(my_car,
+                                      ('CHARGING_AMPS', {'charging_amps': charging_amps}),
+                                      ('CHANGE_CHARGE_LIMIT', {'percent': CONFIG['CAR_BATTERY_MAX']}),
+                                      ('START_CHARGE', {}))
                     car_charging = True
                 else:
                     print("   Car has moved away from home, wont't start charge")
             elif car_charging and (battery_under_threshold or not in_window):
                 # Stop now
-                my_car.sync_wake_up()
                 is_home = is_at_home(car_data['drive_state']['latitude'], car_data['drive_state']['longitude'])
                 if (is_home):
                     print("   ^ Stopping car the charging.")
-                    my_car.command('STOP_CHARGE')
-                    my_car.command('CHARGING_AMPS', charging_amps=CONFIG['DEFAULT_CHARGE_AMPS'])
+                    send_car_commands(my_car,
+                                      ('STOP_CHARGE', {}),
+                                      ('CHARGING_AMPS', {'charging_amps': CONFIG['DEFAULT_CHARGE_AMPS']}))
                 else:
                     print("   Car has moved away from home, won't stop charge")
                 car_charging = False
@@ -224,14 +264,12 @@ def main():
                 # Adjust car charging amps
                 if (spare_power < 0 and charging_amps > CONFIG['CAR_CHARGE_AMPS_MIN']):
                     charging_amps -= 1
-                    my_car.sync_wake_up()
-                    my_car.command('CHARGING_AMPS', charging_amps=charging_amps)
+                    send_car_commands(my_car, ('CHARGING_AMPS', {'charging_amps': charging_amps}))
                     print("   ^ Adjusting down car charging amps to %d based on spare_power %d" % (charging_amps, spare_power))
                 elif (spare_power > 0 and charging_amps < CONFIG['CAR_CHARGE_AMPS_MAX']):
                     print("   ^ Adjusting up car charging amps to %d based on spare_power %d" % (charging_amps, spare_power))
                     charging_amps += 1
-                    my_car.sync_wake_up()
-                    my_car.command('CHARGING_AMPS', charging_amps=charging_amps)
+                    send_car_commands(my_car, ('CHARGING_AMPS', {'charging_amps': charging_amps}))
 
             if car_charging:
                 print("   Short sleep for %d seconds..." % CONFIG['WAIT_TIME_SHORT'])
@@ -10,6 +10,7 @@ __version__ = '2.7.0'
 
 import os
 import ast
+import copy
 import json
 import time
 import base64
@@ -19,11 +20,13 @@ import pkgutil
 import datetime
 import webbrowser
 import stat
+import threading
 try:
     from urlparse import urljoin
 except ImportError:
     from urllib.parse import urljoin
 from collections import defaultdict, namedtuple
+from concurrent.futures import Future
 import requests
 from requests_oauthlib import OAuth2Session
 from requests.exceptions import *
@@ -50,6 +53,17 @@ except NameError:
     pass
 
 
+class _InFlightRequest(object):
+    """ Outcome of a request that concurrent identical requests wait for """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.response = None
+        self.fetched_at = None
+        self.error = None
+        self.stale = False  # Invalidated while in flight, so don't cache
+
+
 class Tesla(OAuth2Session):
     """ Implements a session manager for the Tesla Motors Owner API
 
@@ -68,6 +82,8 @@ class Tesla(OAuth2Session):
                   if your email is registered in another region.
     code_verifier (optional): PKCE code verifier string.
     app_user_agent (optional): X-Tesla-User-Agent string.
+    response_cache (optional): Cache GET endpoint responses for the number of
+                               seconds set by `CACHE_TTL` in the endpoints.
 
     Extra keyword arguments to pass to OAuth2Session constructor using `kwargs`:
     state (optional): A state string for CSRF protection.
@@ -77,7 +93,7 @@ class Tesla(OAuth2Session):
                  user_agent=__name__ + '/' + __version__, authenticator=None,
                  cache_file='cache.json', cache_loader=None, cache_dumper=None,
                  sso_base_url=None, code_verifier=None,
-                 app_user_agent=APP_USER_AGENT, **kwargs):
+                 app_user_agent=APP_USER_AGENT, response_cache=True, **kwargs):
         super(Tesla, self).__init__(client_id=SSO_CLIENT_ID, **kwargs)
         if not email:
             raise ValueError('`email` is not set')
@@ -91,6 +107,11 @@ class Tesla(OAuth2Session):
         self.sso_base_url = sso_base_url or SSO_BASE_URL
         self._auto_refresh_url = None
         self.code_verifier = code_verifier
+        self.response_cache = response_cache
+        self.cache_stats = {'hits': 0, 'misses': 0, 'collapsed': 0}
+        self._responses = {}  # Cache key -> (expiry, response, fetched at)
+        self._in_flight = {}  # Cache key -> _InFlightRequest
+        self._cache_lock = threading.Lock()
         # Set OAuth2Session properties
         self.scope = ('openid', 'email', 'offline_access')
         self.redirect_uri = SSO_BASE_URL + 'void/callback'
@@ -341,7 +362,48 @@ class Tesla(OAuth2Session):
 
         Return type: JsonDict or String
         """
+        return self.timed_api(name, path_vars, **kwargs)[0]
+
+    def timed_api(self, name, path_vars=None, **kwargs):
+        """ Performs API request like `api`, but also returns the time the
+        response was fetched, which is in the past for a cached response.
+
+        Return type: tuple of JsonDict or String and float
+        """
         path_vars = path_vars or {}
+        endpoint, uri = self.endpoint(name, path_vars)
+        # Fetch token if not authorized and API requires authorization
+        if endpoint['AUTH'] and not self.authorized:
+            self.fetch_token()
+        # Perform request using given keyword arguments as parameters
+        arg_name = 'params' if endpoint['TYPE'] == 'GET' else 'json'
+        serialize = endpoint.get('CONTENT') != 'HTML' and name != 'STATUS'
+
+        def send():
+            return self.request(endpoint['TYPE'], uri, serialize,
+                                withhold_token=not endpoint['AUTH'],
+                                **{arg_name: kwargs})
+
+        if endpoint['TYPE'] != 'GET':
+            try:
+                return send(), time.time()
+            finally:
+                # Commands change state, so drop responses about the same thing
+                if path_vars:
+                    self.invalidate_cache(path_vars)
+        ttl = endpoint.get('CACHE_TTL')
+        if not (self.response_cache and ttl):
+            return send(), time.time()
+        key = (name, tuple(sorted(path_vars.items())),
+               json.dumps(kwargs, sort_keys=True))
+        return self._cached_request(key, ttl, send)
+
+    def endpoint(self, name, path_vars):
+        """ Returns the endpoint for given name and its URI with path_vars
+        substituted. Raises ValueError.
+
+        Return type: tuple of dict and String
+        """
         # Load API endpoints once
         if not self.endpoints:
             try:
@@ -355,20 +417,63 @@ class Tesla(OAuth2Session):
             endpoint = self.endpoints[name]
         except KeyError:
             raise ValueError('Unknown endpoint name ' + name)
-        # Fetch token if not authorized and API requires authorization
-        if endpoint['AUTH'] and not self.authorized:
-            self.fetch_token()
         # Substitute path variables in URI
         try:
-            uri = endpoint['URI'].format(**path_vars)
+            return endpoint, endpoint['URI'].format(**path_vars)
         except KeyError as e:
             raise ValueError('%s requires path variable %s' % (name, e))
-        # Perform request using given keyword arguments as parameters
-        arg_name = 'params' if endpoint['TYPE'] == 'GET' else 'json'
-        serialize = endpoint.get('CONTENT') != 'HTML' and name != 'STATUS'
-        return self.request(endpoint['TYPE'], uri, serialize,
-                            withhold_token=not endpoint['AUTH'],
-                            **{arg_name: kwargs})
+
+    def _cached_request(self, key, ttl, send):
+        """ Returns the cached response for key if it hasn't expired, else
+        sends the request, unless an identical one is already in flight in
+        which case its response is waited for. Returns the response along with
+        the time it was fetched. """
+        with self._cache_lock:
+            entry = self._responses.get(key)
+            if entry and entry[0] > time.time():
+                self.cache_stats['hits'] += 1
+                return copy.deepcopy(entry[1]), entry[2]
+            in_flight = self._in_flight.get(key)
+            leader = in_flight is None
+            if leader:
+                self.cache_stats['misses'] += 1
+                in_flight = self._in_flight[key] = _InFlightRequest()
+            else:
+                self.cache_stats['collapsed'] += 1
+        if not leader:
+            in_flight.event.wait()
+            if in_flight.error is not None:
+                raise in_flight.error
+            return copy.deepcopy(in_flight.response), in_flight.fetched_at
+        try:
+            response = send()
+            # Callers may modify the response, so keep a copy of our own
+            in_flight.response = copy.deepcopy(response)
+            in_flight.fetched_at = time.time()
+            return response, in_flight.fetched_at
+        except Exception as e:
+            in_flight.error = e
+            raise
+        finally:
+            with self._cache_lock:
+                del self._in_flight[key]
+                if in_flight.error is None and not in_flight.stale:
+                    self._responses[key] = (in_flight.fetched_at + ttl,
+                                            in_flight.response,
+                                            in_flight.fetched_at)
+            in_flight.event.set()
+
+    def invalidate_cache(self, path_vars=None):
+        """ Drops cached responses for endpoints with any of the given path
+        variables, e.g. {'vehicle_id': ...}, or all of them if none given. """
+        items = set((path_vars or {}).items())
+        with self._cache_lock:
+            for key in list(self._responses):
+                if not items or items & set(key[1]):
+                    del self._responses[key]
+            for key, in_flight in self._in_flight.items():
+                if not items or items & set(key[1]):
+                    in_flight.stale = True
 
     def vehicle_list(self):
         """ Returns a list of `Vehicle` objects """
@@ -402,6 +507,8 @@ class Vehicle(JsonDict):
     """ Vehicle class with dictionary access and API request support """
 
     codes = None  # Vehicle option codes class variable
+    # Queued commands in the same slot replace each other
+    COMMAND_SLOTS = {'START_CHARGE': 'charge', 'STOP_CHARGE': 'charge'}
     COLS = ['speed', 'odometer', 'soc', 'elevation', 'est_heading', 'est_lat',
             'est_lng', 'power', 'shift_state', 'range', 'est_range', 'heading']
 
@@ -410,6 +517,16 @@ class Vehicle(JsonDict):
         self.tesla = tesla
         self.callback = None
         self.timestamp = time.time()
+        self.stream_timestamp = 0  # Time of last streaming telemetry update
+        self.online_window = 60  # Seconds to trust the vehicle is still online
+        self._online_at = 0  # Time the vehicle was last known to be online
+        self._wake_future = None
+        self._wake_lock = threading.Lock()
+        self._pending_commands = {}  # Command slot -> (name, kwargs)
+        self._commands_lock = threading.Lock()
+        self._wsapp = None
+        self._stream_thread = None
+        self._stream_stop = threading.Event()
 
     def _subscribe(self, wsapp):
         """ Authenticate and select streaming telemetry columns """
@@ -431,6 +548,7 @@ class Vehicle(JsonDict):
                 except (SyntaxError, ValueError):
                     pass
             logger.debug('Update %s', json.dumps(data))
+            self.stream_timestamp = self._online_at = time.time()
             if self.callback:
                 self.callback(data)
             # Update polled data with streaming telemetry data
@@ -438,6 +556,7 @@ class Vehicle(JsonDict):
             vehicle_state = self.setdefault('vehicle_state', JsonDict())
             charge_state = self.setdefault('charge_state', JsonDict())
             drive_state['timestamp'] = data['timestamp']
+            charge_state['timestamp'] = data['timestamp']
             drive_state['speed'] = data['speed']
             vehicle_state['odometer'] = data['odometer']
             charge_state['battery_level'] = data['soc']
@@ -467,12 +586,7 @@ class Vehicle(JsonDict):
         **kwargs: Optional arguments that `run_forever` takes.
         """
         self.callback = callback
-        websocket.enableTrace(logger.isEnabledFor(logging.DEBUG),
-                              handler=logging.NullHandler())
-        wsapp = websocket.WebSocketApp(STREAMING_BASE_URL + 'streaming/',
-                                       on_open=self._subscribe,
-                                       on_message=self._parse_msg,
-                                       on_error=self._ws_error)
+        wsapp = self._websocket_app()
         kwargs.setdefault('ping_interval', 10)
         while True:
             wsapp.run_forever(**kwargs)
@@ -483,26 +597,153 @@ class Vehicle(JsonDict):
             logger.debug('%d retries left', retry)
             retry -= 1
 
+    def _websocket_app(self):
+        """ Returns streaming API websocket app """
+        websocket.enableTrace(logger.isEnabledFor(logging.DEBUG),
+                              handler=logging.NullHandler())
+        return websocket.WebSocketApp(STREAMING_BASE_URL + 'streaming/',
+                                      on_open=self._subscribe,
+                                      on_message=self._parse_msg,
+                                      on_error=self._ws_error)
+
+    def start_stream(self, callback=None, interval=1, backoff=2,
+                     max_interval=300, **kwargs):
+        """ Keep the vehicle dict current with streaming telemetry from a
+        background thread. The stream is reconnected whenever it drops, which
+        it does after 10 seconds without data, e.g. when the vehicle is asleep.
+        Reconnects are delayed by `interval` seconds, growing by `backoff` up
+        to `max_interval` while no data is received.
+
+        callback: (optional) Function with one argument, a dict of pushed data.
+        **kwargs: Optional arguments that `run_forever` takes.
+        """
+        if self.streaming:
+            return
+        self.callback = callback
+        self._stream_stop.clear()
+        kwargs.setdefault('ping_interval', 10)
+        self._stream_thread = threading.Thread(
+            target=self._stream_forever, args=(interval, backoff, max_interval),
+            kwargs=kwargs, name='stream-%s' % self['vehicle_id'])
+        self._stream_thread.daemon = True
+        self._stream_thread.start()
+
+    def _stream_forever(self, interval, backoff, max_interval, **kwargs):
+        """ Run streaming connections until stopped, with reconnect backoff """
+        delay = interval
+        while not self._stream_stop.is_set():
+            # Streaming authenticates with the access token, so keep it valid
+            expires_at = self.tesla.expires_at
+            if expires_at and expires_at < time.time() + 60:
+                try:
+                    self.tesla.refresh_token()
+                except (ValueError, RequestException) as e:
+                    logger.error('Token refresh failed: %s', e)
+            last_update = self.stream_timestamp
+            self._wsapp = self._websocket_app()
+            try:
+                self._wsapp.run_forever(**kwargs)
+            except Exception as e:  # Keep the thread alive on any failure
+                logger.error('Streaming failed: %s', e)
+            # Back off while the stream yields nothing, reset once it does
+            if self.stream_timestamp > last_update:
+                delay = interval
+            logger.debug('Reconnecting stream in %s seconds', delay)
+            self._stream_stop.wait(delay)
+            delay = min(delay * backoff, max_interval)
+        self._wsapp = None
+
+    def stop_stream(self, timeout=None):
+        """ Stop background streaming started by `start_stream` """
+        self._stream_stop.set()
+        wsapp = self._wsapp
+        if wsapp:
+            wsapp.close()
+        if self._stream_thread:
+            self._stream_thread.join(timeout)
+            self._stream_thread = None
+
+    @property
+    def streaming(self):
+        """ Returns True if background streaming is running """
+        return bool(self._stream_thread and self._stream_thread.is_alive())
+
+    def stream_age(self):
+        """ Returns seconds since the last streaming telemetry update """
+        return time.time() - self.stream_timestamp
+
     def api(self, name, **kwargs):
         """ Endpoint request with vehicle_id path variable """
         return self.tesla.api(name, {'vehicle_id': self['id_s']}, **kwargs)
 
+    def timed_api(self, name, **kwargs):
+        """ Endpoint request with vehicle_id path variable, returning the
+        response and the time it was fetched """
+        return self.tesla.timed_api(name, {'vehicle_id': self['id_s']},
+                                    **kwargs)
+
     def get_vehicle_summary(self):
         """ Determine the state of the vehicle's various sub-systems """
-        self.update(self.api('VEHICLE_SUMMARY')['response'])
-        self.timestamp = time.time()
+        response, fetched_at = self.timed_api('VEHICLE_SUMMARY')
+        self.update(response['response'])
+        self.timestamp = fetched_at
         return self
 
     def available(self, max_age=60):
         """ Determine vehicle availability based on the cached data or the
         refreshed status when aged out. """
         if self.timestamp + max_age < time.time():
+            if not max_age:  # Current state requested, bypass response cache
+                self.tesla.invalidate_cache({'vehicle_id': self['id_s']})
             self.get_vehicle_summary()
-        return self['state'] == 'online'
+        if self['state'] == 'online':
+            self._online_at = max(self._online_at, self.timestamp)
+            return True
+        return False
+
+    @property
+    def known_online(self):
+        """ Returns True if the vehicle was seen online, responded to a command
+        or streamed data within the last `online_window` seconds """
+        return self._online_at + self.online_window > time.time()
 
     def sync_wake_up(self, timeout=60, interval=2, backoff=1.15):
         """ Wakes up vehicle if needed and waits for it to come online. Raises
         VehicleError if not woken up within timeout. """
+        self.wake_up(timeout, interval, backoff).result()
+
+    def wake_up(self, timeout=60, interval=2, backoff=1.15):
+        """ Wakes up vehicle if needed without blocking. Returns a `Future`
+        that resolves to True once the vehicle is online, or raises
+        VehicleError if not woken up within timeout. Callers share the wake up
+        already in progress, if any, and a vehicle known to be online resolves
+        immediately. """
+        with self._wake_lock:
+            if self._wake_future and not self._wake_future.done():
+                return self._wake_future
+            future = Future()
+            if self.known_online:
+                future.set_result(True)
+                return future
+            self._wake_future = future
+        thread = threading.Thread(target=self._wake_up,
+                                  args=(future, timeout, interval, backoff),
+                                  name='wake-%s' % self['vehicle_id'])
+        thread.daemon = True
+        thread.start()
+        return future
+
+    def _wake_up(self, future, timeout, interval, backoff):
+        """ Wake up loop run by `wake_up`, resolving future with the outcome """
+        try:
+            self._wake_up_blocking(timeout, interval, backoff)
+        except Exception as e:  # Hand any failure to the waiting callers
+            future.set_exception(e)
+        else:
+            future.set_result(True)
+
+    def _wake_up_blocking(self, timeout, interval, backoff):
+        """ Polls the vehicle state until online or timed out """
         logger.info('%s is %s', self['display_name'], self['state'])
         if not self.available():
             self.api('WAKE_UP')  # Send wake up command
@@ -542,16 +783,18 @@ class Vehicle(JsonDict):
     def get_vehicle_data(self):
         """ A rollup of all the data request endpoints plus vehicle config.
         Raises HTTPError when vehicle is not online. """
-        self.update(self.api('VEHICLE_DATA')['response'])
-        self.timestamp = time.time()
+        response, fetched_at = self.timed_api('VEHICLE_DATA')
+        self.update(response['response'])
+        self.timestamp = fetched_at
         return self
 
     def get_latest_vehicle_data(self):
         """ Cached data, pushed by the vehicle on sleep, wake and around OTA.
         Raises HTTPError if no data is available and vehicle is not online. """
-        response = self.api('CACHED_PROTO_VEHICLE_DATA')['response']
+        response, fetched_at = self.timed_api('CACHED_PROTO_VEHICLE_DATA')
+        response = response['response']
         self.update(response['data'] if 'data' in response else response)
-        self.timestamp = time.time()
+        self.timestamp = fetched_at
         return self
 
     def get_nearby_charging_sites(self):
@@ -712,8 +955,103 @@ class Vehicle(JsonDict):
             raise VehicleError(name + " doesn't seem to be a command")
         if not response['result']:
             raise VehicleError(response['reason'])
+        self._online_at = time.time()  # Only an awake vehicle accepts commands
         return response['result']
 
+    def queue_command(self, name, **kwargs):
+        """ Adds a command to send with the next `send_commands`, replacing a
+        pending one with the same name (or opposite effect, like STOP_CHARGE
+        replaces START_CHARGE). Pending commands are sent in order queued, a
+        replacement counting as queued last. """
+        slot = self.COMMAND_SLOTS.get(name, name)
+        with self._commands_lock:
+            self._pending_commands.pop(slot, None)  # Move it to the end
+            self._pending_commands[slot] = (name, kwargs)
+
+    def _in_charge_state(self, name, kwargs):
+        """ Returns True if the cached charge_state shows that the command
+        would have no effect """
+        charge_state = self.get('charge_state') or {}
+        charging = charge_state.get('charging_state') == 'Charging'
+        if name == 'CHARGING_AMPS':
+            amps = charge_state.get('charge_current_request')
+            return amps is not None and kwargs.get('charging_amps') == amps
+        if name == 'CHANGE_CHARGE_LIMIT':
+            limit = charge_state.get('charge_limit_soc')
+            return limit is not None and kwargs.get('percent') == limit
+        if name == 'START_CHARGE':
+            return charging
+        if name == 'STOP_CHARGE':
+            return 'charging_state' in charge_state and not charging
+        return False
+
+    def _update_charge_state(self, name, kwargs):
+        """ Reflects a successful command in the cached charge_state """
+        charge_state = self.setdefault('charge_state', JsonDict())
+        if name == 'CHARGING_AMPS':
+            charge_state['charge_current_request'] = kwargs['charging_amps']
+        elif name == 'CHANGE_CHARGE_LIMIT':
+            charge_state['charge_limit_soc'] = kwargs['percent']
+        elif name == 'START_CHARGE':
+            charge_state['charging_state'] = 'Charging'
+        elif name == 'STOP_CHARGE':
+            charge_state['charging_state'] = 'Stopped'
+
+    def _drop_commands_in_effect(self):
+        """ Drops queued commands that would have no effect, and returns
+        whether any are left """
+        with self._commands_lock:
+            for slot, (name, kwargs) in list(self._pending_commands.items()):
+                if self._in_charge_state(name, kwargs):
+                    logger.debug('Skipping %s, already in effect', name)
+                    del self._pending_commands[slot]
+            return bool(self._pending_commands)
+
+    def _take_commands(self):
+        """ Empties the queue, returning the commands that were in it """
+        with self._commands_lock:
+            commands = list(self._pending_commands.values())
+            self._pending_commands.clear()
+        return commands
+
+    def send_commands(self):
+        """ Sends queued commands without blocking, waking up the vehicle only
+        if any of them would change its charge_state. Commands queued while it
+        wakes up are sent in the same go. Returns a `Future` that resolves to
+        the list of command names sent, or raises the error of the first
+        command to fail, dropping the ones after it. If the vehicle can't be
+        woken up, the queued commands are dropped and the error is raised. """
+        future = Future()
+        if not self._drop_commands_in_effect():
+            future.set_result([])
+            return future
+
+        def send(wake):
+            sent = []
+            try:
+                commands = self._take_commands()
+                wake.result()
+                for name, kwargs in commands:
+                    if self._in_charge_state(name, kwargs):
+                        continue
+                    self.command(name, **kwargs)
+                    self._update_charge_state(name, kwargs)
+                    sent.append(name)
+            except Exception as e:  # Hand any failure to the waiting callers
+                future.set_exception(e)
+            else:
+                future.set_result(sent)
+
+        def dispatch(wake):
+            # The wake up may already be done, so never send on caller's thread
+            thread = threading.Thread(target=send, args=(wake,),
+                                      name='commands-%s' % self['vehicle_id'])
+            thread.daemon = True
+            thread.start()
+
+        self.wake_up().add_done_callback(dispatch)
+        return future
+
 
 class ProductError(Exception):
     """ Product exception class """
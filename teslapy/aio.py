@@ -0,0 +1,467 @@
+""" Asyncio variants of the `Tesla`, `Vehicle` and `Product` classes, which
+send Owner API requests with aiohttp over a pool of keep-alive connections.
+This lets a single event loop talk to the Tesla API and to other devices (e.g.
+poll an inverter with `givenergy_modbus.async_client`) concurrently.
+
+SSO authorization, the token cache and the `endpoints.json` routing are shared
+with a regular `Tesla` session, which is used for the OAuth flows only.
+"""
+
+import time
+import json
+import asyncio
+import logging
+try:
+    from urlparse import urljoin
+except ImportError:
+    from urllib.parse import urljoin
+import aiohttp
+
+from . import (BASE_URL, Tesla, JsonDict, Vehicle, VehicleError, Product,
+               ProductError, Battery, SolarPanel)
+
+# Setup module logging
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+class AsyncTesla(object):
+    """ Implements an asyncio session manager for the Tesla Motors Owner API
+
+    email: SSO identity.
+    retry: (optional) Number of connection retries.
+    timeout: (optional) Total request timeout.
+    pool_size: (optional) Maximum number of simultaneous connections.
+    keepalive_timeout: (optional) Seconds to keep idle connections open for
+                       reuse by later requests.
+
+    Extra keyword arguments to pass to the `Tesla` constructor using `kwargs`,
+    e.g. `verify`, `proxy`, `cache_file` or `authenticator`.
+    """
+
+    def __init__(self, email, retry=0, timeout=10, pool_size=10,
+                 keepalive_timeout=60, **kwargs):
+        self.tesla = Tesla(email, retry=retry, timeout=timeout, **kwargs)
+        self.retry = retry
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self._session = None
+        self._token_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @property
+    def access_token(self):
+        """ Returns the current access token, for streaming """
+        return self.tesla.access_token
+
+    @property
+    def expires_at(self):
+        """ Returns unix time when token needs refreshing """
+        return self.tesla.expires_at
+
+    def refresh_token(self, **kwargs):
+        """ Refreshes the SSO token, blocking the caller. See `Tesla`. """
+        return self.tesla.refresh_token(**kwargs)
+
+    @property
+    def session(self):
+        """ Returns the aiohttp session, created on first use """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size, keepalive_timeout=self.keepalive_timeout,
+                ssl=None if self.tesla.verify else False)
+            headers = {k: v for k, v in self.tesla.headers.items()
+                       if k in ('User-Agent', 'X-Tesla-User-Agent')}
+            self._session = aiohttp.ClientSession(
+                connector=connector, headers=headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def close(self):
+        """ Closes pooled connections and the underlying `Tesla` session """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self.tesla.close()
+
+    async def _access_token(self):
+        """ Returns an access token, fetching or refreshing it as needed. The
+        token requests are blocking, so they are run in an executor. """
+        loop = asyncio.get_running_loop()
+        async with self._token_lock:
+            if not self.tesla.authorized:
+                await loop.run_in_executor(None, self.tesla.fetch_token)
+            elif self.expires_at and self.expires_at < time.time() + 60:
+                await loop.run_in_executor(None, self.tesla.refresh_token)
+        return self.tesla.access_token
+
+    async def request(self, method, url, serialize=True, withhold_token=False,
+                      **kwargs):
+        """ Sends request to the Owner API. Raises ClientResponseError when an
+        error occurs.
+
+        method: HTTP method to use.
+        url: URL relative to the Owner API base URL.
+        serialize (optional): deserialize response body.
+        withhold_token (optional): perform unauthenticated request.
+
+        Extra keyword arguments to pass to aiohttp using `kwargs`:
+        params (optional): URL parameters to append to the URL.
+        json (optional): json for the body to attach to the request.
+
+        Return type: JsonDict or String
+        """
+        url = urljoin(BASE_URL, url)
+        headers = {}
+        if not withhold_token:
+            headers['Authorization'] = 'Bearer ' + await self._access_token()
+        proxy = self.tesla.proxies.get('https')
+        # Retry connection errors like the `Tesla` session's HTTPAdapter does
+        for retries_left in range(self.retry, -1, -1):
+            try:
+                async with self.session.request(method, url, headers=headers,
+                                                proxy=proxy,
+                                                **kwargs) as response:
+                    text = await response.text()
+                break
+            except aiohttp.ClientConnectionError as e:
+                if not retries_left:
+                    raise
+                logger.debug('%s, %d retries left', e, retries_left)
+        # Error message handling
+        if 400 <= response.status < 600:
+            reason = response.reason
+            if serialize:
+                try:
+                    lst = [str(v).strip('.') for v in json.loads(text).values()
+                           if v]
+                    reason = '. '.join(lst)
+                except (ValueError, AttributeError):
+                    pass
+            raise aiohttp.ClientResponseError(
+                response.request_info, response.history,
+                status=response.status, message=reason,
+                headers=response.headers)
+        # Deserialize response
+        if serialize:
+            return json.loads(text, object_hook=JsonDict)
+        return text
+
+    async def api(self, name, path_vars=None, **kwargs):
+        """ Convenience method to perform API request for given endpoint name,
+        with keyword arguments as parameters. Substitutes path variables in URI
+        using path_vars. Raises ValueError.
+
+        Return type: JsonDict or String
+        """
+        endpoint, uri = self.tesla.endpoint(name, path_vars or {})
+        arg_name = 'params' if endpoint['TYPE'] == 'GET' else 'json'
+        serialize = endpoint.get('CONTENT') != 'HTML' and name != 'STATUS'
+        if arg_name == 'params':  # Unlike requests, aiohttp rejects None
+            kwargs = {k: v for k, v in kwargs.items() if v is not None}
+        return await self.request(endpoint['TYPE'], uri, serialize,
+                                  withhold_token=not endpoint['AUTH'],
+                                  **{arg_name: kwargs})
+
+    async def timed_api(self, name, path_vars=None, **kwargs):
+        """ Performs API request like `api`, but also returns the time the
+        response was fetched. Responses aren't cached, so that's always now.
+
+        Return type: tuple of JsonDict or String and float
+        """
+        response = await self.api(name, path_vars, **kwargs)
+        return response, time.time()
+
+    async def vehicle_list(self):
+        """ Returns a list of `AsyncVehicle` objects """
+        response = await self.api('VEHICLE_LIST')
+        return [AsyncVehicle(v, self) for v in response['response']]
+
+    async def battery_list(self):
+        """ Returns a list of `AsyncBattery` objects """
+        response = await self.api('PRODUCT_LIST')
+        return [AsyncBattery(p, self) for p in response['response']
+                if p.get('resource_type') == 'battery']
+
+    async def solar_list(self):
+        """ Returns a list of `AsyncSolarPanel` objects """
+        response = await self.api('PRODUCT_LIST')
+        return [AsyncSolarPanel(p, self) for p in response['response']
+                if p.get('resource_type') == 'solar']
+
+
+class AsyncVehicle(Vehicle):
+    """ Vehicle class with dictionary access and asyncio API request support.
+    Methods that make requests are coroutines, the others (and streaming,
+    which runs in its own thread) behave as in `Vehicle`. """
+
+    def __init__(self, vehicle, tesla):
+        super(AsyncVehicle, self).__init__(vehicle, tesla)
+        self._wake_task = None
+
+    def __missing__(self, key):
+        """ Cached data can't be fetched on access, so raises KeyError. Await
+        `get_latest_vehicle_data` first. """
+        raise KeyError(key)
+
+    async def api(self, name, **kwargs):
+        """ Endpoint request with vehicle_id path variable """
+        return await self.tesla.api(name, {'vehicle_id': self['id_s']},
+                                    **kwargs)
+
+    async def timed_api(self, name, **kwargs):
+        """ Endpoint request with vehicle_id path variable, returning the
+        response and the time it was fetched """
+        return await self.tesla.timed_api(name, {'vehicle_id': self['id_s']},
+                                          **kwargs)
+
+    async def get_vehicle_summary(self):
+        """ Determine the state of the vehicle's various sub-systems """
+        response, fetched_at = await self.timed_api('VEHICLE_SUMMARY')
+        self.update(response['response'])
+        self.timestamp = fetched_at
+        return self
+
+    async def available(self, max_age=60):
+        """ Determine vehicle availability based on the cached data or the
+        refreshed status when aged out. """
+        if self.timestamp + max_age < time.time():
+            await self.get_vehicle_summary()
+        if self['state'] == 'online':
+            self._online_at = max(self._online_at, self.timestamp)
+            return True
+        return False
+
+    async def sync_wake_up(self, timeout=60, interval=2, backoff=1.15):
+        """ Wakes up vehicle if needed and waits for it to come online. Raises
+        VehicleError if not woken up within timeout. """
+        await self.wake_up(timeout, interval, backoff)
+
+    def wake_up(self, timeout=60, interval=2, backoff=1.15):
+        """ Wakes up vehicle if needed. Returns an awaitable that resolves to
+        True once the vehicle is online, or raises VehicleError if not woken
+        up within timeout. Callers share the wake up already in progress. """
+        if self._wake_task is None or self._wake_task.done():
+            self._wake_task = asyncio.ensure_future(
+                self._wake_up(timeout, interval, backoff))
+        return asyncio.shield(self._wake_task)
+
+    async def _wake_up(self, timeout, interval, backoff):
+        """ Polls the vehicle state until online or timed out """
+        if self.known_online:
+            return True
+        logger.info('%s is %s', self['display_name'], self['state'])
+        if not await self.available():
+            await self.api('WAKE_UP')  # Send wake up command
+            start_time = time.time()
+            while True:
+                logger.debug('Waiting for %d seconds', interval)
+                await asyncio.sleep(int(interval))
+                if await self.available(0):
+                    break
+                # Raise exception when task has timed out
+                if start_time + timeout - interval < time.time():
+                    raise VehicleError('%s not woken up within %s seconds'
+                                       % (self['display_name'], timeout))
+                interval *= backoff
+            logger.info('%s is %s', self['display_name'], self['state'])
+        return True
+
+    def _wake_up_blocking(self, timeout, interval, backoff):
+        """ Blocking wake up loop of `Vehicle`, which would stall the event
+        loop. Raises TypeError, await `wake_up` instead. """
+        raise TypeError('AsyncVehicle can only be woken up with `wake_up`')
+
+    async def get_vehicle_data(self):
+        """ A rollup of all the data request endpoints plus vehicle config.
+        Raises ClientResponseError when vehicle is not online. """
+        response, fetched_at = await self.timed_api('VEHICLE_DATA')
+        self.update(response['response'])
+        self.timestamp = fetched_at
+        return self
+
+    async def get_latest_vehicle_data(self):
+        """ Cached data, pushed by the vehicle on sleep, wake and around OTA.
+        Raises ClientResponseError if no data is available and vehicle is not
+        online. """
+        response, fetched_at = await self.timed_api('CACHED_PROTO_VEHICLE_DATA')
+        response = response['response']
+        self.update(response['data'] if 'data' in response else response)
+        self.timestamp = fetched_at
+        return self
+
+    async def get_nearby_charging_sites(self):
+        """ Lists nearby Tesla-operated charging stations """
+        return (await self.api('NEARBY_CHARGING_SITES'))['response']
+
+    async def get_service_scheduling_data(self):
+        """ Retrieves next service appointment for this vehicle """
+        response = await self.api('GET_UPCOMING_SERVICE_VISIT_DATA')
+        return next((enabled for enabled
+                     in response['response']['enabled_vins']
+                     if enabled['vin'] == self['vin']), {})
+
+    async def get_charge_history(self):
+        """ Lists vehicle charging history data points """
+        return (await self.api('VEHICLE_CHARGE_HISTORY'))['response']
+
+    async def get_user(self, device_country='US', device_language='EN'):
+        """ Retrieve user account data """
+        return (await self.tesla.api('USER', vin=self['vin'],
+                                     deviceCountry=device_country,
+                                     deviceLanguage=device_language))['data']
+
+    async def get_user_details(self, device_country='US', device_language='EN'):
+        """ Retrieve user account details """
+        return (await self.tesla.api('USER_ACCOUNT_GET_DETAILS',
+                                     vin=self['vin'],
+                                     deviceCountry=device_country,
+                                     deviceLanguage=device_language))['data']
+
+    async def mobile_enabled(self):
+        """ Checks if the Mobile Access setting is enabled in the car """
+        uri = 'api/1/vehicles/%s/mobile_enabled' % self['id_s']
+        return (await self.tesla.request('GET', uri))['response']
+
+    async def compose_image(self, view='STUD_3QTR', size=640, options=None):
+        """ Returns a PNG formatted composed vehicle image. See `Vehicle`. """
+        if options is None:
+            logger.warning('`compose_image` requires `options` to be set for '
+                           'an accurate image')
+        # Derive model from VIN and other properties from (given) option codes
+        params = {'model': 'm' + self['vin'][3].lower(),
+                  'bkba_opt': 1, 'view': view, 'size': size,
+                  'options': options or self['option_codes']}
+        # Retrieve image from compositor
+        url = 'https://static-assets.tesla.com/v1/compositor/'
+        proxy = self.tesla.tesla.proxies.get('https')
+        async with self.tesla.session.get(url, params=params,
+                                          proxy=proxy) as response:
+            response.raise_for_status()  # Raise ClientResponseError, if any
+            return await response.read()
+
+    async def command(self, name, **kwargs):
+        """ Wrapper method for vehicle command response error handling. Raises
+        VehicleError or ClientResponseError. """
+        response = (await self.api(name, **kwargs)).get('response')
+        if not response or 'result' not in response:
+            raise VehicleError(name + " doesn't seem to be a command")
+        if not response['result']:
+            raise VehicleError(response['reason'])
+        self._online_at = time.time()  # Only an awake vehicle accepts commands
+        return response['result']
+
+    async def send_commands(self):
+        """ Sends queued commands, waking up the vehicle only if any of them
+        would change its charge_state. Commands queued while it wakes up are
+        sent in the same go. Returns the list of command names sent, or raises
+        the error of the first command to fail, dropping the ones after it. If
+        the vehicle can't be woken up, the queued commands are dropped and the
+        error is raised. """
+        if not self._drop_commands_in_effect():
+            return []
+        try:
+            await self.wake_up()
+        finally:
+            commands = self._take_commands()
+        sent = []
+        for name, kwargs in commands:
+            if self._in_charge_state(name, kwargs):
+                continue
+            await self.command(name, **kwargs)
+            self._update_charge_state(name, kwargs)
+            sent.append(name)
+        return sent
+
+
+class AsyncProduct(Product):
+    """ Base product class with dictionary access and asyncio API request
+    support """
+
+    async def api(self, name, **kwargs):
+        """ Endpoint request with battery_id or site_id path variable """
+        pathvars = {'battery_id': self['id'], 'site_id': self['energy_site_id']}
+        return await self.tesla.api(name, pathvars, **kwargs)
+
+    async def get_calendar_history_data(
+            self, kind='energy', period='day', start_date=None,
+            end_date=time.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            installation_timezone=None, timezone=None, tariff=None):
+        """ Retrieve live status of product. See `Product`. """
+        return (await self.api('CALENDAR_HISTORY_DATA', kind=kind,
+                               period=period, start_date=start_date,
+                               end_date=end_date,
+                               installation_timezone=installation_timezone,
+                               timezone=timezone, tariff=tariff))['response']
+
+    async def get_history_data(
+            self, kind='energy', period='day', start_date=None,
+            end_date=time.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            installation_timezone=None, timezone=None):
+        """ Retrieve live status of product. See `Product`. """
+        return (await self.api('HISTORY_DATA', kind=kind, period=period,
+                               start_date=start_date, end_date=end_date,
+                               installation_timezone=installation_timezone,
+                               timezone=timezone))['response']
+
+    async def command(self, name, **kwargs):
+        """ Wrapper method for product command response error handling """
+        response = (await self.api(name, **kwargs))['response']
+        if response['code'] == 201:
+            return response.get('message')
+        raise ProductError(response.get('message'))
+
+
+class AsyncBattery(AsyncProduct, Battery):
+    """ Powerwall class with asyncio API request support """
+
+    async def get_battery_data(self):
+        """ Retrieve detailed state and configuration of the battery """
+        self.update((await self.api('BATTERY_DATA'))['response'])
+        return self
+
+    async def set_operation(self, mode):
+        """ Set battery operation to self_consumption, backup or autonomous """
+        return await self.command('BATTERY_OPERATION_MODE',
+                                  default_real_mode=mode)
+
+    async def set_backup_reserve_percent(self, percent):
+        """ Set the minimum backup reserve percent for that battery """
+        return await self.command('BACKUP_RESERVE',
+                                  backup_reserve_percent=int(percent))
+
+    async def set_import_export(
+            self, allow_grid_charging=None, allow_battery_export=None):
+        """ Sets the battery grid import and export settings. See `Battery`. """
+        params = {}
+        if allow_grid_charging is not None:
+            val = not allow_grid_charging
+            params['disallow_charge_from_grid_with_solar_installed'] = val
+        if allow_battery_export is not None:
+            val = 'battery_ok' if allow_battery_export else 'pv_only'
+            params['customer_preferred_export_rule'] = val
+        await self.api('ENERGY_SITE_IMPORT_EXPORT_CONFIG', **params)
+
+    async def get_tariff(self):
+        """ Get the tariff rate data """
+        return (await self.api('SITE_TARIFF'))['response']
+
+    async def set_tariff(self, tariff_data):
+        """ Set the tariff rate data. See `Battery`. """
+        return await self.command('TIME_OF_USE_SETTINGS',
+                                  tou_settings={"tariff_content": tariff_data})
+
+
+class AsyncSolarPanel(AsyncProduct, SolarPanel):
+    """ Solar panel class with asyncio API request support """
+
+    async def get_site_data(self):
+        """ Retrieve current site generation data """
+        self.update((await self.api('SITE_DATA'))['response'])
+        return self
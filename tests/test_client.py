@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from givenergy_modbus.client import GivEnergyClientCore
+from givenergy_modbus.metrics import ClientMetrics
+from givenergy_modbus.model.plant import Plant
+from givenergy_modbus.model.register import HoldingRegister, InputRegister  # type: ignore
+from givenergy_modbus.pdu import ReadRegistersRequest, WriteHoldingRegisterRequest, WriteHoldingRegisterResponse
+from givenergy_modbus.protocol import Execute, Pipeline, run
+
+
+class FakeClient(GivEnergyClientCore):
+    """Drives the client's steps against a data adapter that acknowledges writes but never answers reads."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.metrics = ClientMetrics()
+        self.requests = []
+
+    def write_holding_registers(self, values):
+        return run(self._write_holding_registers(values), self.perform)
+
+    def perform(self, operation):
+        if isinstance(operation, Pipeline):
+            self.requests.extend(operation.requests)
+            return [None] * len(operation.requests)
+        if not isinstance(operation, Execute):
+            return None
+        request = operation.request
+        self.requests.append(request)
+        if isinstance(request, WriteHoldingRegisterRequest):
+            return WriteHoldingRegisterResponse(register=request.register, value=request.value, slave_address=0x32)
+        return None
+
+
+def test_write_elided_when_cached_value_is_fresh():
+    plant = Plant(number_batteries=0)
+    plant.inverter_rc.set_registers(HoldingRegister, {HoldingRegister.ENABLE_DISCHARGE.value: 0})
+    client = FakeClient(plant=plant, max_cache_age=60)
+
+    client.disable_discharge()
+
+    assert client.requests == []
+
+
+def test_write_sent_when_stale_register_cannot_be_reread():
+    plant = Plant(number_batteries=0)
+    plant.inverter_rc.set_registers(HoldingRegister, {HoldingRegister.ENABLE_DISCHARGE.value: 0})
+    client = FakeClient(plant=plant, max_cache_age=0)
+
+    client.disable_discharge()
+
+    assert any(isinstance(r, ReadRegistersRequest) for r in client.requests)
+    writes = [r for r in client.requests if isinstance(r, WriteHoldingRegisterRequest)]
+    assert [(w.register, w.value) for w in writes] == [(HoldingRegister.ENABLE_DISCHARGE.value, 0)]
+
+
+def test_write_sent_when_register_was_never_read():
+    client = FakeClient(plant=Plant(number_batteries=0))
+
+    client.disable_discharge()
+
+    writes = [r for r in client.requests if isinstance(r, WriteHoldingRegisterRequest)]
+    assert [(w.register, w.value) for w in writes] == [(HoldingRegister.ENABLE_DISCHARGE.value, 0)]
+
+
+def test_battery_refresh_interval_counts_refreshes_without_battery_attributes():
+    plant = Plant(number_batteries=1)
+    plant.batteries_rcs[0].set_registers(InputRegister, {60: 0})
+    client = FakeClient(battery_refresh_interval=2)
+
+    def battery_pages_read(attributes):
+        client.requests = []
+        run(client._refresh_plant_attributes(plant, attributes, 0), client.perform)
+        return any(isinstance(r, ReadRegistersRequest) and r.base_register == 60 for r in client.requests)
+
+    assert battery_pages_read(['battery_soc'])
+    assert not battery_pages_read(['p_pv1']) and battery_pages_read(['battery_soc'])
+    assert not battery_pages_read(['battery_soc'])
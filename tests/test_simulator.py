@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from givenergy_modbus.decoder import GivEnergyRequestDecoder
+from givenergy_modbus.framer import GivEnergyModbusFramer
+from givenergy_modbus.pdu import ReadHoldingRegistersRequest
+from givenergy_modbus.simulator import InverterSimulator, SimulatedDevice
+
+
+class FakeWriter:
+    def __init__(self):
+        self.data = b''
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+
+def test_answering_does_not_warn_about_response_checksums(caplog):
+    simulator = InverterSimulator({0x32: SimulatedDevice(holding_registers={i: i for i in range(60)})})
+    writer = FakeWriter()
+    request = ReadHoldingRegistersRequest(base_register=0, register_count=60, slave_address=0x32)
+
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(simulator._answer(request, writer, GivEnergyModbusFramer(GivEnergyRequestDecoder()), asyncio.Lock()))
+
+    assert writer.data
+    assert simulator.stats['responses'] == 1
+    assert not [r for r in caplog.records if r.levelno >= logging.WARNING]